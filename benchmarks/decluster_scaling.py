@@ -0,0 +1,77 @@
+"""
+Scaling benchmark of the declustering methods: each method runs on seeded synthetic catalogs of doubling size, and
+the growth exponent between consecutive sizes (log2 of the time ratio: 1 is linear, 2 is quadratic) is checked.
+
+Usage, from the top of the repository:
+    python -m benchmarks.decluster_scaling
+    python -m benchmarks.decluster_scaling --sizes 1e5 2e5 4e5 --methods nearest_neighbor_capped --max-exponent 1.3
+"""
+
+import io
+import sys
+import time
+import argparse
+import contextlib
+import numpy as np
+from eq_catalogs import declustering, synthetic
+
+METHODS = {
+    'gardner_knopoff': declustering.gardner_knopoff,
+    'reasenberg': declustering.reasenberg,
+    'nearest_neighbor': declustering.nearest_neighbor,
+    'nearest_neighbor_capped': lambda MyCat: declustering.nearest_neighbor(MyCat, max_candidates=16),
+}
+DEFAULT_METHODS = ['gardner_knopoff', 'reasenberg', 'nearest_neighbor_capped']
+
+
+def time_method(method, sizes, seed=0):
+    """
+    :param method: name of a method in METHODS
+    :param sizes: increasing catalog sizes
+    :param seed: seed of the synthetic catalogs
+    :returns: wall time of the method at each size, in seconds
+    """
+    seconds = []
+    for n_events in sizes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            MyCat = synthetic.make_synthetic_catalog(n_events, seed=seed)
+            start = time.perf_counter()
+            METHODS[method](MyCat)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def growth_exponents(sizes, seconds):
+    """Exponent p of seconds ~ size^p between each pair of consecutive sizes."""
+    return [np.log(t1 / t0) / np.log(n1 / n0) for n0, n1, t0, t1 in zip(sizes, sizes[1:], seconds, seconds[1:])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[5e4, 1e5, 2e5, 4e5],
+                        help='increasing catalog sizes (number of events)')
+    parser.add_argument('--methods', nargs='+', default=DEFAULT_METHODS, choices=sorted(METHODS),
+                        help='declustering methods to time')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic catalogs')
+    parser.add_argument('--max-exponent', type=float, default=1.5,
+                        help='fail if the time grows faster than size^max_exponent between the two largest sizes')
+    args = parser.parse_args(argv)
+
+    sizes = [int(n) for n in args.sizes]
+    failures = []
+    for method in args.methods:
+        seconds = time_method(method, sizes, args.seed)
+        exponents = growth_exponents(sizes, seconds)
+        for n, (n_events, t) in enumerate(zip(sizes, seconds)):
+            growth = ("  x%.2f  (size^%.2f)" % (t / seconds[n - 1], exponents[n - 1])) if n > 0 else ''
+            print("%-24s %10d  %9.2f s%s" % (method, n_events, t, growth))
+        if exponents and exponents[-1] > args.max_exponent:
+            failures.append("%s grows as size^%.2f between %d and %d events (limit %.2f)" %
+                            (method, exponents[-1], sizes[-2], sizes[-1], args.max_exponent))
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
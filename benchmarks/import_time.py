@@ -0,0 +1,70 @@
+"""
+Import-time benchmark: how long importing eq_catalogs modules takes in a fresh interpreter, on top of numpy
+(which every module needs), and whether any heavy optional dependency gets loaded along the way.
+
+Usage, from the top of the repository:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules eq_catalogs eq_catalogs.file_io --max-ms 100
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+DEFAULT_MODULES = ['eq_catalogs', 'eq_catalogs.eqcat_object', 'eq_catalogs.file_io', 'eq_catalogs.catalog_functions',
+                   'eq_catalogs.plotting', 'eq_catalogs.pygmt_plots']
+HEAVY_MODULES = ['pandas', 'matplotlib', 'pygmt', 'scipy']
+
+_PROBE = """
+import sys, time, json
+import numpy
+start = time.perf_counter()
+import {module}
+{touch}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeat=5, touch=''):
+    """
+    :param module: dotted module name
+    :param repeat: number of fresh interpreters (the median time is kept)
+    :param touch: optional statement run after the import, inside the timing (e.g. 'eq_catalogs.Catalog')
+    :returns: median seconds, and the heavy modules that were loaded
+    """
+    times, heavy = [], set()
+    for _ in range(repeat):
+        probe = _PROBE.format(module=module, touch=touch, heavy=HEAVY_MODULES)
+        output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        heavy.update(result['heavy'])
+    return statistics.median(times), sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES, help='modules to import')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module')
+    parser.add_argument('--max-ms', type=float, default=100.0, help='fail if an import takes longer than this')
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module in args.modules:
+        touch = 'eq_catalogs.Catalog' if module == 'eq_catalogs' else ''
+        seconds, heavy = measure_import(module, args.repeat, touch)
+        print("%-32s %7.1f ms  %s" % (module, seconds * 1000, ('loads ' + ', '.join(heavy)) if heavy else ''))
+        if seconds * 1000 > args.max_ms:
+            failures.append("%s takes %.1f ms to import (limit %.0f ms)" % (module, seconds * 1000, args.max_ms))
+        if heavy:
+            failures.append("%s loads %s at import time" % (module, ', '.join(heavy)))
+    for failure in failures:
+        print("FAIL: " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
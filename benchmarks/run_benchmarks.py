@@ -0,0 +1,241 @@
+"""
+Benchmarks of the eq_catalogs readers, filters, rates, gridding, merging, and writers on seeded synthetic catalogs.
+Each benchmark is timed (best of --repeat runs) and run once more under tracemalloc for its peak memory.
+Every run is appended to a JSON history file (by default in the eq_catalogs cache directory, ~/.cache/eq_catalogs or
+$EQ_CATALOGS_CACHE, outside the source tree); --compare flags regressions against a stored baseline.
+
+Usage, from the top of the repository:
+    python -m benchmarks.run_benchmarks --sizes 10000 100000 1000000
+    python -m benchmarks.run_benchmarks --only input_qtm restrict_cat_box --sizes 10000000
+    python -m benchmarks.run_benchmarks --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+import collections
+import numpy as np
+from eq_catalogs import file_io, catalog_functions, synthetic
+
+DEFAULT_HISTORY = os.path.join(file_io.DEFAULT_CACHE_DIR, 'benchmark_history.json')
+BBOX = synthetic.DEFAULT_BBOX
+
+Benchmark = collections.namedtuple('Benchmark', ['name', 'setup', 'run', 'max_events'], defaults=[None])
+Benchmark.__doc__ = """
+name: name of the benchmark (the catalog function it times)
+setup: function(workspace) returning the arguments of run; not timed
+run: function(*arguments) that is timed
+max_events: skip this benchmark for larger catalogs (for the slow row-by-row readers), or None
+"""
+
+
+class Workspace:
+    """One synthetic catalog and its text renderings in a temporary directory, made lazily and shared."""
+    def __init__(self, n_events, seed, tmpdir):
+        self.n_events, self.seed, self.tmpdir = n_events, seed, tmpdir
+        self._catalog, self._files = None, {}
+
+    @property
+    def catalog(self):
+        if self._catalog is None:
+            self._catalog = synthetic.make_synthetic_catalog(self.n_events, seed=self.seed)
+        return self._catalog
+
+    def rendered(self, fmt):
+        if fmt not in self._files:
+            writer = {'qtm': synthetic.write_qtm_format, 'shearer': synthetic.write_shearer_format,
+                      'usgs_csv': synthetic.write_usgs_csv_format}[fmt]
+            self._files[fmt] = os.path.join(self.tmpdir, 'synthetic_%d.%s' % (self.n_events, fmt))
+            writer(self.catalog, self._files[fmt])
+        return self._files[fmt]
+
+    def outfile(self, name):
+        return os.path.join(self.tmpdir, name)
+
+
+def _keep_second(_event1, event2):
+    return event2
+
+
+def _hstack_setup(ws):
+    return ws.catalog, ws.catalog[::100], _keep_second
+
+
+BENCHMARKS = [
+    Benchmark('input_qtm', lambda ws: (ws.rendered('qtm'),), file_io.input_qtm),
+    Benchmark('input_shearer_cat', lambda ws: (ws.rendered('shearer'),), file_io.input_shearer_cat),
+    Benchmark('read_usgs_website_csv', lambda ws: (ws.rendered('usgs_csv'),), file_io.read_usgs_website_csv,
+              max_events=1000000),
+    Benchmark('restrict_cat_box', lambda ws: (ws.catalog, [-118.5, -116.0, 33.0, 35.0, 0, 15]),
+              lambda MyCat, bbox: MyCat.restrict_cat_box(bbox)),
+    Benchmark('make_simple_seismicity_rates', lambda ws: (ws.catalog,),
+              lambda MyCat: MyCat.make_simple_seismicity_rates(window=30, step=1)),
+    Benchmark('compute_spatial_density', lambda ws: (ws.catalog, BBOX, 0.02, 0.02),
+              catalog_functions.compute_spatial_density),
+    Benchmark('combine_two_catalogs_hstack', _hstack_setup, catalog_functions.combine_two_catalogs_hstack,
+              max_events=1000000),
+    Benchmark('write_simple_catalog_txt', lambda ws: (ws.catalog, ws.outfile('simple.txt')),
+              file_io.write_simple_catalog_txt),
+    Benchmark('write_location_catalog_txt', lambda ws: (ws.catalog, ws.outfile('location.txt')),
+              file_io.write_location_catalog_txt),
+]
+
+
+def run_benchmarks(sizes, only=None, repeat=3, seed=0):
+    """
+    :param sizes: list of catalog sizes
+    :param only: optional list of benchmark names
+    :param repeat: number of timed runs of each benchmark (the fastest is kept)
+    :param seed: seed of the synthetic catalogs
+    :returns: list of result dicts (benchmark, n_events, seconds, peak_mb)
+    """
+    results = []
+    for n_events in sizes:
+        tmpdir = tempfile.mkdtemp(prefix='eq_catalogs_bench_')
+        try:
+            workspace = Workspace(n_events, seed, tmpdir)
+            for benchmark in BENCHMARKS:
+                if only and benchmark.name not in only:
+                    continue
+                if benchmark.max_events is not None and n_events > benchmark.max_events:
+                    print("%-30s %10d  skipped (above %d events)" % (benchmark.name, n_events, benchmark.max_events))
+                    continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    args = benchmark.setup(workspace)
+                    seconds, peak_mb = _measure(benchmark.run, args, repeat)
+                results.append({'benchmark': benchmark.name, 'n_events': n_events, 'seconds': seconds,
+                                'peak_mb': peak_mb})
+                print("%-30s %10d  %9.4f s  %9.1f MB" % (benchmark.name, n_events, seconds, peak_mb))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+
+def _measure(function, args, repeat):
+    """Best wall time of repeat runs, and the peak memory allocated during one more run."""
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+
+def load_runs(filename):
+    """Runs stored in a history file (a list of runs) or a baseline file (one run)."""
+    with open(filename) as ifile:
+        contents = json.load(ifile)
+    return contents if isinstance(contents, list) else [contents]
+
+
+def append_to_history(run, filename):
+    runs = load_runs(filename) if os.path.exists(filename) else []
+    runs.append(run)
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    tmpfile = filename + '.tmp%d' % os.getpid()
+    with open(tmpfile, 'w') as ofile:
+        json.dump(runs, ofile, indent=1)
+    os.replace(tmpfile, filename)
+    return
+
+
+def compare_runs(run, baseline, time_tolerance=0.2, memory_tolerance=0.2, min_seconds=0.005):
+    """
+    Compare a run against a baseline run, benchmark by benchmark (same name and size).
+
+    :param time_tolerance: allowed fractional increase of wall time
+    :param memory_tolerance: allowed fractional increase of peak memory
+    :param min_seconds: differences in wall time smaller than this are never regressions (timer noise)
+    :returns: list of regression messages
+    """
+    base = {(r['benchmark'], r['n_events']): r for r in baseline['results']}
+    regressions = []
+    print("%-30s %10s %10s %10s %8s %10s %10s" % ('benchmark', 'n_events', 'base s', 'now s', 'ratio',
+                                                  'base MB', 'now MB'))
+    for result in run['results']:
+        key = (result['benchmark'], result['n_events'])
+        if key not in base:
+            continue
+        old = base[key]
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] > 0 else np.inf
+        flags = []
+        if result['seconds'] > old['seconds'] * (1 + time_tolerance) and \
+                result['seconds'] - old['seconds'] > min_seconds:
+            flags.append('time x%.2f' % ratio)
+        if result['peak_mb'] > old['peak_mb'] * (1 + memory_tolerance) and result['peak_mb'] - old['peak_mb'] > 1:
+            flags.append('memory x%.2f' % (result['peak_mb'] / max(old['peak_mb'], 1e-9)))
+        print("%-30s %10d %10.4f %10.4f %8.2f %10.1f %10.1f  %s" % (key[0], key[1], old['seconds'],
+                                                                   result['seconds'], ratio, old['peak_mb'],
+                                                                   result['peak_mb'], ' '.join(flags)))
+        if flags:
+            regressions.append("%s at %d events: %s" % (key[0], key[1], ', '.join(flags)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e4, 1e5, 1e6],
+                        help='catalog sizes (number of events), e.g. 1e4 1e7')
+    parser.add_argument('--only', nargs='+', help='names of the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of each benchmark (best is kept)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic catalogs')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file that runs are appended to')
+    parser.add_argument('--no-history', action='store_true', help="don't record this run")
+    parser.add_argument('--save-baseline', help='also write this run to a baseline file')
+    parser.add_argument('--compare', help='baseline (or history) file to compare against; uses its last run')
+    parser.add_argument('--compare-last', action='store_true',
+                        help="don't run; compare the last run in the history file against --compare")
+    parser.add_argument('--time-tolerance', type=float, default=0.2, help='allowed fractional slowdown')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2, help='allowed fractional memory growth')
+    args = parser.parse_args(argv)
+
+    if args.compare_last:
+        run = load_runs(args.history)[-1]
+    else:
+        run = run_metadata()
+        run['results'] = run_benchmarks([int(n) for n in args.sizes], args.only, args.repeat, args.seed)
+        if not args.no_history:
+            append_to_history(run, args.history)
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as ofile:
+                json.dump(run, ofile, indent=1)
+    if args.compare:
+        baseline = load_runs(args.compare)[-1]
+        print("Comparing against baseline from %s (commit %s)" % (baseline.get('timestamp'), baseline.get('commit')))
+        regressions = compare_runs(run, baseline, args.time_tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
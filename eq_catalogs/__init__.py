@@ -0,0 +1,41 @@
+"""
+Tools for reading, plotting, reducing, and filtering earthquake catalogs.
+
+The names below are imported on first use, so `import eq_catalogs` is cheap, and heavy dependencies
+(pandas, matplotlib, pygmt) are only loaded by the functions that need them.
+"""
+
+import importlib
+
+_LAZY_NAMES = {
+    'Catalog': 'eqcat_object', 'Catalog_EQ': 'eqcat_object',
+    'read_catalog': 'file_io', 'load_many': 'file_io', 'register_format': 'file_io', 'sniff_format': 'file_io',
+    'input_qtm': 'file_io', 'input_shearer_cat': 'file_io', 'read_usgs_website_csv': 'file_io',
+    'read_quakeml': 'file_io', 'read_cached': 'file_io', 'read_binary_catalog': 'file_io',
+    'write_binary_catalog': 'file_io', 'write_simple_catalog_txt': 'file_io',
+    'combine_two_catalogs_hstack': 'catalog_functions', 'combine_catalogs_vstack': 'catalog_functions',
+    'match_catalogs': 'catalog_functions', 'compute_spatial_density': 'catalog_functions',
+    'decluster': 'declustering',
+    'fit_gutenberg_richter': 'magnitude_statistics', 'estimate_mc': 'magnitude_statistics',
+    'make_synthetic_catalog': 'synthetic',
+    'collect_metrics': 'instrumentation', 'set_log_level': 'instrumentation', 'log_to_stdout': 'instrumentation',
+}
+_SUBMODULES = ('batch_plotting', 'catalog_functions', 'catalog_query', 'declustering', 'eqcat_object', 'file_io',
+               'instrumentation', 'magnitude_statistics', 'plotting', 'pygmt_plots', 'spatial_index', 'synthetic')
+
+__all__ = sorted(_LAZY_NAMES) + list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        value = getattr(importlib.import_module('.' + _LAZY_NAMES[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
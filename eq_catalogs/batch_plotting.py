@@ -0,0 +1,85 @@
+# Render many figures of one catalog on a process pool
+
+import os
+import time
+import shutil
+import tempfile
+import traceback
+import collections
+import multiprocessing
+import concurrent.futures
+from . import file_io
+from .instrumentation import logger, timed
+
+PlotJob = collections.namedtuple('PlotJob', ['subset', 'plot_function', 'outfile', 'kwargs'], defaults=[None])
+PlotJob.__doc__ = """
+One figure to make.
+subset: dict of filters for Catalog.make_mask (bbox, starttime, endtime, Mc), or None for the whole catalog.
+plot_function: a module-level function called as plot_function(catalog, outfile, **kwargs),
+such as plotting.plot_cumulative_eqs or pygmt_plots.simple_pygmt_map.
+"""
+JobResult = collections.namedtuple('JobResult', ['outfile', 'seconds', 'n_events', 'error'])
+
+_worker_catalog = None  # the shared catalog, memory-mapped once in each worker process
+
+
+@timed()
+def run_plot_jobs(MyCat, jobs, n_workers=None, mp_context=None):
+    """
+    Render a list of plot jobs on a process pool.
+    The catalog is written once as a binary catalog in a temporary directory, and each worker memory-maps it,
+    so the catalog is not pickled for every job.  A failing job does not stop the others.
+
+    :param MyCat: Catalog
+    :param jobs: list of PlotJob
+    :param n_workers: number of worker processes. Default: number of CPUs.
+    :param mp_context: multiprocessing start method ('fork', 'spawn', ...). Default: the platform default.
+    :returns: list of JobResult (outfile, seconds, n_events, error traceback or None), in the order of jobs
+    """
+    tmpdir = tempfile.mkdtemp(prefix='eq_catalogs_batch_')
+    try:
+        catalog_dir = os.path.join(tmpdir, 'catalog')
+        file_io.write_binary_catalog(MyCat, catalog_dir)
+        context = None if mp_context is None else multiprocessing.get_context(mp_context)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                                                    initializer=_init_worker, initargs=(catalog_dir,)) as executor:
+            results = list(executor.map(_run_job, jobs))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    n_failed = sum(result.error is not None for result in results)
+    logger.info("Rendered %d of %d figures in %.1f s of worker time", len(results) - n_failed, len(results),
+                sum(result.seconds for result in results))
+    for result in results:
+        if result.error is not None:
+            logger.error("Failed: %s\n%s", result.outfile, result.error)
+    return results
+
+
+def _init_worker(catalog_dir):
+    """
+    Per-worker setup: non-interactive matplotlib backend, a GMT session name of its own (GMT otherwise names
+    modern-mode sessions after the parent process, which all workers share), and the memory-mapped catalog.
+    """
+    global _worker_catalog
+    os.environ['GMT_SESSION_NAME'] = str(os.getpid())
+    import matplotlib
+    matplotlib.use('Agg')
+    _worker_catalog = file_io.read_binary_catalog(catalog_dir, mmap=True)
+
+
+def _run_job(job):
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    n_events = 0
+    try:
+        subcat = _worker_catalog
+        if job.subset:
+            subcat = subcat[subcat.make_mask(**job.subset)]
+        n_events = len(subcat)
+        job.plot_function(subcat, job.outfile, **(job.kwargs or {}))
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        plt.close('all')
+    return JobResult(job.outfile, time.perf_counter() - start, n_events, error)
@@ -1,68 +1,306 @@
 # Functions that operate on earthquake catalogs
 
 import numpy as np
+from Tectonic_Utils.seismo import moment_calculations
+from .eqcat_object import Catalog
+from .spatial_index import KM_PER_DEGREE, haversine_km
+from .instrumentation import logger, timed
 
+# _one_to_one finishes with its loop once a round accepts fewer pairs than this fraction of the remaining ones.
+ONE_TO_ONE_MIN_ROUND_FRACTION = 0.01
 
-def combine_two_catalogs_hstack(Cat1, Cat2, merging_function):
+
+@timed()
+def combine_two_catalogs_hstack(Cat1, Cat2, merging_function, time_tolerance=0, distance_tolerance=None,
+                                mag_tolerance=None):
     """
     Take two catalogs and stitch them together, taking some attributes from one catalog and some from the other.
     Somewhat unintuitive function.
     This function is most useful when moment tensors come from one catalog (i.e., USGS)
     and locations come from another (i.e., local).
     This function is more like the union of a 'set'.
+    By default, events are matched on identical times; with tolerances, see match_catalogs.
 
     :param Cat1: catalog
     :param Cat2: catalog
     :param merging_function: specific merging function on two earthquake objects (depends on each project)
+    :param time_tolerance: seconds. 0 means exact time matches.
+    :param distance_tolerance: optional km
+    :param mag_tolerance: optional magnitude units
     :return: Catalog
     """
-    print("Combining elements of two catalogs...")
-    MyCat = []
-    cat2_dts = [item.dt for item in Cat2]
-    for item in Cat1:
-        if item.dt in cat2_dts:
-            idx2 = cat2_dts.index(item.dt)
-            new_eq = merging_function(item, Cat2[idx2])
-            MyCat.append(new_eq)
-        else:
-            MyCat.append(item)
-    return MyCat
+    logger.info("Combining elements of two catalogs...")
+    Cat1, Cat2 = _as_catalog(Cat1), _as_catalog(Cat2)
+    idx1, idx2 = match_catalogs(Cat1, Cat2, time_tolerance, distance_tolerance, mag_tolerance)
+    merged = Catalog([merging_function(Cat1[int(i)], Cat2[int(j)]) for i, j in zip(idx1, idx2)])
+    unmatched = np.ones(len(Cat1), dtype=bool)
+    unmatched[idx1] = False
+    combined = Catalog.concatenate([Cat1[unmatched], merged], bbox=Cat1.bbox)
+    original_position = np.concatenate([np.flatnonzero(unmatched), idx1])
+    return combined[np.argsort(original_position, kind='stable')]
 
 
-def combine_two_catalogs_vstack(Cat1, Cat2):
+@timed()
+def match_catalogs(Cat1, Cat2, time_tolerance=0, distance_tolerance=None, mag_tolerance=None, blocksize=100000):
+    """
+    Associate events in Cat1 with events in Cat2, using a sorted time index on Cat2 (O(N log M)).
+    With time_tolerance=0 and no other tolerances, events match on identical times, and each Cat1 event takes the
+    first Cat2 event with that time.  Otherwise, candidate pairs are events within time_tolerance seconds (and
+    within distance_tolerance km / mag_tolerance magnitude units, if given), and pairs are resolved one-to-one,
+    best (smallest normalized misfit) first.
+
+    :param Cat1: Catalog
+    :param Cat2: Catalog
+    :param time_tolerance: seconds
+    :param distance_tolerance: km, or None
+    :param mag_tolerance: magnitude units, or None
+    :param blocksize: number of Cat1 events whose candidate pairs are built at once
+    :returns: idx1, idx2: arrays of matched indices into Cat1 and Cat2
+    """
+    t1 = Cat1.dt.astype(np.int64)
+    t2_sorted, order2 = _sorted_times(Cat2)
+    if time_tolerance == 0 and distance_tolerance is None and mag_tolerance is None:
+        unique_times, first = np.unique(t2_sorted, return_index=True)
+        pos = np.clip(np.searchsorted(unique_times, t1), 0, max(len(unique_times) - 1, 0))
+        found = np.flatnonzero((len(unique_times) > 0) & (unique_times[pos] == t1) & ~np.isnat(Cat1.dt))
+        return found, order2[first[pos[found]]]
+
+    tolerance_us = int(round(time_tolerance * 1e6))
+    pair_i, pair_j, pair_score = [], [], []
+    for start in range(0, len(Cat1), blocksize):
+        i = np.arange(start, min(start + blocksize, len(Cat1)))
+        lo = np.searchsorted(t2_sorted, t1[i] - tolerance_us, side='left')
+        hi = np.searchsorted(t2_sorted, t1[i] + tolerance_us, side='right')
+        counts = np.maximum(hi - lo, 0)
+        i = np.repeat(i, counts)
+        j = order2[np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+        score = np.abs(t1[i] - Cat2.dt[j].astype(np.int64)) / max(tolerance_us, 1)
+        keep = ~np.isnat(Cat1.dt[i])
+        if distance_tolerance is not None:
+            distance = haversine_km(Cat1.lon[i], Cat1.lat[i], Cat2.lon[j], Cat2.lat[j])
+            keep &= distance <= distance_tolerance
+            score = score + distance / max(distance_tolerance, 1e-9)
+        if mag_tolerance is not None:
+            dmag = np.abs(Cat1.Mag[i] - Cat2.Mag[j])
+            keep &= dmag <= mag_tolerance
+            score = score + dmag / max(mag_tolerance, 1e-9)
+        pair_i.append(i[keep])
+        pair_j.append(j[keep])
+        pair_score.append(score[keep])
+    return _one_to_one(np.concatenate(pair_i), np.concatenate(pair_j), np.concatenate(pair_score),
+                       len(Cat1), len(Cat2))
+
+
+def _sorted_times(MyCat):
+    """Event times as int64 microseconds in sorted order, and the permutation that sorts them."""
+    times = MyCat.dt.astype(np.int64)
+    if MyCat.is_time_sorted:
+        return times, np.arange(len(times))
+    order = np.argsort(times, kind='stable')
+    return times[order], order
+
+
+def _one_to_one(pair_i, pair_j, score, n1, n2):
+    """
+    Greedy one-to-one assignment: accept candidate pairs from best to worst score, skipping used events.
+    Vectorized in rounds: a pair that comes first (by score) among the remaining pairs of both its events is accepted
+    by the greedy loop, so each round accepts all such pairs at once and drops the other pairs of their events.
+    A round costs O(P log P) for P remaining pairs, and matching catalogs takes a few rounds; only long chains of
+    pairs sharing events with decreasing scores need many, so once a round accepts few pairs, the rest goes through
+    the loop.
+    """
+    order = np.argsort(score, kind='stable')
+    pair_i, pair_j = pair_i[order], pair_j[order]
+    used1, used2 = np.zeros(n1, dtype=bool), np.zeros(n2, dtype=bool)
+    idx1, idx2 = [], []
+    while len(pair_i) > 0:
+        accept = _first_occurrences(pair_i) & _first_occurrences(pair_j)
+        idx1.append(pair_i[accept])
+        idx2.append(pair_j[accept])
+        used1[pair_i[accept]], used2[pair_j[accept]] = True, True
+        remaining = ~used1[pair_i] & ~used2[pair_j]
+        pair_i, pair_j = pair_i[remaining], pair_j[remaining]
+        if np.count_nonzero(accept) < ONE_TO_ONE_MIN_ROUND_FRACTION * len(pair_i):
+            break
+    tail1, tail2 = [], []
+    for i, j in zip(pair_i.tolist(), pair_j.tolist()):
+        if not used1[i] and not used2[j]:
+            used1[i], used2[j] = True, True
+            tail1.append(i)
+            tail2.append(j)
+    idx1 = np.concatenate(idx1 + [np.array(tail1, dtype=np.int64)]).astype(np.int64)
+    idx2 = np.concatenate(idx2 + [np.array(tail2, dtype=np.int64)]).astype(np.int64)
+    order = np.argsort(idx1)
+    return idx1[order], idx2[order]
+
+
+def _first_occurrences(values):
+    """Mask of the first occurrence of each value in a non-empty array."""
+    order = np.argsort(values)
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]]))
+    first = np.zeros(len(values), dtype=bool)
+    first[np.minimum.reduceat(order, starts)] = True
+    return first
+
+
+def _as_catalog(MyCat):
+    return MyCat if isinstance(MyCat, Catalog) else Catalog(MyCat)
+
+
+def combine_two_catalogs_vstack(Cat1, Cat2, **kwargs):
     """
     Take two catalogs (assumed to be from compatible sources) and append them into a single catalog.
-    This is the simplest "combining catalogs" function.
+    This is the simplest "combining catalogs" function.  See combine_catalogs_vstack for the options.
 
     :param Cat1: Catalog
     :param Cat2: Catalog
     :return: combined catalog
     :rtype: Catalog
     """
-    combined_Cat = []
-    for item in Cat1:
-        combined_Cat.append(item)
-    for item in Cat2:
-        combined_Cat.append(item)
-    return combined_Cat
+    return combine_catalogs_vstack([Cat1, Cat2], **kwargs)
+
 
+@timed()
+def combine_catalogs_vstack(catalogs, sort_by_time=False, time_tolerance=None, distance_tolerance=None,
+                            mag_tolerance=None, priority=None):
+    """
+    Append any number of catalogs into a single catalog, directly on the columns.
+    With sort_by_time, the result is merged into time order.  A stable merge sort finds the already-sorted runs
+    (such as yearly catalog files), so stitching sorted catalogs costs a merge rather than a full re-sort, and
+    catalogs that follow each other in time cost a single pass.
+    With time_tolerance, events that match an event of a higher-priority catalog (see match_catalogs) are dropped
+    as duplicates.  Duplicates inside one catalog are left alone.
 
-def compute_spatial_density(eqcat, bounds, spacing_x, spacing_y):
+    :param catalogs: list of Catalogs
+    :param sort_by_time: bool
+    :param time_tolerance: seconds, or None for no duplicate removal.  0 means identical times.
+    :param distance_tolerance: optional km
+    :param mag_tolerance: optional magnitude units
+    :param priority: optional list of numbers, one per catalog; when events are duplicates, the event from the
+                     catalog with the highest priority is kept.  Default: earlier catalogs win.
+    :return: combined catalog
+    :rtype: Catalog
     """
-    Compute a 2D array of spatial density of earthquakes in a catalog
+    catalogs = [_as_catalog(MyCat) for MyCat in catalogs]
+    if time_tolerance is not None:
+        if priority is None:
+            priority = [-i for i in range(len(catalogs))]
+        keep_masks = [None] * len(catalogs)
+        kept = []
+        for k in sorted(range(len(catalogs)), key=lambda i: priority[i], reverse=True):
+            keep = np.ones(len(catalogs[k]), dtype=bool)
+            if kept:
+                idx, _ = match_catalogs(catalogs[k], Catalog.concatenate(kept), time_tolerance, distance_tolerance,
+                                        mag_tolerance)
+                keep[idx] = False
+            keep_masks[k] = keep
+            kept.append(catalogs[k][keep])
+        n_dropped = sum(np.sum(~keep) for keep in keep_masks)
+        logger.info("Removing %d duplicate events out of %d", n_dropped, sum(len(MyCat) for MyCat in catalogs))
+        catalogs = [MyCat[keep] for MyCat, keep in zip(catalogs, keep_masks)]
+    combined = Catalog.concatenate(catalogs, bbox=catalogs[0].bbox if catalogs else None)
+    if sort_by_time:
+        combined = combined.sort_by_time()
+    return combined
 
-    :param eqcat: catalog of earthquakes
+
+@timed()
+def compute_spatial_density(eqcat, bounds, spacing_x, spacing_y, depth_edges=None, weighting=None, normalize=None,
+                            out=None, chunksize=1000000):
+    """
+    Compute a 2D array of spatial density of earthquakes in a catalog.
+    Each cell counts the events with x <= lon <= x+spacing_x, y <= lat <= y+spacing_y, top <= depth <= bottom
+    (closed intervals, so an event exactly on a shared cell edge counts in both cells).
+
+    :param eqcat: catalog of earthquakes, or an iterable of catalogs (chunks) to accumulate into one grid
     :param bounds: a bounding box [W, E, S, N, top, bottom]
     :param spacing_x: float
     :param spacing_y: float
-    :return: xarray (1d array), yarray (1d array), density (2d array)
+    :param depth_edges: optional array of depth-slice edges (km); if given, density becomes 3D [depth, lat, lon]
+    :param weighting: None (count events) or 'moment' (sum of seismic moment in N-m; events without a magnitude
+                      are skipped)
+    :param normalize: None, 'area' (per km^2), 'time' (per year), or 'area_time' (per km^2 per year).  Time
+                      normalization uses the time span of the whole catalog; an empty catalog gives a zero grid.
+    :param out: optional preallocated array (e.g. np.memmap) of the right shape, accumulated into in place
+    :param chunksize: number of events binned at once
+    :return: xarray (1d array), yarray (1d array), density (2d array, or 3d if depth_edges is given)
     """
     xarray = np.arange(bounds[0], bounds[1], spacing_x)
     yarray = np.arange(bounds[2], bounds[3], spacing_y)
-    density = np.zeros([len(yarray), len(xarray)])
-    for i in range(len(yarray)):
-        for j in range(len(xarray)):
-            box_interest = [xarray[j], xarray[j]+spacing_x, yarray[i], yarray[i]+spacing_y, bounds[4], bounds[5]]
-            restricted = eqcat.restrict_cat_box(box_interest)
-            density[i][j] = len(restricted)
+    if depth_edges is None:
+        zleft, zright = np.array([bounds[4]]), np.array([bounds[5]])
+    else:
+        zleft, zright = np.asarray(depth_edges[:-1]), np.asarray(depth_edges[1:])
+    shape = (len(zleft), len(yarray), len(xarray))
+    density = np.zeros(shape) if out is None else out.reshape(shape)
+    density_flat = density.reshape(-1)
+    catalogs = [eqcat] if hasattr(eqcat, 'dt') else eqcat
+    tmin, tmax = None, None
+    for catalog in catalogs:
+        for start in range(0, len(catalog), chunksize):
+            block = catalog[start:start+chunksize]
+            in_depth = (block.depth >= bounds[4]) & (block.depth <= bounds[5])
+            if weighting == 'moment':
+                in_depth &= ~np.isnan(block.Mag)
+                weights = moment_calculations.moment_from_mw(block.Mag[in_depth])
+            else:
+                weights = None
+            axes = [(block.depth[in_depth], zleft, zright),
+                    (block.lat[in_depth], yarray, yarray + spacing_y),
+                    (block.lon[in_depth], xarray, xarray + spacing_x)]
+            _accumulate_closed_bins(density_flat, shape, axes, weights)
+            if len(block) > 0:
+                t0, t1 = block.get_start_stop_time()
+                tmin = t0 if tmin is None else min(tmin, t0)
+                tmax = t1 if tmax is None else max(tmax, t1)
+    if normalize in ('area', 'area_time'):
+        cell_area_km2 = spacing_x * spacing_y * KM_PER_DEGREE**2 * np.cos(np.radians(yarray + spacing_y / 2))
+        density /= cell_area_km2[np.newaxis, :, np.newaxis]
+    if normalize in ('time', 'area_time') and tmin is not None:
+        if tmax == tmin:
+            raise ValueError("Cannot normalize by time: the catalog's events all occur at %s" % tmin)
+        density /= (tmax - tmin).total_seconds() / (365.25 * 86400)
+    if depth_edges is None:
+        density = density[0]
     return xarray, yarray, density
+
+
+def _closed_bins(values, left, right):
+    """
+    For each value, find the range [first, last) of bins with left <= value <= right. Edges must be increasing.
+    Usually one bin; two if the value sits exactly on a shared edge; zero if it is outside every bin.
+    """
+    first = np.searchsorted(right, values, side='left')
+    last = np.searchsorted(left, values, side='right')
+    return first, np.maximum(last - first, 0)
+
+
+def _accumulate_closed_bins(density_flat, shape, axes, weights=None):
+    """
+    Add events into a flattened N-d grid, in one pass over the events.
+
+    :param density_flat: flat view of the grid, accumulated in place
+    :param shape: shape of the grid
+    :param axes: list of (values, left edges, right edges), one per grid dimension, in the order of shape
+    :param weights: optional weight per event; default is to count events
+    """
+    bins = [_closed_bins(values, left, right) for values, left, right in axes]
+    inside = np.ones(len(axes[0][0]), dtype=bool)
+    for _, width in bins:
+        inside &= width > 0
+    firsts = [first[inside] for first, _ in bins]
+    widths = [width[inside] for _, width in bins]
+    weights = None if weights is None else weights[inside]
+    # Events on shared edges belong to more than one cell; visit each combination of offsets along the axes.
+    for offsets in np.ndindex(*[int(w.max()) if len(w) > 0 else 0 for w in widths]):
+        sel = np.ones(len(firsts[0]), dtype=bool)
+        for offset, width in zip(offsets, widths):
+            sel &= width > offset
+        flat = np.ravel_multi_index([first[sel] + offset for first, offset in zip(firsts, offsets)], shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        if weights is None:
+            density_flat[cells] += np.bincount(inverse.ravel(), minlength=len(cells))
+        else:
+            density_flat[cells] += np.bincount(inverse.ravel(), weights=weights[sel], minlength=len(cells))
+    return
@@ -0,0 +1,136 @@
+"""
+Lazy, composable filters on a Catalog.  A query only records predicates; nothing is computed until the query is
+collected (or iterated over).  At that point the predicates are ordered from most to least selective and applied
+together in one blocked pass over the catalog, so no intermediate catalogs are created.
+
+Example:  cat.query().box([-117, -116, 33, 34, 0, 20]).mag_above(2.0).between(t0, t1).collect()
+"""
+
+import numpy as np
+from .eqcat_object import range_mask
+
+
+class CatalogQuery:
+    def __init__(self, catalog, predicates=(), bbox=None, chunksize=65536):
+        """
+        :param catalog: the Catalog being queried
+        :param predicates: tuple of (column_name, lower, upper); a None bound is open
+        :param bbox: bounding box recorded by box(), passed on to the collected catalog
+        :param chunksize: number of events per block when evaluating
+        """
+        self.catalog = catalog
+        self.predicates = tuple(predicates)
+        self.bbox = bbox
+        self.chunksize = chunksize
+
+    def _add(self, column, lower, upper, bbox=None):
+        return CatalogQuery(self.catalog, self.predicates + ((column, lower, upper),),
+                            bbox=self.bbox if bbox is None else bbox, chunksize=self.chunksize)
+
+    # ----------- PREDICATES ---------- #
+    def where(self, column, lower=None, upper=None):
+        """
+        Keep events with lower <= column <= upper.
+
+        :param column: name of a catalog column, such as 'lon', 'depth', 'Mag', or 'dt'
+        :param lower: lower bound, or None
+        :param upper: upper bound, or None
+        :returns: new query
+        """
+        return self._add(column, lower, upper)
+
+    def box(self, bbox):
+        """
+        :param bbox: bounding box [lon0, lon1, lat0, lat1, optionally depth0, depth1, optionally t1, t2].
+                     t1/t2 could be None.
+        :returns: new query
+        """
+        query = self._add('lon', bbox[0], bbox[1], bbox=list(bbox))._add('lat', bbox[2], bbox[3])
+        if len(bbox) > 4:
+            query = query._add('depth', bbox[4], bbox[5])
+        if len(bbox) > 6:
+            query = query.between(bbox[6], bbox[7])
+        return query
+
+    def depth_between(self, top, bottom):
+        return self._add('depth', top, bottom)
+
+    def mag_above(self, Mc):
+        return self._add('Mag', Mc, None)
+
+    def mag_below(self, Mmax):
+        return self._add('Mag', None, Mmax)
+
+    def between(self, starttime, endtime):
+        """
+        :param starttime: dt object, or None
+        :param endtime: dt object, or None
+        :returns: new query
+        """
+        return self._add('dt', starttime, endtime)
+
+    # ----------- EVALUATION ---------- #
+    def _ordered_ranges(self, predicates, sample_size=2000):
+        """Order the predicates by their pass rate on an evenly spaced sample of the catalog, most selective first."""
+        ranges = [(getattr(self.catalog, column), lower, upper) for column, lower, upper in predicates]
+        n = len(self.catalog)
+        if len(ranges) < 2 or n == 0:
+            return ranges
+        sample = slice(None, None, max(1, n // sample_size))
+        pass_rates = [np.mean(range_mask([(column[sample], lower, upper)], len(column[sample])))
+                      for column, lower, upper in ranges]
+        return [ranges[i] for i in np.argsort(pass_rates, kind='stable')]
+
+    def indices(self):
+        """
+        Evaluate the query.  Within each block, the most selective predicate is evaluated on every event, and the
+        remaining predicates only on the events that survived it.
+
+        :returns: array of integer indices into the catalog
+        """
+        lo, hi = 0, len(self.catalog)
+        predicates = self.predicates
+        time_windows = [(lower, upper) for column, lower, upper in predicates if column == 'dt']
+        if time_windows and self.catalog.is_time_sorted:
+            # On a time-sorted catalog, time windows become a binary search instead of a predicate.
+            for lower, upper in time_windows:
+                window = self.catalog._time_window_positions(lower, upper)
+                lo, hi = max(lo, window[0]), min(hi, window[1])
+            hi = max(lo, hi)
+            predicates = [predicate for predicate in predicates if predicate[0] != 'dt']
+        ranges = self._ordered_ranges(predicates)
+        if len(ranges) == 0:
+            return np.arange(lo, hi)
+        selected = [np.zeros(0, dtype=np.int64)]
+        for start in range(lo, hi, self.chunksize):
+            stop = min(start + self.chunksize, hi)
+            first_column, lower, upper = ranges[0]
+            idx = start + np.flatnonzero(range_mask([(first_column[start:stop], lower, upper)], stop - start))
+            for column, lower, upper in ranges[1:]:
+                if len(idx) == 0:
+                    break
+                idx = idx[range_mask([(column[idx], lower, upper)], len(idx))]
+            selected.append(idx)
+        return np.concatenate(selected)
+
+    def count(self):
+        return len(self.indices())
+
+    def collect(self):
+        """
+        Materialize the query into a new Catalog.
+
+        :returns: catalog
+        :rtype: Catalog
+        """
+        bbox = None
+        if self.bbox is not None and len(self.bbox) <= 4:
+            bbox = list(self.bbox)  # a lon/lat box has no depth or time bounds to record
+        elif self.bbox is not None:
+            time_windows = [(lower, upper) for column, lower, upper in self.predicates if column == 'dt']
+            bbox = self.bbox[0:6] + list(time_windows[-1] if time_windows else [])
+            bbox = self.catalog._complete_bbox(bbox)
+        return self.catalog._take(self.indices(), bbox=bbox)
+
+    def __iter__(self):
+        return iter(self.collect())
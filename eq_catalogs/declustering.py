@@ -0,0 +1,552 @@
+"""
+Declustering of earthquake catalogs: Gardner-Knopoff windows, Reasenberg links, and Zaliapin nearest-neighbor
+distances.  Events are bucketed on a space-time grid (grid cells about one search radius wide, events sorted by time
+inside each cell), so each event is only compared against the events in nearby cells and in its time window.
+The neighbor searches run tile by tile, and can be spread over a process pool with n_workers.
+
+Each method returns a DeclusterResult: a cluster number for every event, and a mask of the mainshocks
+(one per cluster, and every event that is not in a cluster).  MyCat[result.is_mainshock] is the declustered catalog.
+"""
+
+import math
+import collections
+import concurrent.futures
+import numpy as np
+from .spatial_index import KM_PER_DEGREE, haversine_km
+from .instrumentation import logger, timed
+
+DeclusterResult = collections.namedtuple('DeclusterResult', ['cluster', 'is_mainshock', 'parent', 'eta'],
+                                         defaults=[None, None])
+DeclusterResult.__doc__ = """
+cluster: integer cluster number of each event (an event that is not in a cluster has a cluster of its own)
+is_mainshock: boolean mask of the mainshocks
+parent: nearest-neighbor method only; index of each event's nearest earlier neighbor, or -1
+eta: nearest-neighbor method only; nearest-neighbor distance of each event (inf if it has no neighbor)
+"""
+US_PER_DAY = 86400e6
+US_PER_YEAR = 365.25 * US_PER_DAY
+MAX_PAIRS = 2000000  # candidate pairs held in memory at once, per process
+NN_MAGNITUDE_STEP = 1.0  # width of the magnitude bands that nearest-neighbor candidates are capped in
+
+_worker_state = {}  # columns and SpaceTimeGrid of the catalog being declustered; only set in pool workers
+
+
+class SpaceTimeGrid:
+    """
+    Events bucketed by (grid cell, time rank), so that each cell's events in a time window are one contiguous run.
+    This is separate from spatial_index.GridIndex, whose cells are sized by event count and hold events in no
+    particular time order: here the cells must be at least as wide as the search radius in km (so that a search
+    only visits neighboring cells), and sorted by time within each cell (so each window is a searchsorted away).
+    The grid is meant for regional catalogs, and does not wrap around at +-180 longitude.
+    Events can also be split into groups (such as magnitude bands), each with its own grid, searched separately.
+    """
+    def __init__(self, lon, lat, times, cell_km, groups=None):
+        """
+        :param lon: array of longitudes
+        :param lat: array of latitudes
+        :param times: array of int64 times (any unit)
+        :param cell_km: minimum width of a grid cell, km
+        :param groups: optional array of non-negative integer group numbers, one per event
+        """
+        self.n, self.cell_km = len(times), cell_km
+        self.time_order = np.argsort(times, kind='stable')
+        self.sorted_times = times[self.time_order]
+        self.rank = np.empty(self.n, dtype=np.int64)
+        self.rank[self.time_order] = np.arange(self.n)
+        # Cells are at least cell_km wide everywhere: longitude widths are set at the highest latitude.
+        coslat = np.cos(np.radians(min(float(np.max(np.abs(lat), initial=0)), 89.0)))
+        dlat = cell_km / KM_PER_DEGREE
+        self.cx = np.floor((lon - np.min(lon, initial=0)) / (dlat / max(coslat, 1e-3))).astype(np.int64)
+        self.cy = np.floor((lat - np.min(lat, initial=0)) / dlat).astype(np.int64)
+        self.nx, self.ny = int(np.max(self.cx, initial=0)) + 1, int(np.max(self.cy, initial=0)) + 1
+        self.groups = np.zeros(self.n, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        # by group, then by cell, then by time within each cell
+        keys = ((self.groups * self.ny + self.cy) * self.nx + self.cx) * self.n + self.rank
+        self.cell_order = np.argsort(keys)
+        self.keys = keys[self.cell_order]
+
+    def tiles(self, query, tilesize):
+        """Split events into spatially compact groups (consecutive runs of events sorted by grid cell)."""
+        query = query[np.argsort((self.cy[query] * self.nx + self.cx[query]) * self.n + self.rank[query])]
+        return [query[start:start + tilesize] for start in range(0, len(query), tilesize)]
+
+    def _runs(self, query, lower, upper, radius_km, group=0, latest=None, truncated=None, max_cells=81):
+        """
+        Candidate events near each query event, as contiguous runs: for each (ks, lo, counts, order),
+        order[lo[n]:lo[n] + counts[n]] are candidates of query[ks[n]].
+        Query events whose radius spans more than max_cells grid cells scan their whole time window (in every
+        group) instead.  With latest, each run is cut down to its latest events, and truncated (if given) is set to
+        True at the query positions that lost candidates.
+        """
+        t = self.sorted_times[self.rank[query]]
+        r_lo = np.searchsorted(self.sorted_times, t + lower, side='left')
+        r_hi = np.searchsorted(self.sorted_times, t + upper, side='right')
+        rings = np.ceil(radius_km / self.cell_km).astype(np.int64)
+        for nrings in np.unique(rings):
+            ks = np.flatnonzero(rings == nrings)
+            if (2 * nrings + 1) ** 2 > max_cells:
+                yield _latest(ks, r_lo[ks], np.maximum(r_hi[ks] - r_lo[ks], 0), latest, truncated) + (self.time_order,)
+                continue
+            query_cx, query_cy, run_lo, run_hi = self.cx[query[ks]], self.cy[query[ks]], r_lo[ks], r_hi[ks]
+            for dy in range(-nrings, nrings + 1):
+                cy = query_cy + dy
+                row_inside = (cy >= 0) & (cy < self.ny)
+                row = (group * self.ny + cy) * self.nx
+                for dx in range(-nrings, nrings + 1):
+                    cx = query_cx + dx
+                    inside = row_inside & (cx >= 0) & (cx < self.nx)
+                    base = (row + cx) * self.n
+                    lo = np.searchsorted(self.keys, base + run_lo, side='left')
+                    hi = np.searchsorted(self.keys, base + run_hi, side='left')
+                    counts = np.where(inside, np.maximum(hi - lo, 0), 0)
+                    yield _latest(ks, lo, counts, latest, truncated) + (self.cell_order,)
+
+    def pairs(self, query, lower, upper, radius_km, group=0, latest=None, truncated=None, max_pairs=MAX_PAIRS):
+        """
+        Candidate pairs near each query event: all events j of a group, in the grid cells within radius_km of
+        query event k, with times[k] + lower[k] <= times[j] <= times[k] + upper[k].  Distances are not checked.
+        Pairs are generated in chunks of about max_pairs, and all pairs of one query event are in the same chunk.
+
+        :param query: array of event indices
+        :param lower: array of time offsets, one per query event
+        :param upper: array of time offsets, one per query event
+        :param radius_km: array of search radii, one per query event
+        :param group: group number of the candidate events
+        :param latest: if given, only the latest events of each grid cell in the time window are candidates
+        :param truncated: optional boolean array, one per query event, set to True where latest dropped candidates
+        :returns: generator of (k, j): position in query and index of the event, for each candidate pair
+                  (j never equals query[k])
+        """
+        counts = np.zeros(len(query), dtype=np.int64)
+        runs = list(self._runs(query, lower, upper, radius_km, group, latest, truncated))
+        for ks, _, run_counts, _ in runs:
+            counts[ks] += run_counts
+        chunk = np.cumsum(counts) // max(max_pairs, 1)
+        for c in np.unique(chunk):
+            sel = np.flatnonzero(chunk == c)
+            if len(sel) < len(query):  # runs of several chunks are found again, chunk by chunk
+                runs = self._runs(query[sel], lower[sel], upper[sel], radius_km[sel], group, latest)
+            pair_k, pair_j = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+            for ks, lo, run_counts, order in runs:
+                pair_k.append(sel[np.repeat(ks, run_counts)])
+                pair_j.append(order[_expand(lo, run_counts)])
+            k, j = np.concatenate(pair_k), np.concatenate(pair_j)
+            not_self = j != query[k]
+            yield k[not_self], j[not_self]
+
+
+def _latest(ks, lo, counts, latest, truncated=None):
+    """Cut runs of time-sorted candidates down to their last (latest) events, marking the truncated runs' ks."""
+    if latest is None:
+        return ks, lo, counts
+    if truncated is not None:
+        truncated[ks[counts > latest]] = True
+    return ks, lo + np.maximum(counts - latest, 0), np.minimum(counts, latest)
+
+
+def _expand(lo, counts):
+    """Positions lo[k], lo[k]+1, ..., lo[k]+counts[k]-1 for every k, concatenated."""
+    return np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(np.sum(counts))
+
+
+# ----------- GARDNER-KNOPOFF ---------- #
+def gardner_knopoff_window(Mag):
+    """
+    Space-time windows of Gardner and Knopoff (1974).
+
+    :param Mag: array of magnitudes
+    :returns: window lengths in days, and window radii in km
+    """
+    Mag = np.asarray(Mag, dtype=float)
+    days = np.where(Mag >= 6.5, 10 ** (0.032 * Mag + 2.7389), 10 ** (0.5409 * Mag - 0.547))
+    km = 10 ** (0.1238 * Mag + 0.983)
+    return days, km
+
+
+@timed()
+def gardner_knopoff(MyCat, window=gardner_knopoff_window, foreshock_fraction=0.0, n_workers=None,
+                    tilesize=20000, blocksize=100000):
+    """
+    Window declustering.  Going from the largest event to the smallest, each event that is not yet in a cluster
+    becomes a mainshock, and claims every unclaimed event inside its space-time window.
+    Windows are searched for blocks of events at a time, skipping events already claimed by a larger one.
+
+    :param MyCat: Catalog
+    :param window: module-level function from magnitudes to (window days, window km)
+    :param foreshock_fraction: windows also reach back this fraction of their length before the mainshock
+    :param n_workers: number of worker processes for the window searches
+    :param tilesize: number of events per tile of work
+    :param blocksize: number of events (by decreasing magnitude) whose windows are searched at once
+    :returns: DeclusterResult
+    """
+    valid, columns = _valid_columns(MyCat)
+    days, km = window(columns['Mag'])
+    by_magnitude = np.lexsort((columns['times'], -np.nan_to_num(columns['Mag'], nan=-np.inf)))
+    by_magnitude = by_magnitude[np.isfinite(days[by_magnitude]) & np.isfinite(km[by_magnitude])]
+    cluster = np.arange(len(days)) + len(days)  # events that never join a window keep a cluster of their own
+    is_mainshock = np.ones(len(days), dtype=bool)
+    claimed = np.zeros(len(days), dtype=bool)
+    with _TileRunner(columns, _cell_size(km), n_workers, tilesize) as runner:
+        for start in range(0, len(by_magnitude), blocksize):
+            block = by_magnitude[start:start + blocksize]
+            block = block[~claimed[block]]
+            i, j = runner.map(_gardner_knopoff_tile, block, (window, foreshock_fraction))
+            by_event = np.argsort(i, kind='stable')
+            i, j = i[by_event], j[by_event]
+            starts = np.searchsorted(i, block, side='left').tolist()
+            stops = np.searchsorted(i, block, side='right').tolist()
+            for k, lo, hi in zip(block.tolist(), starts, stops):
+                if claimed[k]:
+                    continue
+                claimed[k] = True
+                cluster[k] = k
+                if hi > lo:
+                    members = j[lo:hi]
+                    members = members[~claimed[members]]
+                    claimed[members], cluster[members], is_mainshock[members] = True, k, False
+    return _finish(MyCat, valid, cluster, is_mainshock, "Gardner-Knopoff")
+
+
+def _gardner_knopoff_tile(state, query, params):
+    window, foreshock_fraction = params
+    lon, lat = state['lon'], state['lat']
+    days, km = window(state['Mag'][query])
+    pair_i, pair_j = [], []
+    for k, j in state['grid'].pairs(query, -foreshock_fraction * days * US_PER_DAY, days * US_PER_DAY, km):
+        i = query[k]
+        keep = haversine_km(lon[i], lat[i], lon[j], lat[j]) <= km[k]
+        pair_i.append(i[keep])
+        pair_j.append(j[keep])
+    return pair_i, pair_j
+
+
+# ----------- REASENBERG ---------- #
+@timed()
+def reasenberg(MyCat, rfact=10, xmeff=1.5, xk=0.5, tau_min=1.0, tau_max=10.0, p=0.95, n_workers=None,
+               tilesize=20000, blocksize=100000):
+    """
+    Link-based declustering of Reasenberg (1985), with the usual (ZMAP) parameters.  Going forward in time,
+    each event is linked to the later events within its interaction radius and look-ahead time; linked events
+    join one cluster.  The interaction radius is rfact times the source radius 0.011 * 10^(0.4 M) km (or the
+    source radius of the cluster's largest event, if larger), using hypocentral distances.  The look-ahead time grows
+    from tau_min to tau_max days with the time since, and the magnitude of, the cluster's largest event.
+    The mainshock of a cluster is its largest event.
+
+    :param MyCat: Catalog
+    :param rfact: number of source radii in the interaction radius
+    :param xmeff: effective lower magnitude cutoff of the catalog
+    :param xk: increase of the magnitude cutoff during clusters, as a fraction of the largest magnitude
+    :param tau_min: look-ahead time of events not in a cluster, days
+    :param tau_max: longest look-ahead time, days
+    :param p: probability of seeing the next event in the cluster within the look-ahead time
+    :param n_workers: number of worker processes for the neighbor searches
+    :param tilesize: number of events per tile of work
+    :param blocksize: number of events (in time order) whose neighbors are searched at once
+    :returns: DeclusterResult
+    """
+    valid, columns = _valid_columns(MyCat)
+    Mag, times = columns['Mag'], columns['times']
+    source_km = 0.011 * 10 ** (0.4 * Mag)
+    largest_source_km = float(np.nanmax(source_km, initial=0))
+    search_km = np.fmax(rfact * source_km, largest_source_km)
+    by_time = np.argsort(times, kind='stable')
+    by_time = by_time[np.isfinite(search_km[by_time])]
+
+    # Each cluster is named after one of its events, and remembers its members, size, and largest event.
+    cluster = np.arange(len(times))
+    members, size, largest = {}, np.ones(len(times), dtype=np.int64), np.arange(len(times))
+    mags = np.nan_to_num(Mag, nan=-np.inf)
+    log_p = -math.log(1 - p)
+    with _TileRunner(columns, _cell_size(search_km), n_workers, tilesize) as runner:
+        for start in range(0, len(by_time), blocksize):
+            block = by_time[start:start + blocksize]
+            i, j, dist, lag = runner.map(_reasenberg_tile, block, (rfact, tau_max, largest_source_km))
+            by_event = np.argsort(i, kind='stable')
+            i, j, dist, lag = i[by_event], j[by_event], dist[by_event], lag[by_event] / US_PER_DAY
+            starts = np.searchsorted(i, block, side='left').tolist()
+            stops = np.searchsorted(i, block, side='right').tolist()
+            for k, lo, hi in zip(block.tolist(), starts, stops):
+                if hi == lo:
+                    continue
+                c = cluster[k]
+                if size[c] > 1:
+                    big = largest[c]
+                    deltam = max((1 - xk) * mags[big] - xmeff, 0)
+                    tau = log_p * (times[k] - times[big]) / US_PER_DAY / 10 ** ((deltam - 1) * 2 / 3)
+                    tau = min(max(tau, tau_min), tau_max)
+                    radius = max(rfact * source_km[k], source_km[big])
+                else:
+                    tau, radius = tau_min, rfact * source_km[k]
+                linked = j[lo:hi][(lag[lo:hi] <= tau) & (dist[lo:hi] <= radius)]
+                for other in np.unique(cluster[linked]).tolist():
+                    a, b = cluster[k], other
+                    if a == b:
+                        continue
+                    if size[a] < size[b]:
+                        a, b = b, a
+                    moved = members.pop(b, [b])
+                    cluster[moved] = a
+                    members.setdefault(a, [a]).extend(moved)
+                    size[a] += size[b]
+                    if mags[largest[b]] > mags[largest[a]]:
+                        largest[a] = largest[b]
+    return _finish(MyCat, valid, cluster, _largest_in_clusters(cluster, Mag, times), "Reasenberg")
+
+
+def _reasenberg_tile(state, query, params):
+    rfact, tau_max, largest_source_km = params
+    grid, lon, lat, depth, times = state['grid'], state['lon'], state['lat'], state['depth'], state['times']
+    search_km = np.fmax(rfact * 0.011 * 10 ** (0.4 * state['Mag'][query]), largest_source_km)
+    results = [], [], [], []
+    for k, j in grid.pairs(query, np.zeros(len(query)), np.full(len(query), tau_max * US_PER_DAY), search_km):
+        i = query[k]
+        later = grid.rank[j] > grid.rank[i]
+        k, i, j = k[later], i[later], j[later]
+        dist = np.hypot(haversine_km(lon[i], lat[i], lon[j], lat[j]), np.nan_to_num(depth[j] - depth[i]))
+        keep = dist <= search_km[k]
+        for result, values in zip(results, (i[keep], j[keep], dist[keep], (times[j] - times[i])[keep])):
+            result.append(values)
+    return results
+
+
+# ----------- NEAREST NEIGHBOR ---------- #
+@timed()
+def nearest_neighbor(MyCat, b=1.0, d_f=1.6, eta0=None, max_distance_km=20.0, max_time_years=0.5,
+                     min_distance_km=0.01, max_candidates=None, n_workers=None, tilesize=20000):
+    """
+    Nearest-neighbor declustering of Zaliapin and Ben-Zion (2013).  Each event's nearest neighbor is the earlier
+    event i minimizing eta = t * r^d_f * 10^(-b * M_i) (t in years, r in km).  Events with eta < eta0 are linked to
+    their nearest neighbor, and linked events form clusters, whose mainshock is their largest event.
+    Neighbors are searched within max_distance_km and max_time_years; events with no earlier event in that range
+    have eta = inf and are background events (widen the range for sparse catalogs).
+    By default the search is exact, and its cost grows with the square of the catalog's density.  With
+    max_candidates (16 is a good value for large catalogs), the search is bounded like the windows of the other
+    methods: in each grid cell (about half of max_distance_km wide) and each magnitude band (one magnitude unit
+    wide), only the max_candidates latest earlier events are candidates.  The search is then linear in the number of
+    events.  It is exact as long as no cell and band has more than max_candidates events in the time window, and
+    otherwise can only miss older, small, and distant neighbors in that cell; a warning gives the number of events
+    whose search was cut short, and whose parent may differ from the exact search.
+    Banding by magnitude keeps a large earlier event among the candidates after many small ones.
+
+    :param MyCat: Catalog
+    :param b: Gutenberg-Richter b-value
+    :param d_f: fractal dimension of epicenters
+    :param eta0: threshold on eta; default: the crossing point of a two-Gaussian fit to log10(eta)
+    :param max_distance_km: search radius for neighbors
+    :param max_time_years: search window for neighbors
+    :param min_distance_km: distances are floored at this value (location uncertainty)
+    :param max_candidates: optional cap on the candidate neighbors per grid cell and magnitude band (see above)
+    :param n_workers: number of worker processes for the neighbor searches
+    :param tilesize: number of events per tile of work
+    :returns: DeclusterResult, with the nearest neighbor (parent) and eta of each event
+    """
+    valid, columns = _valid_columns(MyCat)
+    Mag, times = columns['Mag'], columns['times']
+    nbands = 1
+    if max_candidates is not None:
+        columns['groups'], nbands = _magnitude_bands(Mag, NN_MAGNITUDE_STEP)
+    params = (b, d_f, max_distance_km, max_time_years * US_PER_YEAR, min_distance_km, nbands, max_candidates)
+    with _TileRunner(columns, max_distance_km / 2, n_workers, tilesize) as runner:
+        children, parents, etas, truncated = runner.map(_nearest_neighbor_tile, np.arange(len(times)), params)
+    if len(truncated) > 0:
+        logger.warning("Nearest-neighbor search: max_candidates=%d dropped candidates of %d of %d events; their "
+                       "parents may differ from the exact search (max_candidates=None)", max_candidates,
+                       len(truncated), len(times))
+    parent = np.full(len(times), -1, dtype=np.int64)
+    eta = np.full(len(times), np.inf)
+    parent[children], eta[children] = parents, etas
+    if eta0 is None:
+        eta0 = estimate_eta_threshold(eta)
+    logger.info("Nearest-neighbor threshold: log10(eta0) = %.2f", np.log10(eta0))
+
+    # Parents are always earlier in time, so following the links leads to the first event of each cluster.
+    cluster = np.where(eta < eta0, parent, np.arange(len(times)))
+    while True:
+        next_cluster = cluster[cluster]
+        if np.array_equal(next_cluster, cluster):
+            break
+        cluster = next_cluster
+    result = _finish(MyCat, valid, cluster, _largest_in_clusters(cluster, Mag, times), "Nearest-neighbor")
+    full_parent = np.full(len(MyCat), -1, dtype=np.int64)
+    full_parent[valid] = np.where(parent >= 0, valid[np.maximum(parent, 0)], -1)
+    full_eta = np.full(len(MyCat), np.inf)
+    full_eta[valid] = eta
+    return result._replace(parent=full_parent, eta=full_eta)
+
+
+def _magnitude_bands(Mag, step):
+    """
+    Band number of each magnitude, in bands of width step.  Events without a magnitude go in a last band of their
+    own, which is never searched.
+
+    :returns: array of band numbers, and the number of bands with magnitudes
+    """
+    finite = ~np.isnan(Mag)
+    bands = np.zeros(len(Mag), dtype=np.int64)
+    if np.any(finite):
+        bands[finite] = np.floor((Mag[finite] - Mag[finite].min()) / step)
+    nbands = int(bands[finite].max()) + 1 if np.any(finite) else 0
+    bands[~finite] = nbands
+    return bands, nbands
+
+
+def _nearest_neighbor_tile(state, query, params):
+    b, d_f, max_distance_km, max_time_us, min_distance_km, nbands, max_candidates = params
+    grid, lon, lat, Mag, times = state['grid'], state['lon'], state['lat'], state['Mag'], state['times']
+    best_j, best_eta = np.full(len(query), -1, dtype=np.int64), np.full(len(query), np.inf)
+    truncated = np.zeros(len(query), dtype=bool)
+    lower, upper = np.full(len(query), -max_time_us), np.full(len(query), -1)
+    radius = np.full(len(query), max_distance_km)
+    for band in range(nbands):
+        for k, j in grid.pairs(query, lower, upper, radius, band, max_candidates, truncated):
+            i = query[k]
+            dist = haversine_km(lon[i], lat[i], lon[j], lat[j])
+            keep = (dist <= max_distance_km) & ~np.isnan(Mag[j])
+            k, i, j, dist = k[keep], i[keep], j[keep], dist[keep]
+            eta = (times[i] - times[j]) / US_PER_YEAR * np.maximum(dist, min_distance_km) ** d_f * 10 ** (-b * Mag[j])
+            _keep_nearest(k, j, eta, best_j, best_eta)
+    found = best_j >= 0
+    return [query[found]], [best_j[found]], [best_eta[found]], [query[truncated]]
+
+
+def _keep_nearest(k, j, eta, best_j, best_eta):
+    """
+    For each query position k, replace (best_j[k], best_eta[k]) by the pair of k with the smallest eta, if that is
+    smaller (the first such pair, in a tie).
+    """
+    smallest = np.full(len(best_eta), np.inf)
+    np.minimum.at(smallest, k, eta)
+    winners = np.flatnonzero((eta == smallest[k]) & (eta < best_eta[k]))
+    ks, first = np.unique(k[winners], return_index=True)
+    best_j[ks], best_eta[ks] = j[winners[first]], eta[winners[first]]
+    return
+
+
+def estimate_eta_threshold(eta, iterations=100, bin_width=0.01):
+    """
+    Threshold between clustered and background events: where the two components of a two-Gaussian mixture
+    fit to log10(eta) are equally likely.  The fit runs on a histogram of log10(eta), so its cost does not grow
+    with the number of events.
+
+    :param eta: array of nearest-neighbor distances (inf and 0 are ignored)
+    :param iterations: number of expectation-maximization steps
+    :param bin_width: histogram bin width, in log10(eta)
+    :returns: eta0
+    """
+    x = np.log10(eta[np.isfinite(eta) & (eta > 0)])
+    if len(x) < 2 or np.ptp(x) == 0:
+        return 10 ** np.median(x) if len(x) else 1.0
+    counts, edges = np.histogram(x, bins=max(int(np.ceil(np.ptp(x) / bin_width)), 1))
+    x, counts = (edges[:-1] + edges[1:])[counts > 0] / 2, counts[counts > 0]
+    mu, sigma, weight = np.percentile(np.repeat(x, counts), [10, 90]), np.full(2, _weighted_std(x, counts) / 2), \
+        np.full(2, 0.5)
+    for _ in range(iterations):
+        density = weight / sigma * np.exp(-0.5 * ((x[:, None] - mu) / sigma) ** 2)
+        resp = counts[:, None] * density / np.maximum(density.sum(axis=1, keepdims=True), 1e-300)
+        nk = np.maximum(resp.sum(axis=0), 1e-12)
+        weight, mu = nk / counts.sum(), (resp * x[:, None]).sum(axis=0) / nk
+        sigma = np.maximum(np.sqrt((resp * (x[:, None] - mu) ** 2).sum(axis=0) / nk), 1e-3)
+    grid = np.linspace(mu.min(), mu.max(), 1001)
+    density = weight / sigma * np.exp(-0.5 * ((grid[:, None] - mu) / sigma) ** 2)
+    return 10 ** grid[np.argmin(np.abs(density[:, 0] - density[:, 1]))]
+
+
+def _weighted_std(x, weights):
+    mean = np.average(x, weights=weights)
+    return np.sqrt(np.average((x - mean) ** 2, weights=weights))
+
+
+# ----------- SHARED MACHINERY ---------- #
+def decluster(MyCat, method='gardner_knopoff', **kwargs):
+    """
+    :param MyCat: Catalog
+    :param method: 'gardner_knopoff', 'reasenberg', or 'nearest_neighbor'
+    :param kwargs: passed on to the method
+    :returns: DeclusterResult
+    """
+    methods = {'gardner_knopoff': gardner_knopoff, 'reasenberg': reasenberg, 'nearest_neighbor': nearest_neighbor}
+    return methods[method](MyCat, **kwargs)
+
+
+def _valid_columns(MyCat):
+    """Indices of the events with a time and epicenter, and their columns (times as int64 microseconds)."""
+    valid = np.flatnonzero(~np.isnat(MyCat.dt) & ~np.isnan(MyCat.lon) & ~np.isnan(MyCat.lat))
+    columns = {'lon': MyCat.lon[valid], 'lat': MyCat.lat[valid], 'depth': MyCat.depth[valid],
+               'Mag': MyCat.Mag[valid], 'times': MyCat.dt[valid].astype(np.int64)}
+    return valid, columns
+
+
+def _cell_size(radius_km, quantile=95, min_km=1.0):
+    """Grid cells as wide as most search radii; the few larger searches look at more rings of cells."""
+    radius_km = radius_km[np.isfinite(radius_km)]
+    return max(float(np.percentile(radius_km, quantile)) if len(radius_km) else min_km, min_km)
+
+
+def _make_state(columns, cell_km):
+    """The columns and SpaceTimeGrid (grouped by columns['groups'], if given) that tile functions work on."""
+    grid = SpaceTimeGrid(columns['lon'], columns['lat'], columns['times'], cell_km, columns.get('groups'))
+    return dict(columns, grid=grid)
+
+
+def _init_worker(columns, cell_km):
+    _worker_state.clear()
+    _worker_state.update(_make_state(columns, cell_km))
+
+
+def _run_in_worker(tile_function, query, params):
+    return tile_function(_worker_state, query, params)
+
+
+class _TileRunner:
+    """
+    Runs tile functions over spatial tiles of query events, in this process or on a process pool that is
+    started once and reused.  Tile functions take (state, query, params), where state holds the columns and the
+    SpaceTimeGrid, and return a tuple of lists of arrays, which are concatenated.
+    """
+    def __init__(self, columns, cell_km, n_workers=None, tilesize=20000):
+        self.state = _make_state(columns, cell_km)
+        self.tilesize = tilesize
+        self.executor = None
+        if n_workers:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                                                   initargs=(columns, cell_km))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def map(self, tile_function, queries, params):
+        tiles = self.state['grid'].tiles(queries, self.tilesize) or [queries]
+        if self.executor is None or len(tiles) < 2:
+            results = [tile_function(self.state, tile, params) for tile in tiles]
+        else:
+            results = list(self.executor.map(_run_in_worker, [tile_function] * len(tiles), tiles,
+                                             [params] * len(tiles)))
+        return [np.concatenate([array for result in results for array in result[n]])
+                if any(len(result[n]) for result in results) else np.zeros(0, dtype=np.int64)
+                for n in range(len(results[0]))]
+
+
+def _largest_in_clusters(cluster, Mag, times):
+    """Mask of the largest event of each cluster (the earliest one, in case of ties)."""
+    order = np.lexsort((times, -np.nan_to_num(Mag, nan=-np.inf), cluster))
+    first = order[np.r_[True, cluster[order][1:] != cluster[order][:-1]]] if len(order) else order
+    is_mainshock = np.zeros(len(cluster), dtype=bool)
+    is_mainshock[first] = True
+    return is_mainshock
+
+
+def _finish(MyCat, valid, cluster, is_mainshock, name):
+    """Expand results on the valid events to the whole catalog, and number the clusters 0, 1, 2, ..."""
+    full_cluster = np.empty(len(MyCat), dtype=np.int64)
+    full_mainshock = np.ones(len(MyCat), dtype=bool)  # events without a time or epicenter are left alone
+    unique_clusters, full_cluster[valid] = np.unique(cluster, return_inverse=True)
+    invalid = np.setdiff1d(np.arange(len(MyCat)), valid)
+    full_cluster[invalid] = len(unique_clusters) + np.arange(len(invalid))
+    full_mainshock[valid] = is_mainshock
+    logger.info("%s declustering: keeping %d mainshocks, removing %d dependent events", name,
+                np.sum(full_mainshock), len(MyCat) - np.sum(full_mainshock))
+    return DeclusterResult(full_cluster, full_mainshock)
@@ -1,12 +1,23 @@
 """
-The earthquake catalog format. Each of these fields are single values; a catalog is a list of earthquakes. 
+The earthquake catalog format. Each of these fields are single values; a catalog is a collection of earthquakes,
+stored internally as one numpy array per field.
 """
 from Tectonic_Utils.seismo import moment_calculations
+import numpy as np
 import datetime as dt
+from .instrumentation import logger, timed
+
+DT_DTYPE = 'datetime64[us]'  # storage type of the catalog's time column
 
 
 class Catalog_EQ:
-    """ The individual earthquake object that gets compiled into a list of objects (a Catalog)"""
+    """
+    The individual earthquake object that gets compiled into a list of objects (a Catalog).
+    A compact record with fixed fields (no per-instance __dict__).  The bbox belongs to the catalog; events built
+    from a Catalog all refer to that one list rather than holding their own copy.
+    """
+    __slots__ = ('dt', 'lon', 'lat', 'depth', 'Mag', 'strike', 'dip', 'rake', 'catname', 'bbox')
+
     def __init__(self, dt, lon, lat, depth, Mag, strike=None, dip=None, rake=None, catname='', bbox=None):
         self.dt = dt
         self.lon = lon
@@ -44,83 +55,499 @@ class Catalog_EQ:
             return 0
 
 
+def _to_datetime64(time):
+    """Convert a datetime (or datetime64) into the catalog's time storage type."""
+    return np.datetime64(time, 'us')
+
+
+def _float_column(values, n):
+    """Turn a column of values into a float array of length n; None entries (or a None column) become NaN."""
+    if values is None:
+        return np.full(n, np.nan)
+    return np.asarray(values, dtype=float)
+
+
+def _none_for_nan(column):
+    """Turn a float column into a list, with NaN entries converted back into None."""
+    return [None if x != x else x for x in column.tolist()]
+
+
+def _encode_catnames(catnames):
+    """Store a list of catalog names as categorical codes into a tuple of unique names."""
+    if len(catnames) == 0:
+        return np.zeros(0, dtype=np.int32), ()
+    categories, codes = np.unique(np.array(catnames, dtype=object), return_inverse=True)
+    return codes.astype(np.int32).ravel(), tuple(categories)
+
+
+def range_mask(ranges, n, chunksize=65536):
+    """
+    Combine several inclusive range filters into one boolean mask, in a single blocked pass over the data.
+    All predicates are applied to one block of events before moving on to the next, so the temporaries stay small.
+
+    :param ranges: list of (column, lower, upper); a None bound is open. Time columns take datetimes as bounds.
+    :param n: number of events
+    :param chunksize: number of events per block
+    :returns: boolean array of length n
+    """
+    ranges = [(column, _bound(column, lower), _bound(column, upper)) for column, lower, upper in ranges]
+    mask = np.ones(n, dtype=bool)
+    for start in range(0, n, chunksize):
+        block = mask[start:start+chunksize]
+        for column, lower, upper in ranges:
+            values = column[start:start+chunksize]
+            if lower is not None:
+                block &= values >= lower
+            if upper is not None:
+                block &= values <= upper
+    return mask
+
+
+def _column_property(name, doc):
+    """
+    A catalog column as a property. Assigning a new array to the column drops the catalog's cached structures;
+    after modifying the array in place, call invalidate_cache().
+    """
+    attribute = '_' + name
+
+    def getter(self):
+        return getattr(self, attribute)
+
+    def setter(self, values):
+        setattr(self, attribute, values)
+        self._cache = {}
+    return property(getter, setter, doc=doc)
+
+
+def _bound(column, value):
+    if value is None or column.dtype.kind != 'M':
+        return value
+    return _to_datetime64(value)
+
+
 class Catalog:
     """
     The main Catalog object.
+    Events are stored column-by-column in numpy arrays (times as datetime64, everything else as floats, with NaN
+    standing in for missing values). Indexing with an integer returns a Catalog_EQ view of that event, so code that
+    loops over a Catalog keeps working. Indexing with a slice, a boolean mask, or an index array returns a new Catalog.
     """
-    def __init__(self, catalog):
-        self.catalog = catalog  # a list of earthquake objects
+    def __init__(self, catalog=None, bbox=None):
+        """
+        :param catalog: list of Catalog_EQ objects (or another Catalog)
+        :param bbox: optional bounding box [lonW, lonE, latS, latN, depthT, depthB, t0, t1] shared by the catalog
+        """
+        if catalog is None:
+            catalog = []
+        if isinstance(catalog, Catalog):
+            self._set_columns(catalog.dt, catalog.lon, catalog.lat, catalog.depth, catalog.Mag, catalog.strike,
+                              catalog.dip, catalog.rake, catalog._catname_codes, catalog._catname_categories)
+            self.bbox = catalog.bbox if bbox is None else bbox
+            return
+        dtarray = np.array([eq.dt for eq in catalog], dtype=DT_DTYPE)
+        lon = np.array([eq.lon for eq in catalog], dtype=float)
+        lat = np.array([eq.lat for eq in catalog], dtype=float)
+        depth = np.array([eq.depth for eq in catalog], dtype=float)
+        Mag = np.array([eq.Mag for eq in catalog], dtype=float)
+        strike = np.array([eq.strike for eq in catalog], dtype=float)
+        dip = np.array([eq.dip for eq in catalog], dtype=float)
+        rake = np.array([eq.rake for eq in catalog], dtype=float)
+        codes, categories = _encode_catnames([eq.catname for eq in catalog])
+        self._set_columns(dtarray, lon, lat, depth, Mag, strike, dip, rake, codes, categories)
+        if bbox is None and len(catalog) > 0:
+            bbox = catalog[0].bbox
+        self.bbox = bbox
+
+    @classmethod
+    def from_arrays(cls, dt, lon, lat, depth, Mag, strike=None, dip=None, rake=None, catname='', bbox=None,
+                    catname_codes=None):
+        """
+        Build a Catalog directly from columns, without creating any Catalog_EQ objects.
+
+        :param dt: array of datetimes (datetime objects or datetime64)
+        :param lon: array of longitudes
+        :param lat: array of latitudes
+        :param depth: array of depths (km), or None
+        :param Mag: array of magnitudes, or None
+        :param strike: array of strikes, or None
+        :param dip: array of dips, or None
+        :param rake: array of rakes, or None
+        :param catname: a single catalog name, or one name per event (or the list of unique names, see below)
+        :param bbox: optional bounding box shared by the catalog
+        :param catname_codes: optional integer array; if given, event i is named catname[catname_codes[i]]
+        :returns: catalog
+        :rtype: Catalog
+        """
+        dt = np.asarray(dt, dtype=DT_DTYPE)
+        n = len(dt)
+        columns = [_float_column(x, n) for x in (lon, lat, depth, Mag, strike, dip, rake)]
+        if catname_codes is not None:
+            codes, categories = np.asarray(catname_codes), catname
+        elif isinstance(catname, str):
+            codes, categories = np.zeros(n, dtype=np.int32), (catname,)
+        else:
+            codes, categories = _encode_catnames(catname)
+        newCat = cls.__new__(cls)
+        newCat._set_columns(dt, *columns, codes, categories)
+        newCat.bbox = bbox
+        return newCat
+
+    @classmethod
+    def concatenate(cls, catalogs, bbox=None):
+        """
+        Stack several catalogs into one, in the order given, directly on the columns.
+
+        :param catalogs: iterable of Catalogs
+        :param bbox: optional bounding box for the result
+        :returns: catalog
+        :rtype: Catalog
+        """
+        catalogs = list(catalogs)
+        if len(catalogs) == 0:
+            return cls(bbox=bbox)
+        categories = []
+        for catalog in catalogs:
+            categories += [x for x in catalog.catname_categories if x not in categories]
+        codes = [np.array([categories.index(x) for x in catalog.catname_categories], dtype=np.int32)[
+                     catalog.catname_codes] for catalog in catalogs]
+        columns = [np.concatenate([getattr(catalog, column) for catalog in catalogs])
+                   for column in ('dt', 'lon', 'lat', 'depth', 'Mag', 'strike', 'dip', 'rake')]
+        return cls.from_arrays(*columns, catname=tuple(categories), catname_codes=np.concatenate(codes), bbox=bbox)
+
+    def _set_columns(self, dt, lon, lat, depth, Mag, strike, dip, rake, catname_codes, catname_categories):
+        self._dt = dt
+        self._lon = lon
+        self._lat = lat
+        self._depth = depth
+        self._Mag = Mag
+        self._strike = strike
+        self._dip = dip
+        self._rake = rake
+        self._catname_codes = catname_codes
+        self._catname_categories = tuple(catname_categories)
+        self._cache = {}  # derived structures (spatial index, etc.), dropped whenever the catalog changes
+
+    def invalidate_cache(self):
+        """
+        Drop derived structures such as the spatial index. Call this after modifying the column arrays in place.
+        """
+        self._cache = {}
 
     def __len__(self):
-        return len(self.catalog)
+        return len(self.dt)
 
     def __getitem__(self, item):
-        return self.catalog[item]
+        if isinstance(item, (int, np.integer)):
+            return self._make_event(item)
+        return self._take(item)
+
+    def __iter__(self):
+        columns = [self.dt.tolist()] + [_none_for_nan(x) for x in (self.lon, self.lat, self.depth, self.Mag,
+                                                                   self.strike, self.dip, self.rake)]
+        categories = self._catname_categories
+        for row, code in zip(zip(*columns), self._catname_codes.tolist()):
+            yield Catalog_EQ(*row, catname=categories[code], bbox=self.bbox)
+
+    dt = _column_property('dt', 'Event times, datetime64[us] (NaT if missing).')
+    lon = _column_property('lon', 'Event longitudes (NaN if missing).')
+    lat = _column_property('lat', 'Event latitudes (NaN if missing).')
+    depth = _column_property('depth', 'Event depths, km (NaN if missing).')
+    Mag = _column_property('Mag', 'Event magnitudes (NaN if missing).')
+    strike = _column_property('strike', 'Focal mechanism strikes, degrees (NaN if missing).')
+    dip = _column_property('dip', 'Focal mechanism dips, degrees (NaN if missing).')
+    rake = _column_property('rake', 'Focal mechanism rakes, degrees (NaN if missing).')
+
+    @property
+    def catalog(self):
+        """
+        The catalog as a tuple of Catalog_EQ objects. It is built on demand, so it can't be appended to or
+        modified in place; build a new Catalog instead.
+        """
+        return tuple(self)
+
+    @property
+    def catname_codes(self):
+        """Integer code of each event's catalog name; see catname_categories."""
+        return self._catname_codes
+
+    @property
+    def catname_categories(self):
+        """Tuple of the unique catalog names in the catalog."""
+        return self._catname_categories
+
+    @property
+    def catnames(self):
+        """Array of the catalog name of each event."""
+        return np.array(self._catname_categories, dtype=object)[self._catname_codes]
+
+    def _make_event(self, i):
+        def _value(column):
+            value = column[i]
+            return None if np.isnan(value) else float(value)
+        return Catalog_EQ(dt=self.dt[i].item(), lon=_value(self.lon), lat=_value(self.lat), depth=_value(self.depth),
+                          Mag=_value(self.Mag), strike=_value(self.strike), dip=_value(self.dip),
+                          rake=_value(self.rake), catname=self._catname_categories[self._catname_codes[i]],
+                          bbox=self.bbox)
+
+    def _take(self, idx, bbox=None):
+        """
+        Return a new Catalog holding the events selected by a slice, boolean mask, or index array.
+        Slices (and index arrays covering a contiguous run of non-negative indices) give views onto the same arrays,
+        without copying.
+        """
+        if (isinstance(idx, np.ndarray) and idx.dtype != bool and len(idx) > 0 and idx[0] >= 0 and
+                idx[-1] - idx[0] + 1 == len(idx)):
+            if np.all(np.diff(idx) == 1):
+                idx = slice(int(idx[0]), int(idx[-1]) + 1)
+        newCat = Catalog.__new__(Catalog)
+        newCat._set_columns(self.dt[idx], self.lon[idx], self.lat[idx], self.depth[idx], self.Mag[idx],
+                            self.strike[idx], self.dip[idx], self.rake[idx], self._catname_codes[idx],
+                            self._catname_categories)
+        newCat.bbox = self.bbox if bbox is None else bbox
+        return newCat
+
+    def _filter_ranges(self, bbox=None, starttime=None, endtime=None, Mc=None):
+        """
+        Translate filter arguments into a list of (column, lower, upper) ranges. None means an open bound.
+        """
+        ranges = []
+        if bbox is not None:
+            ranges += [(self.lon, bbox[0], bbox[1]), (self.lat, bbox[2], bbox[3])]
+            if len(bbox) > 4:
+                ranges.append((self.depth, bbox[4], bbox[5]))
+            if len(bbox) > 6:
+                ranges.append((self.dt, bbox[6], bbox[7]))
+        if starttime is not None or endtime is not None:
+            ranges.append((self.dt, starttime, endtime))
+        if Mc is not None:
+            ranges.append((self.Mag, Mc, None))
+        return ranges
+
+    def make_mask(self, bbox=None, starttime=None, endtime=None, Mc=None):
+        """
+        Evaluate several filters at once as a single boolean mask over the catalog. Bounds are inclusive.
+
+        :param bbox: bounding box [lon0, lon1, lat0, lat1, depth0, depth1, optionally t1, t2].  t1/t2 could be None.
+                     A 4-element [lon0, lon1, lat0, lat1] box only filters on location (e.g. for tremor catalogs).
+        :param starttime: dt object, or None
+        :param endtime: dt object, or None
+        :param Mc: minimum magnitude, or None
+        :returns: boolean array, one element per event
+        """
+        return range_mask(self._filter_ranges(bbox, starttime, endtime, Mc), len(self))
+
+    def select(self, bbox=None, starttime=None, endtime=None, Mc=None):
+        """
+        Same as make_mask, but return the indices of the selected events.
+
+        :returns: array of integer indices
+        """
+        ranges = self._filter_ranges(bbox, starttime, endtime, Mc)
+        time_ranges = [(lower, upper) for column, lower, upper in ranges if column is self.dt]
+        if len(time_ranges) == 0 or not self.is_time_sorted:
+            return np.flatnonzero(range_mask(ranges, len(self)))
+        # On a time-sorted catalog, the time window is a contiguous run found by binary search.
+        lo, hi = 0, len(self)
+        for lower, upper in time_ranges:
+            window = self._time_window_positions(lower, upper)
+            lo, hi = max(lo, window[0]), min(hi, window[1])
+        hi = max(lo, hi)
+        other_ranges = [(column[lo:hi], lower, upper) for column, lower, upper in ranges if column is not self.dt]
+        return lo + np.flatnonzero(range_mask(other_ranges, hi - lo))
+
+    @timed()
+    def restrict(self, bbox=None, starttime=None, endtime=None, Mc=None):
+        """
+        Restrict an earthquake catalog by region, time window, and magnitude in one pass. See make_mask.
+
+        :returns: catalog
+        :rtype: Catalog
+        """
+        newCat = self._take(self.select(bbox, starttime, endtime, Mc))
+        logger.info("-->Returning %d out of %d events", len(newCat), len(self))
+        return newCat
+
+    @property
+    def spatial_index(self):
+        """
+        Grid index on event locations, built the first time it is needed and rebuilt if the catalog changes.
+
+        :returns: GridIndex
+        """
+        from .spatial_index import GridIndex
+        index = self._cache.get('spatial_index')
+        if index is None or not index.is_current(self.lon, self.lat):
+            index = GridIndex(self.lon, self.lat)
+            self._cache['spatial_index'] = index
+        return index
+
+    @timed()
+    def restrict_radius(self, lon, lat, radius_km):
+        """
+        Restrict an earthquake catalog to events within a great-circle distance of a point.
+
+        :param lon: longitude of the center
+        :param lat: latitude of the center
+        :param radius_km: radius, in km
+        :returns: catalog
+        :rtype: Catalog
+        """
+        idx, _ = self.spatial_index.query_radius(lon, lat, radius_km)
+        return self._take(idx)
+
+    @timed()
+    def nearest_events(self, lon, lat, k):
+        """
+        Find the k events nearest to a point.
+
+        :param lon: longitude of the point
+        :param lat: latitude of the point
+        :param k: number of events
+        :returns: catalog of the k nearest events (closest first), array of their distances in km
+        """
+        idx, distances = self.spatial_index.query_knn(lon, lat, k)
+        return self._take(idx), distances
+
+    def query(self):
+        """
+        Start a lazy query on this catalog, e.g. cat.query().box(bbox).mag_above(2.0).between(t0, t1).collect()
+
+        :returns: CatalogQuery
+        """
+        from .catalog_query import CatalogQuery
+        return CatalogQuery(self)
+
+    @timed()
+    def decluster(self, method='gardner_knopoff', **kwargs):
+        """
+        Remove foreshocks and aftershocks. For the cluster labels themselves, see the declustering module.
+
+        :param method: 'gardner_knopoff', 'reasenberg', or 'nearest_neighbor'
+        :param kwargs: parameters of the method
+        :returns: catalog of mainshocks
+        :rtype: Catalog
+        """
+        from .declustering import decluster
+        newCat = self[decluster(self, method, **kwargs).is_mainshock]
+        logger.info("-->Returning %d out of %d events", len(newCat), len(self))
+        return newCat
+
+    # ----------- TIME INDEX ---------- #
+    @property
+    def is_time_sorted(self):
+        """True if events are in time order (checked once, then remembered until the catalog changes)."""
+        if 'is_time_sorted' not in self._cache:
+            self._cache['is_time_sorted'] = bool(np.all(self.dt[1:] >= self.dt[:-1]))
+        return self._cache['is_time_sorted']
+
+    def _time_index(self):
+        """
+        Return the event times in sorted order (NaT last), and the permutation that sorts them
+        (None if the catalog is already time-sorted). Built once and cached.
+        """
+        if 'time_index' not in self._cache:
+            if self.is_time_sorted:
+                self._cache['time_index'] = (self.dt, None)
+            else:
+                order = np.argsort(self.dt, kind='stable')
+                self._cache['time_index'] = (self.dt[order], order)
+        return self._cache['time_index']
+
+    def _time_window_positions(self, starttime=None, endtime=None):
+        """Positions [lo, hi) in the sorted times of the events with starttime <= dt <= endtime, by binary search."""
+        times, _ = self._time_index()
+        n_valid = np.searchsorted(times, np.datetime64('NaT'), side='left')
+        lo = 0 if starttime is None else np.searchsorted(times[:n_valid], _to_datetime64(starttime), side='left')
+        hi = n_valid if endtime is None else np.searchsorted(times[:n_valid], _to_datetime64(endtime), side='right')
+        if starttime is None and endtime is None:
+            hi = len(times)
+        return int(lo), int(max(lo, hi))
+
+    def time_window_indices(self, starttime=None, endtime=None):
+        """
+        Indices of the events with starttime <= dt <= endtime, found by binary search on the sorted time index.
+
+        :param starttime: dt object, or None
+        :param endtime: dt object, or None
+        :returns: sorted array of integer indices
+        """
+        lo, hi = self._time_window_positions(starttime, endtime)
+        _, order = self._time_index()
+        if order is None:
+            return np.arange(lo, hi)
+        return np.sort(order[lo:hi])
 
+    @timed()
+    def sort_by_time(self):
+        """
+        :returns: a time-sorted copy of the catalog (or the catalog itself, if it is already sorted)
+        :rtype: Catalog
+        """
+        _, order = self._time_index()
+        if order is None:
+            return self
+        newCat = self._take(order)
+        newCat._cache['is_time_sorted'] = True
+        return newCat
+
+    @timed()
     def restrict_cat_times(self, starttime, endtime):
         """
         Filter a catalog based on starttime and endtime
 
         :param starttime: dt object
         :param endtime:  dt object
-        :return: list of eq items
-        """
-        MyCat = []
-        for item in self.catalog:
-            if item.is_within_bbox(starttime, endtime):
-                MyCat.append(item)
-        newCat = Catalog(MyCat)
-        print(f"-->Returning {len(newCat)} out of {len(self.catalog)} events")
+        :return: catalog
+        :rtype: Catalog
+        """
+        newCat = self._take(self.time_window_indices(starttime, endtime))
+        logger.info("-->Returning %d out of %d events", len(newCat), len(self))
         return newCat
 
+    @timed()
     def restrict_above_Mc(self, Mc):
         """
-        Restrict an earthquake catalog to above a certain magnitude. Not working on FMs at the moment
+        Restrict an earthquake catalog to above a certain magnitude.
 
-        :param Mc: minimum magnitude
-        :type Mc: float
+        :param Mc: minimum magnitude, or the name of a method that estimates it ('maxc', 'gft', or 'mbs';
+                   see magnitude_statistics.estimate_mc).  Raises ValueError if the method can't estimate Mc.
+        :type Mc: float or string
         :returns: catalog
         :rtype: Catalog
         """
-        print("Restricting catalog to above Mc", Mc)
-        MyCat = []
-        for item in self.catalog:
-            if item.Mag >= Mc:
-                MyCat.append(item)
-        return Catalog(MyCat)
+        if isinstance(Mc, str):
+            from .magnitude_statistics import estimate_mc
+            method, Mc = Mc, estimate_mc(self.Mag, method=Mc)
+            if np.isnan(Mc):
+                raise ValueError("Could not estimate Mc with method %s from %d magnitudes" %
+                                 (method, np.count_nonzero(~np.isnan(self.Mag))))
+        logger.info("Restricting catalog to above Mc %s", Mc)
+        return self._take(self.select(Mc=Mc))
 
+    @timed()
     def restrict_cat_box(self, bbox):
         """
-        Restrict an earthquake catalog to a certain region. Not working on FMs at the moment
+        Restrict an earthquake catalog to a certain region.
 
         :param bbox: bounding box [lon0, lon1, lat0, lat1, depth0, depth1, optionally t1, t2].  t1/t2 could be None.
         :type bbox: list
         :returns: bounded catalog
         :rtype: Catalog
         """
-        print("Restricting catalog to box ", bbox)
-        if len(bbox) == 6:
-            # If times are not specified, then we keep time bounds of the original catalog.
-            dtarray = [eq.dt for eq in self.catalog]
-            bbox.append(min(dtarray))
-            bbox.append(max(dtarray))
-        else:  # if time is not specified because t1 or t2 are None:
-            dtarray = [eq.dt for eq in self.catalog]
-            if bbox[6] is None:
-                bbox[6] = min(dtarray)
-            if bbox[7] is None:
-                bbox[7] = max(dtarray)
-        MyCat = []
-        for item in self.catalog:
-            if item.is_within_bbox(bbox):
-                new_Event = Catalog_EQ(dt=item.dt, lon=item.lon, lat=item.lat, depth=item.depth, Mag=item.Mag,
-                                       strike=item.strike, rake=item.rake, dip=item.dip, catname=item.catname,
-                                       bbox=bbox)
-                MyCat.append(new_Event)
-        newCat = Catalog(MyCat)
-        print(f"-->Returning {len(newCat)} out of {len(self.catalog)} events")
+        logger.info("Restricting catalog to box %s", bbox)
+        newCat = self._take(self.select(bbox=bbox), bbox=self._complete_bbox(bbox))
+        logger.info("-->Returning %d out of %d events", len(newCat), len(self))
         return newCat
 
+    def _complete_bbox(self, bbox):
+        """If times are not specified, then we keep time bounds of the original catalog."""
+        bbox = list(bbox) + [None] * (8 - len(bbox))
+        if bbox[6] is None or bbox[7] is None:
+            starttime, endtime = self.get_start_stop_time()
+            bbox[6] = starttime if bbox[6] is None else bbox[6]
+            bbox[7] = endtime if bbox[7] is None else bbox[7]
+        return bbox
+
     def compute_total_moment(self):
         """
         Compute the total moment released by a seismicity catalog
@@ -128,11 +555,15 @@ class Catalog:
         :returns: total moment in Newton-meters
         :rtype: float
         """
-        total_moment = 0
-        for item in self.catalog:
-            moment_i = moment_calculations.moment_from_mw(item.Mag)
-            total_moment += moment_i
-        return total_moment
+        return float(np.nansum(self.moments()))
+
+    def moments(self):
+        """
+        Seismic moment of every event, computed for the whole magnitude column at once.
+
+        :returns: array of moments in Newton-meters (NaN where magnitude is missing)
+        """
+        return moment_calculations.moment_from_mw(self.Mag)
 
     def get_start_stop_time(self):
         """
@@ -140,10 +571,15 @@ class Catalog:
 
         :return: start (datetime), end (datetime)
         """
-        dtarray = [eq.dt for eq in self.catalog]
-        starttime = min(dtarray)
-        endtime = max(dtarray)
-        return starttime, endtime
+        if 'start_stop_time' not in self._cache:
+            if 'time_index' in self._cache or self.is_time_sorted:
+                times, _ = self._time_index()
+                valid_times = times[:np.searchsorted(times, np.datetime64('NaT'), side='left')]
+                self._cache['start_stop_time'] = (valid_times[0].item(), valid_times[-1].item())
+            else:
+                valid_times = self.dt[~np.isnat(self.dt)]
+                self._cache['start_stop_time'] = (valid_times.min().item(), valid_times.max().item())
+        return self._cache['start_stop_time']
 
     def get_bounding_box(self):
         """
@@ -151,71 +587,121 @@ class Catalog:
 
         :return: bounding box [W, E, S, N]
         """
-        lons = [eq.lon for eq in self.catalog]
-        lats = [eq.lat for eq in self.catalog]
-        bbox = [min(lons), max(lons), min(lats), max(lats)]
-        return bbox
+        if 'bounding_box' not in self._cache:
+            self._cache['bounding_box'] = (float(np.nanmin(self.lon)), float(np.nanmax(self.lon)),
+                                           float(np.nanmin(self.lat)), float(np.nanmax(self.lat)))
+        return list(self._cache['bounding_box'])
+
+    def datetimes(self):
+        """
+        The event times as an array of datetime objects, for plotting libraries that want them.
+        Built once and cached; treat it as read-only.
+
+        :return: object array of datetimes (None for missing times)
+        """
+        if 'datetimes' not in self._cache:
+            self._cache['datetimes'] = self.dt.astype(object)
+        return self._cache['datetimes']
+
+    def magnitude_order(self):
+        """
+        Indices of the events from largest to smallest magnitude (events without magnitude last).
+        Built once and cached; treat it as read-only.
+
+        :return: array of integer indices
+        """
+        if 'magnitude_order' not in self._cache:
+            self._cache['magnitude_order'] = np.argsort(-np.nan_to_num(self.Mag, nan=-np.inf), kind='stable')
+        return self._cache['magnitude_order']
 
     def make_cumulative_moment(self):
         """
         Return time and cumulative moment (N-m) released by a seismicity catalog, as arrays, for a staircase plot
 
         :returns: time array, total moment array
-        :rtype: list of dts, list of moments
-        """
-        dt_total, mo_total = [], []
-        adding_sum = 0
-        dt_total.append(self.catalog[0].dt)
-        mo_total.append(0)
-        for item in self.catalog:
-            dt_total.append(item.dt)
-            mo_total.append(adding_sum)
-            adding_sum = adding_sum + moment_calculations.moment_from_mw(item.Mag)
-            mo_total.append(adding_sum)
-            dt_total.append(item.dt)
-        return dt_total, mo_total
+        :rtype: array of datetime64, array of moments
+        """
+        return self._staircase(np.nan_to_num(self.moments()))
 
     def make_cumulative_stack(self):
         """
         Return time and cumulative EQ number in a seismicity catalog, as arrays, for a staircase plot
 
         :returns: time array, EQ number array
-        :rtype: list of dts, list of number
-        """
-        dt_total, eq_total = [], []
-        adding_sum = 0
-        dt_total.append(self.catalog[0].dt)
-        eq_total.append(0)
-        for item in self.catalog:
-            dt_total.append(item.dt)
-            eq_total.append(adding_sum)
-            adding_sum = adding_sum + 1
-            eq_total.append(adding_sum)
-            dt_total.append(item.dt)
-        return dt_total, eq_total
-
-    def make_simple_seismicity_rates(self, window=5):
+        :rtype: array of datetime64, array of numbers
+        """
+        return self._staircase(np.ones(len(self), dtype=np.int64))
+
+    def _staircase(self, increments):
+        """
+        Staircase of a cumulative sum in catalog order: one riser per event, starting from zero at the first event.
+        """
+        total = np.cumsum(increments)
+        before = np.concatenate([np.zeros(1, dtype=total.dtype), total[:-1]])
+        dt_total = np.concatenate([self.dt[:1], np.repeat(self.dt, 2)])
+        sum_total = np.concatenate([np.zeros(1, dtype=total.dtype), np.column_stack([before, total]).ravel()])
+        return dt_total, sum_total
+
+    def _rate_bins(self, window, step, units):
+        """
+        Time bins for rate series. Bins start every `step` from the start of the catalog and are `window` long;
+        the last bin ends at the end of the catalog.
+
+        :returns: left edges, right edges (datetime64 arrays), window length (timedelta64)
+        """
+        unit_us = {'days': 86400e6, 'hours': 3600e6}[units]
+        window_us = np.timedelta64(int(round(window * unit_us)), 'us')
+        step_us = window_us if step is None else np.timedelta64(int(round(step * unit_us)), 'us')
+        start_time, end_time = [_to_datetime64(x) for x in self.get_start_stop_time()]
+        nsteps = int(np.ceil((end_time - start_time) / step_us))
+        left_edges = start_time + step_us * np.arange(nsteps + 1)
+        right_edges = left_edges + window_us
+        right_edges[-1] = end_time
+        return left_edges, right_edges, window_us
+
+    @timed()
+    def make_simple_seismicity_rates(self, window=5, step=None, units='days'):
         """
         Reduce a catalog into a time array and an array of earthquakes/day, averaged over a certain window.
+        Bins start every `step` from the start of the catalog and are `window` long, so step < window gives
+        overlapping (sliding) windows. As before, the last bin ends at the end of the catalog.
 
-        :param window: number of days
-        :type window: int
-        :return: time series of events
-        """
-        dtarray_eqs = [item.dt for item in self.catalog]
-        start_time, end_time = self.get_start_stop_time()
-        target_time = start_time
-        boundary_times = [start_time]
-        while target_time < end_time:
-            target_time = target_time + dt.timedelta(days=window)
-            boundary_times.append(target_time)
-        boundary_times.append(end_time)
-
-        # Find the earthquakes between each boundary time
-        dtarray_rates, rates = [], []   # will have the same dimension
-        for i in range(0, len(boundary_times)-1):
-            dtarray_rates.append(boundary_times[i] + dt.timedelta(days=window/2))  # the center of the bin
-            bin_eqs = [date for date in dtarray_eqs if boundary_times[i] <= date < boundary_times[i+1]]   # eqs in bin
-            rates.append(len(bin_eqs) / window)  # rates in eq/day
+        :param window: length of each bin, in units
+        :type window: float
+        :param step: spacing between the starts of consecutive bins, in units. Default: same as window.
+        :type step: float
+        :param units: 'days' or 'hours'
+        :type units: string
+        :return: time series of events (bin centers), rates in earthquakes per unit (day or hour)
+        """
+        left_edges, right_edges, window_us = self._rate_bins(window, step, units)
 
+        # Count the earthquakes in each [left, right) bin by binary search into the sorted times
+        times, _ = self._time_index()
+        counts = np.searchsorted(times, right_edges, side='left') - np.searchsorted(times, left_edges, side='left')
+        dtarray_rates = (left_edges + window_us // 2).tolist()  # the center of the bin
+        rates = (np.maximum(counts, 0) / window).tolist()  # rates in eq/unit
         return dtarray_rates, rates
+
+    @timed()
+    def make_moment_rates(self, window=5, step=None, units='days'):
+        """
+        Reduce a catalog into a time array and an array of moment release rate, averaged over a certain window.
+        Uses the same bins as make_simple_seismicity_rates.
+
+        :param window: length of each bin, in units
+        :param step: spacing between the starts of consecutive bins, in units. Default: same as window.
+        :param units: 'days' or 'hours'
+        :return: time series (bin centers), moment rates in N-m per unit (day or hour)
+        """
+        left_edges, right_edges, window_us = self._rate_bins(window, step, units)
+        times, order = self._time_index()
+        moments = np.nan_to_num(self.moments())
+        if order is not None:
+            moments = moments[order]
+        cumulative = np.concatenate([[0], np.cumsum(moments)])
+        lo = np.searchsorted(times, left_edges, side='left')
+        hi = np.maximum(np.searchsorted(times, right_edges, side='left'), lo)
+        dtarray_rates = (left_edges + window_us // 2).tolist()  # the center of the bin
+        moment_rates = ((cumulative[hi] - cumulative[lo]) / window).tolist()
+        return dtarray_rates, moment_rates
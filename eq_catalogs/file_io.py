@@ -3,140 +3,272 @@
 
 import numpy as np
 import datetime as dt
+import re
 import csv
+import io
+import os
+import time
+import gzip
+import json
+import shutil
+import hashlib
+import contextlib
+import collections
+import concurrent.futures
 from .eqcat_object import Catalog_EQ, Catalog
+from .instrumentation import logger, timed
 import xml.etree.ElementTree as et
-import pandas
 
 
-def input_qtm(filename):
+QTM_COLUMNS = [0, 1, 2, 3, 4, 7, 8, 9, 10]
+SHEARER_COLUMNS = [0, 1, 2, 3, 4, 5, 7, 8, 9, 10]
+DEFAULT_CHUNKSIZE = 100000
+
+
+@timed(reads_file=True)
+def input_qtm(filename, n_workers=None):
     """
     Input the txt file format of Ross et al. (2019)'s QTM catalog
     downloaded from https://scedc.caltech.edu/research-tools/altcatalogs.html
+    Columns are parsed in bulk; times are kept to the minute, as in the original reader.
+
+    :param filename: string
+    :param n_workers: if given, parse byte ranges of the file on a process pool of this size
     """
-    print("Reading file %s " % filename)
-    print(dt.datetime.now())
-    MyCat = []
+    logger.info("Reading file %s", filename)
+    columns = read_whitespace_columns(filename, usecols=QTM_COLUMNS, skip_header=1, n_workers=n_workers)
+    MyCat = _qtm_catalog_from_columns(columns)
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_qtm(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """
+    Read a QTM catalog file in chunks of events, keeping only the events that pass the filters.
+    Memory use is bounded by the chunk size, not by the size of the file.
+
+    :param filename: string
+    :param chunksize: number of lines parsed at a time
+    :param filters: bbox, starttime, endtime, Mc; see Catalog.make_mask
+    :returns: generator of Catalogs
+    """
+    for columns in iter_whitespace_columns(filename, usecols=QTM_COLUMNS, skip_header=1, chunksize=chunksize):
+        yield _apply_filters(_qtm_catalog_from_columns(columns), filters)
 
-    # This takes 15 seconds (surprisingly, np.loadtxt takes 30 seconds to do the same thing)
-    ifile = open(filename, 'r')
-    ifile.readline()
-    for line in ifile:
-        temp = line.split()
-        [year, month, day, hour, minute, _] = line.split()[0:6]
-        lat = float(temp[7])
-        lon = float(temp[8])
-        depth = float(temp[9])
-        mag = float(temp[10])
-        try:
-            newdate = dt.datetime.strptime(year + month + day + hour + minute, "%Y%m%d%H%M")
-        except ValueError:  # WE ACTUALLY GOT AN EARTHQUAKE DURING A LEAP SECOND!!!!
-            print("You may have a problem at: ")
-            print(year + month + day + hour + minute)
-            newdate = dt.datetime.strptime(year + month + day + hour, "%Y%m%d%H")
-        myEvent = Catalog_EQ(dt=newdate, lon=lon, lat=lat, depth=depth, Mag=mag, catname="QTM")
-        MyCat.append(myEvent)
-    print("done at : ", dt.datetime.now())
-    ifile.close()
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
 
+def _qtm_catalog_from_columns(columns):
+    [year, month, day, hour, minute, lat, lon, depth, mag] = columns
+    leap_minutes = minute > 59
+    if np.any(leap_minutes):  # WE ACTUALLY GOT AN EARTHQUAKE DURING A LEAP SECOND!!!!
+        logger.warning("You may have a problem at %d events; keeping only their hour", np.sum(leap_minutes))
+        minute = np.where(leap_minutes, 0, minute)
+    dtarray = datetimes_from_columns(year, month, day, hour, minute)
+    return Catalog.from_arrays(dtarray, lon=lon, lat=lat, depth=depth, Mag=mag, catname="QTM")
 
-def input_shearer_cat(filename):
+
+@timed(reads_file=True)
+def input_shearer_cat(filename, n_workers=None):
     """
     Read the Shearer Yang Catalog, or the Hauksson catalog
     Example file name that can be read: sc_1981_2022q1_1d_3d_gc_soda.gc.txt
+    Times are kept to the whole second, as in the original reader.
+
+    :param filename: string
+    :param n_workers: if given, parse byte ranges of the file on a process pool of this size
     """
-    ifile = open(filename)
-    MyCat = []
-    for line in ifile:
-        temp = line.split()
-        [year, month, day, hour, minute] = line.split()[0:5]
-        second = temp[5][0:2]
-        if int(second) > 59:
-            print("We found a leap second at: ", year, month, day, hour, minute, second)
-            print("Turning it back one second")
-            second = '59'
-        if hour == '-1':
-            print("We found a problem at: ", year, month, day, hour, minute, second)
-            print("Turning it forward one second")
-            hour = '00'
-            minute = '00'
-            second = '00'
-        eqdate = dt.datetime.strptime(year + " " + month + " " + day + " " + hour + " " + minute + " " + second,
-                                      "%Y %m %d %H %M %S")
-        myEvent = Catalog_EQ(dt=eqdate, lon=float(temp[8]), lat=float(temp[7]), depth=float(temp[9]),
-                             Mag=float(temp[10]), catname="Shearer")
-        MyCat.append(myEvent)
-    ifile.close()
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    columns = read_whitespace_columns(filename, usecols=SHEARER_COLUMNS, n_workers=n_workers)
+    MyCat = _shearer_catalog_from_columns(columns)
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_shearer_cat(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of input_shearer_cat. See stream_qtm."""
+    for columns in iter_whitespace_columns(filename, usecols=SHEARER_COLUMNS, chunksize=chunksize):
+        yield _apply_filters(_shearer_catalog_from_columns(columns), filters)
+
+
+def _shearer_catalog_from_columns(columns):
+    [year, month, day, hour, minute, second, lat, lon, depth, mag] = columns
+    second = np.floor(second)
+    leap_seconds = second > 59
+    if np.any(leap_seconds):
+        logger.warning("We found %d leap seconds. Turning them back one second", np.sum(leap_seconds))
+        second = np.where(leap_seconds, 59, second)
+    bad_hours = hour == -1
+    if np.any(bad_hours):
+        logger.warning("We found %d events at hour -1. Turning them forward to 00:00:00", np.sum(bad_hours))
+        hour, minute, second = [np.where(bad_hours, 0, x) for x in (hour, minute, second)]
+    dtarray = datetimes_from_columns(year, month, day, hour, minute, second)
+    return Catalog.from_arrays(dtarray, lon=lon, lat=lat, depth=depth, Mag=mag, catname="Shearer")
+
+
+def _apply_filters(MyCat, filters):
+    """Apply pushdown filters (bbox, starttime, endtime, Mc) to one chunk of a catalog."""
+    if not filters:
+        return MyCat
+    return MyCat[MyCat.make_mask(**filters)]
+
+
+def _stream_events(events, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """
+    Group a generator of Catalog_EQ objects into filtered Catalog chunks.  Closing the chunks early closes the
+    event generator (and its file).
+    """
+    chunk = []
+    with contextlib.closing(events):
+        for event in events:
+            chunk.append(event)
+            if len(chunk) == chunksize:
+                yield _apply_filters(Catalog(chunk), filters)
+                chunk = []
+    if chunk:
+        yield _apply_filters(Catalog(chunk), filters)
+
+
+def datetimes_from_columns(year, month, day, hour=0, minute=0, second=0):
+    """
+    Assemble datetime64 times from numeric date/time columns, without going through strings.
+
+    :returns: array of datetime64[us]
+    """
+    months = (np.asarray(year, dtype=np.int64) - 1970) * 12 + np.asarray(month, dtype=np.int64) - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]') + (np.asarray(day, dtype=np.int64) - 1)
+    microseconds = np.round((np.asarray(hour) * 3600 + np.asarray(minute) * 60 + np.asarray(second)) * 1e6)
+    return days.astype('datetime64[us]') + microseconds.astype(np.int64).astype('timedelta64[us]')
+
+
+def read_whitespace_columns(filename, usecols, skip_header=0, n_workers=None):
+    """
+    Read selected numeric columns of a whitespace-delimited text file in bulk.
+    With n_workers, the file is split into byte ranges at line boundaries, and the ranges are parsed in parallel.
+
+    :param filename: string
+    :param usecols: list of column numbers to read
+    :param skip_header: number of header lines at the top of the file
+    :param n_workers: number of worker processes, or None to parse in this process
+    :returns: list of float arrays, one per column in usecols
+    """
+    with open(filename, 'rb') as ifile:
+        for _ in range(skip_header):
+            ifile.readline()
+        start = ifile.tell()
+        ifile.seek(0, 2)
+        end = ifile.tell()
+        n_ranges = 1 if not n_workers else n_workers * 4
+        boundaries = [start]
+        for i in range(1, n_ranges):
+            ifile.seek(max(start + (end - start) * i // n_ranges, boundaries[-1]))
+            ifile.readline()  # move forward to the next line boundary
+            boundaries.append(min(ifile.tell(), end))
+        boundaries.append(end)
+    byte_ranges = [(filename, a, b, usecols) for a, b in zip(boundaries[:-1], boundaries[1:]) if b > a]
+    if not n_workers:
+        blocks = [_parse_byte_range(*args) for args in byte_ranges]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            blocks = list(executor.map(_parse_byte_range, *zip(*byte_ranges)))
+    if len(blocks) == 0:
+        return [np.zeros(0) for _ in usecols]
+    table = np.concatenate(blocks)
+    return [table[:, i] for i in range(len(usecols))]
+
+
+def iter_whitespace_columns(filename, usecols, skip_header=0, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Same as read_whitespace_columns, but yield the columns chunksize lines at a time.
+
+    :returns: generator of lists of float arrays, one per column in usecols
+    """
+    import pandas
+    reader = pandas.read_csv(filename, sep=r'\s+', header=None, usecols=usecols, dtype=float, skiprows=skip_header,
+                             chunksize=chunksize)
+    for df in reader:
+        table = df[usecols].to_numpy()
+        yield [table[:, i] for i in range(len(usecols))]
 
 
+def _parse_byte_range(filename, start, stop, usecols):
+    """Parse the selected columns of the lines between two byte offsets into a 2D float array."""
+    import pandas  # imported here, so that importing file_io doesn't load pandas
+    with open(filename, 'rb') as ifile:
+        ifile.seek(start)
+        text = ifile.read(stop - start)
+    if not text.strip():
+        return np.zeros((0, len(usecols)))
+    df = pandas.read_csv(io.BytesIO(text), sep=r'\s+', header=None, usecols=usecols, dtype=float)
+    return df[usecols].to_numpy()
+
+
+@timed(reads_file=True)
 def read_Wei_2015_supplement(filename):
     MyCat = []
-    ifile = open(filename)
-    for line in ifile:
-        lon = float(line.split()[2])
-        lat = float(line.split()[1])
-        depth = float(line.split()[3])
-        mag = float(line.split()[4])
-        fm = line.split()[5]
-        strike = float(fm.split('/')[0])
-        dip = float(fm.split('/')[1])
-        rake = float(fm.split('/')[2])
-        myEvent = Catalog_EQ(dt=None, lon=lon, lat=lat, depth=depth, Mag=mag, strike=strike, dip=dip, rake=rake,
-                             catname='Wei_2015')
-        MyCat.append(myEvent)
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
-    ifile.close()
+    with open(filename) as ifile:
+        for line in ifile:
+            lon = float(line.split()[2])
+            lat = float(line.split()[1])
+            depth = float(line.split()[3])
+            mag = float(line.split()[4])
+            fm = line.split()[5]
+            strike = float(fm.split('/')[0])
+            dip = float(fm.split('/')[1])
+            rake = float(fm.split('/')[2])
+            myEvent = Catalog_EQ(dt=None, lon=lon, lat=lat, depth=depth, Mag=mag, strike=strike, dip=dip, rake=rake,
+                                 catname='Wei_2015')
+            MyCat.append(myEvent)
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
     return Catalog(MyCat)
 
 
+@timed(reads_file=True)
 def read_intxt_fms(filename, catname='Intxt'):
     """Read focal mechanisms from .intxt file format, as defined in the elastic modeling code"""
-    print("Reading earthquake catalog from file %s " % filename)
-    ifile = open(filename, 'r')
+    logger.info("Reading earthquake catalog from file %s", filename)
     MyCat = []
-    for line in ifile:
-        temp = line.split()
-        if len(temp) == 0:
-            continue
-        if temp[0] == "Source_FM:":
-            [strike, rake, dip, lon, lat, depth, mag] = [float(i) for i in line.split()[1:8]]
-            myEvent = Catalog_EQ(dt=None, lon=lon, lat=lat, strike=strike, dip=dip, rake=rake, depth=depth, Mag=mag,
-                                 catname=catname)
-            MyCat.append(myEvent)
-    ifile.close()
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
+    with open(filename, 'r') as ifile:
+        for line in ifile:
+            temp = line.split()
+            if len(temp) == 0:
+                continue
+            if temp[0] == "Source_FM:":
+                [strike, rake, dip, lon, lat, depth, mag] = [float(i) for i in line.split()[1:8]]
+                myEvent = Catalog_EQ(dt=None, lon=lon, lat=lat, strike=strike, dip=dip, rake=rake, depth=depth,
+                                     Mag=mag, catname=catname)
+                MyCat.append(myEvent)
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
     return Catalog(MyCat)
 
 
+@timed()
 def write_intxt_fms(MyCat, filename, mu=30e9, lame1=30e9):
-    """Write a catalog into focal mechanism format, as described in the elastic modeling code"""
-    print("Writing earthquake catalog into file %s " % filename)
-    ofile = open(filename, 'w')
-    # Adding header line
-    if MyCat[0].bbox is not None:
-        bbox_string = ' within ' + str(MyCat[0].bbox[0]) + '/' + str(MyCat[0].bbox[1]) + '/' + \
-                      str(MyCat[0].bbox[2]) + '/' + str(MyCat[0].bbox[3]) + '/' + str(MyCat[0].bbox[4]) + '/' + \
-                      str(MyCat[0].bbox[5]) + '/' + dt.datetime.strftime(MyCat[0].bbox[6], "%Y%m%d") + '/' + \
-                      dt.datetime.strftime(MyCat[0].bbox[7], "%Y%m%d")
-    else:
-        bbox_string = ''
-    ofile.write("# %s catalog %s\n" % (MyCat[0].catname, bbox_string))
-    for item in MyCat:
-        if not item.strike:
-            continue
-        ofile.write("Source_FM: %f %f %f %f %f %f %f %f %f\n" % (item.strike, item.rake, item.dip, item.lon, item.lat,
-                                                                 item.depth, item.Mag, mu, lame1))
-    ofile.close()
+    """
+    Write a catalog into focal mechanism format, as described in the elastic modeling code.
+    Events without a strike (or with strike 0) are skipped.  A filename ending in .gz is gzip-compressed.
+    """
+    logger.info("Writing earthquake catalog into file %s", filename)
+    keep = ~np.isnan(MyCat.strike) & (MyCat.strike != 0)
+    columns = [MyCat.strike[keep], MyCat.rake[keep], MyCat.dip[keep], MyCat.lon[keep], MyCat.lat[keep],
+               MyCat.depth[keep], MyCat.Mag[keep], np.full(np.sum(keep), mu), np.full(np.sum(keep), lame1)]
+    with atomic_text_file(filename) as ofile:
+        ofile.write(_catalog_header_line(MyCat))
+        write_formatted_rows(ofile, "Source_FM: %f %f %f %f %f %f %f %f %f\n", columns)
     return
 
 
+@timed(reads_file=True)
 def read_usgs_website_csv(filename):
     """Read the files when you hit the 'DOWNLOAD' button on the USGS earthquakes website"""
-    MyCat = []
+    catalog = Catalog.concatenate(stream_usgs_website_csv(filename))
+    logger.info("Reading %d catalog events from file %s", len(catalog), filename)
+    return catalog
+
+
+def stream_usgs_website_csv(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_usgs_website_csv. See stream_qtm."""
+    return _stream_events(_usgs_website_csv_events(filename), chunksize, **filters)
+
+
+def _usgs_website_csv_events(filename):
     with open(filename) as csvfile:
         mycatreader = csv.reader(csvfile)
         for row in mycatreader:
@@ -147,84 +279,174 @@ def read_usgs_website_csv(filename):
             lon = float(row[2])
             depth = float(row[3])
             magnitude = float(row[4])
-            myEvent = Catalog_EQ(dt=dtobj, lon=lon, lat=lat, depth=depth, Mag=magnitude, catname="USGS")
-            MyCat.append(myEvent)
-    catalog = Catalog(MyCat)
-    print("Reading %d catalog events from file %s " % (len(catalog), filename))
-    return catalog
+            yield Catalog_EQ(dt=dtobj, lon=lon, lat=lat, depth=depth, Mag=magnitude, catname="USGS")
 
 
+@timed(reads_file=True)
 def read_scsn_txt(filename):
     """
     Read catalog search queries from Southern California Seismic Network
     https://service.scedc.caltech.edu/eq-catalogs/date_mag_loc.php
     """
-    MyCat = []
-    ifile = open(filename, 'r')
-    for line in ifile:
-        if len(line.split()) == 13 and line[0] != '#':
-            temp = line.split()
-            dtobj = dt.datetime.strptime(temp[0] + "T" + temp[1].split('.')[0], "%Y/%m/%dT%H:%M:%S")
-            lat = float(temp[6])
-            lon = float(temp[7])
-            depth = float(temp[8])
-            magnitude = float(temp[4])
-            myEvent = Catalog_EQ(dt=dtobj, lon=lon, lat=lat, depth=depth, Mag=magnitude, catname="SCSN")
-            MyCat.append(myEvent)
-    ifile.close()
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    MyCat = Catalog.concatenate(stream_scsn_txt(filename))
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_scsn_txt(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_scsn_txt. See stream_qtm."""
+    return _stream_events(_scsn_txt_events(filename), chunksize, **filters)
+
+
+def _scsn_txt_events(filename):
+    with open(filename, 'r') as ifile:
+        for line in ifile:
+            if len(line.split()) == 13 and line[0] != '#':
+                temp = line.split()
+                dtobj = dt.datetime.strptime(temp[0] + "T" + temp[1].split('.')[0], "%Y/%m/%dT%H:%M:%S")
+                lat = float(temp[6])
+                lon = float(temp[7])
+                depth = float(temp[8])
+                magnitude = float(temp[4])
+                yield Catalog_EQ(dt=dtobj, lon=lon, lat=lat, depth=depth, Mag=magnitude, catname="SCSN")
 
 
+@timed(reads_file=True)
 def read_usgs_query_xml_into_MT(filename):
-    [Mrr, Mtt, Mpp, Mrt, Mrp, Mtp] = [0, 0, 0, 0, 0, 0]
-    [strike, rake, dip, strike2, rake2, dip2] = [0, 0, 0, 0, 0, 0]
-    tree = et.parse(filename)
-    root = tree.getroot()
-    lev1 = "{http://quakeml.org/xmlns/bed/1.2}eventParameters"
-    lev2 = "{http://quakeml.org/xmlns/bed/1.2}event"
-    lev3 = "{http://quakeml.org/xmlns/bed/1.2}focalMechanism"
-    lev4 = "{http://quakeml.org/xmlns/bed/1.2}momentTensor"
-    lev5 = "{http://quakeml.org/xmlns/bed/1.2}tensor"
-    for child in root.findall('./' + lev1 + '/' + lev2 + '/' + lev3 + '/' + lev4 + '/' + lev5 + "/*"):
-        value = child.tag.split('}')[1]
-        # print(value, child[0].text);
-        if value == "Mrr":
-            Mrr = float(child[0].text)
-        if value == "Mtt":
-            Mtt = float(child[0].text)
-        if value == "Mpp":
-            Mpp = float(child[0].text)
-        if value == "Mrt":
-            Mrt = float(child[0].text)
-        if value == "Mrp":
-            Mrp = float(child[0].text)
-        if value == "Mtp":
-            Mtp = float(child[0].text)
-    lev4 = "{http://quakeml.org/xmlns/bed/1.2}nodalPlanes"
-    lev5 = "{http://quakeml.org/xmlns/bed/1.2}nodalPlane1"
-    for child in root.findall('./' + lev1 + '/' + lev2 + '/' + lev3 + '/' + lev4 + '/' + lev5 + "/*"):
-        value = child.tag.split('}')[1]
-        if value == "strike":
-            strike = float(child[0].text)
-        if value == "dip":
-            dip = float(child[0].text)
-        if value == "rake":
-            rake = float(child[0].text)
-    lev5 = "{http://quakeml.org/xmlns/bed/1.2}nodalPlane2"
-    for child in root.findall('./' + lev1 + '/' + lev2 + '/' + lev3 + '/' + lev4 + '/' + lev5 + "/*"):
-        value = child.tag.split('}')[1]
-        if value == "strike":
-            strike2 = float(child[0].text)
-        if value == "dip":
-            dip2 = float(child[0].text)
-        if value == "rake":
-            rake2 = float(child[0].text)
-    return [Mrr, Mtt, Mpp, Mrt, Mrp, Mtp, strike, dip, rake, strike2, dip2, rake2]
+    """
+    Read the moment tensor and nodal planes of a QuakeML file from a USGS query (one event).
+    Missing values are 0.
+
+    :returns: [Mrr, Mtt, Mpp, Mrt, Mrp, Mtp, strike, dip, rake, strike2, dip2, rake2]
+    """
+    values = [0] * 12
+    for event in parse_quakeml_files([filename])[filename]:
+        values = [0 if x is None else x for x in event['tensor'] + event['plane1'] + event['plane2']]
+    return values
+
+
+QUAKEML_NAMESPACE = {'q': 'http://quakeml.org/xmlns/bed/1.2'}
+TENSOR_COMPONENTS = ('Mrr', 'Mtt', 'Mpp', 'Mrt', 'Mrp', 'Mtp')
+QUAKEML_CACHE_SIZE = 128  # number of parsed QuakeML files kept in memory
+_quakeml_cache = collections.OrderedDict()  # absolute path -> (mtime_ns, size, parsed events), least recent first
+
+
+@timed(reads_file=True)
+def read_quakeml(filenames, catname='QuakeML', nodal_plane=1, n_workers=None):
+    """
+    Read the events of one or many QuakeML files into a catalog: origin time and location, magnitude,
+    and the strike/dip/rake of one nodal plane.  The full moment tensors are available from parse_quakeml_files.
+
+    :param filenames: string, or list of strings
+    :param catname: string
+    :param nodal_plane: 1 or 2, which nodal plane fills strike/dip/rake
+    :param n_workers: number of worker processes for parsing many files
+    :returns: catalog
+    :rtype: Catalog
+    """
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    parsed = parse_quakeml_files(filenames, n_workers=n_workers)
+    events = [event for filename in filenames for event in parsed[filename]]
+    plane = 'plane1' if nodal_plane == 1 else 'plane2'
+    MyCat = Catalog.from_arrays(np.array([event['dt'] for event in events], dtype='datetime64[us]'),
+                                np.array([event['lon'] for event in events], dtype=float),
+                                np.array([event['lat'] for event in events], dtype=float),
+                                np.array([event['depth'] for event in events], dtype=float),
+                                np.array([event['Mag'] for event in events], dtype=float),
+                                strike=np.array([event[plane][0] for event in events], dtype=float),
+                                dip=np.array([event[plane][1] for event in events], dtype=float),
+                                rake=np.array([event[plane][2] for event in events], dtype=float),
+                                catname=catname)
+    logger.info("Reading %d catalog events from %d QuakeML files", len(MyCat), len(filenames))
+    return MyCat
+
+
+def parse_quakeml_files(filenames, n_workers=None):
+    """
+    Parse many QuakeML files, on a process pool if n_workers is given.
+    The QUAKEML_CACHE_SIZE most recently used files are cached in memory, keyed on each file's modification time
+    and size, so re-reading an unchanged file is free.
+
+    :param filenames: list of strings
+    :param n_workers: number of worker processes, or None to parse in this process
+    :returns: dict from filename to a list of events, as parsed by _parse_quakeml
+    """
+    results, todo = {}, []
+    for filename in dict.fromkeys(filenames):
+        stat = os.stat(filename)
+        cached = _quakeml_cache.get(os.path.abspath(filename))
+        if cached is not None and cached[0:2] == (stat.st_mtime_ns, stat.st_size):
+            _quakeml_cache.move_to_end(os.path.abspath(filename))
+            results[filename] = cached[2]
+        else:
+            todo.append((filename, stat))
+    if not n_workers or len(todo) < 2:
+        parsed = [_parse_quakeml(filename) for filename, _ in todo]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            parsed = list(executor.map(_parse_quakeml, [filename for filename, _ in todo],
+                                       chunksize=max(1, len(todo) // (4 * n_workers))))
+    for (filename, stat), events in zip(todo, parsed):
+        _quakeml_cache[os.path.abspath(filename)] = (stat.st_mtime_ns, stat.st_size, events)
+        _quakeml_cache.move_to_end(os.path.abspath(filename))
+        while len(_quakeml_cache) > QUAKEML_CACHE_SIZE:
+            _quakeml_cache.popitem(last=False)
+        results[filename] = events
+    return results
+
+
+def _parse_quakeml(filename):
+    """
+    Stream the events of a QuakeML file in one pass.  Each event is read when its closing tag is reached,
+    and then cleared, so memory use does not grow with the number of events in the file.
+    The preferred origin, magnitude, and focal mechanism are used where the file names them;
+    otherwise the first origin and magnitude, and the last focal mechanism.
+
+    :returns: list of dicts with dt, lon, lat, depth (km), Mag, tensor (6 components, N-m),
+              plane1 and plane2 (strike, dip, rake).  Missing values are None.
+    """
+    events = []
+    event_tag = '{%s}event' % QUAKEML_NAMESPACE['q']
+    for _, element in et.iterparse(filename, events=('end',)):
+        if element.tag == event_tag:
+            events.append(_quakeml_event(element))
+            element.clear()
+    return events
+
 
+def _quakeml_event(event):
+    def _preferred(tag, fallback):
+        candidates = event.findall('q:' + tag, QUAKEML_NAMESPACE)
+        preferred_id = event.findtext('q:preferred' + tag[0].upper() + tag[1:] + 'ID', None, QUAKEML_NAMESPACE)
+        for candidate in candidates:
+            if preferred_id is not None and candidate.get('publicID') == preferred_id.strip():
+                return candidate
+        return candidates[fallback] if candidates else None
 
+    def _value(element, path):
+        text = None if element is None else element.findtext(path + '/q:value', None, QUAKEML_NAMESPACE)
+        return None if text is None else float(text)
+
+    origin = _preferred('origin', 0)
+    magnitude = _preferred('magnitude', 0)
+    mechanism = _preferred('focalMechanism', -1)
+    time_text = None if origin is None else origin.findtext('q:time/q:value', None, QUAKEML_NAMESPACE)
+    depth = _value(origin, 'q:depth')
+    planes = [[_value(mechanism, 'q:nodalPlanes/q:nodalPlane%d/q:%s' % (i, name))
+               for name in ('strike', 'dip', 'rake')] for i in (1, 2)]
+    return {'dt': None if time_text is None else np.datetime64(time_text.strip().rstrip('Z'), 'us').item(),
+            'lon': _value(origin, 'q:longitude'), 'lat': _value(origin, 'q:latitude'),
+            'depth': None if depth is None else depth / 1000.0,  # QuakeML depths are in meters
+            'Mag': _value(magnitude, 'q:mag'),
+            'tensor': [_value(mechanism, 'q:momentTensor/q:tensor/q:' + name) for name in TENSOR_COMPONENTS],
+            'plane1': planes[0], 'plane2': planes[1]}
+
+
+@timed(reads_file=True)
 def read_SIL_catalog(filename):
     """Take a catalog from Iceland source"""
+    import pandas
     df = pandas.read_csv(filename)
     lons = [float(x) for x in df["SIL_lon"]]
     lats = [float(x) for x in df["SIL_lat"]]
@@ -235,211 +457,608 @@ def read_SIL_catalog(filename):
     for i in range(len(dtarray)):
         myEvent = Catalog_EQ(dt=dtarray[i], lon=lons[i], lat=lats[i], depth=depth[i], Mag=mag[i], catname="SIL")
         MyCat.append(myEvent)
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
     return Catalog(MyCat)
 
 
-def read_associated_MT_file(filename):
+@timed(reads_file=True)
+def read_associated_MT_file(filename, n_workers=None):
     # A special catalog for the Iceland case: time, magnitude, and xml file (a manually created lookup table)
-    print("Reading associated mt file %s " % filename)
-    myCat = []
-    ifile = open(filename)
-    for line in ifile:
-        if line.split()[0] == "#":
-            continue
-        else:
-            dtstr = line.split()[0]
-            dtobj = dt.datetime.strptime(dtstr, "%Y-%m-%d-%H-%M-%S")
-            mag = float(line.split()[1])
-            mt_xml_file = line.split()[2]
-            # Depends on which plane you want to take (shouldn't make difference)
-            [_, _, _, _, _, _, _, _, _, strike, dip, rake] = read_usgs_query_xml_into_MT(mt_xml_file)
-            myEvent = Catalog_EQ(dt=dtobj, lon=None, lat=None, depth=None, Mag=mag, strike=strike,
-                                 dip=dip, rake=rake)
-            myCat.append(myEvent)
-    ifile.close()
-    return Catalog(myCat)
+    logger.info("Reading associated mt file %s", filename)
+    dtarray, mags, mt_xml_files = [], [], []
+    with open(filename) as ifile:
+        for line in ifile:
+            if line.split()[0] == "#":
+                continue
+            else:
+                dtstr = line.split()[0]
+                dtarray.append(dt.datetime.strptime(dtstr, "%Y-%m-%d-%H-%M-%S"))
+                mags.append(float(line.split()[1]))
+                mt_xml_files.append(line.split()[2])
+    parsed = parse_quakeml_files(mt_xml_files, n_workers=n_workers)
+    # Depends on which plane you want to take (shouldn't make difference)
+    planes = []
+    for mt_xml_file in mt_xml_files:
+        plane = [0, 0, 0]
+        for event in parsed[mt_xml_file]:
+            plane = [0 if x is None else x for x in event['plane2']]
+        planes.append(plane)
+    planes = np.array(planes, dtype=float).reshape(-1, 3)
+    n = len(dtarray)
+    return Catalog.from_arrays(np.array(dtarray, dtype='datetime64[us]'), np.full(n, np.nan), np.full(n, np.nan),
+                               np.full(n, np.nan), np.array(mags, dtype=float),
+                               strike=planes[:, 0], dip=planes[:, 1], rake=planes[:, 2])
 
 
+@timed(reads_file=True)
 def read_simple_catalog_txt(filename):
     """
     Reading a basic .txt format for earthquake catalogs, matches the format written by matching function.
     Format: datestring, lon, lat, depth, magnitude
     """
-    print("Reading Catalog in %s " % filename)
+    logger.info("Reading Catalog in %s", filename)
     [datestrs, lon, lat, depth, Mag] = np.loadtxt(filename, dtype={'names': ('datestr', 'lon', 'lat', 'depth', 'mag'),
                                                                    'formats': (
                                                                        'U19', float, float, float, float)},
                                                   unpack=True, skiprows=1)
-    dtarray = [dt.datetime.strptime(i, "%Y-%m-%d-%H-%M-%S") for i in datestrs]
+    dtarray = [None if i == 'NaT' else dt.datetime.strptime(i, "%Y-%m-%d-%H-%M-%S") for i in datestrs]
     MyCat = []
     for i in range(len(dtarray)):
         myEvent = Catalog_EQ(dt=dtarray[i], lon=lon[i], lat=lat[i], depth=depth[i], Mag=Mag[i])
         MyCat.append(myEvent)
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
     return Catalog(MyCat)
 
 
+@timed(reads_file=True)
 def read_txyzm(filename):
     """A very simple filename with format like: 2018.3 lon lat depth mag"""
-    print("Reading file %s " % filename)
+    logger.info("Reading file %s", filename)
     MyCat = []
     t, x, y, z, m = np.loadtxt(filename, unpack=True)
     for i in range(len(t)):
         dt1 = dt.datetime.strptime(str(t[i])[0:4]+"-01-02", "%Y-%m-%d")
         myEvent = Catalog_EQ(dt=dt1, lon=x[i], lat=y[i], depth=z[i], Mag=m[i])
         MyCat.append(myEvent)
-    print("Reading %d catalog events from file %s " % (len(MyCat), filename))
+    logger.info("Reading %d catalog events from file %s", len(MyCat), filename)
     return MyCat
 
 
+@timed(reads_file=True)
 def read_wech(filename):
-    start = 0
-    MyCat = []
-    ifile = open(filename, 'r')
-    for line in ifile:
-        temp = line.split()
-        if 'yyyy-mm-dd' in line or 'DateTime' in line:  # If the header is still inside.
-            start = 1
-            continue
-        if len(temp) == 5:  # If we've removed the header already.
-            start = 1
-        if start == 1 and len(temp) > 0:
-            onedate = dt.datetime.strptime(temp[0] + ' ' + temp[1].split('.')[0], "%Y-%m-%d %H:%M:%S")
-            myEvent = Catalog_EQ(dt=onedate, lon=float(temp[3]), lat=float(temp[2]), depth=None, Mag=None)
-            MyCat.append(myEvent)
-        if len(MyCat) == 180000:
-            break
-    ifile.close()
-    print("Successfully read %d tremor counts from %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    MyCat = Catalog.concatenate(stream_wech(filename))
+    logger.info("Successfully read %d tremor counts from %s", len(MyCat), filename)
+    return MyCat
+
 
+def stream_wech(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_wech. See stream_qtm. Tremor has no depth, so use a 4-element bbox."""
+    return _stream_events(_wech_events(filename, lon_column=3, lat_column=2, header_keys=('yyyy-mm-dd', 'DateTime')),
+                          chunksize, **filters)
 
+
+@timed(reads_file=True)
 def read_wech_custom(filename):
-    MyCat = []
+    """
+    Wech tremor catalog with the longitude and latitude columns swapped.  This layout can't be told apart from
+    read_wech files by their first lines, so it is never sniffed: pass fmt='wech_custom' to read_catalog.
+    """
+    MyCat = Catalog.concatenate(stream_wech_custom(filename))
+    logger.info("Successfully read %d tremor counts from %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_wech_custom(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_wech_custom. See stream_qtm. Tremor has no depth, so use a 4-element bbox."""
+    return _stream_events(_wech_events(filename, lon_column=2, lat_column=3, header_keys=('DateTime',)),
+                          chunksize, **filters)
+
+
+def _wech_events(filename, lon_column, lat_column, header_keys):
     start = 0
-    ifile = open(filename, 'r')
-    for line in ifile:
-        temp = line.split()
-        if 'DateTime' in line:  # If the header is still inside.
-            start = 1
-            continue
-        if len(temp) == 5:  # If we've removed the header already.
-            start = 1
-        if start == 1 and len(temp) > 0:
-            onedt = dt.datetime.strptime(temp[0] + ' ' + temp[1].split('.')[0], "%Y-%m-%d %H:%M:%S")
-            myEvent = Catalog_EQ(dt=onedt, lon=float(temp[2]), lat=float(temp[3]), depth=None, Mag=None)
-            MyCat.append(myEvent)
-        if len(MyCat) == 180000:
-            break
-    ifile.close()
-    print("Successfully read %d tremor counts from %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    with open(filename, 'r') as ifile:
+        for line in ifile:
+            temp = line.split()
+            if any(key in line for key in header_keys):  # If the header is still inside.
+                start = 1
+                continue
+            if len(temp) == 5:  # If we've removed the header already.
+                start = 1
+            if start == 1 and len(temp) > 0:
+                onedate = dt.datetime.strptime(temp[0] + ' ' + temp[1].split('.')[0], "%Y-%m-%d %H:%M:%S")
+                yield Catalog_EQ(dt=onedate, lon=float(temp[lon_column]), lat=float(temp[lat_column]), depth=None,
+                                 Mag=None)
 
 
+@timed(reads_file=True)
 def read_ide_tremor(filename):
-    MyCat = []
-    ifile = open(filename, 'r')
-    for line in ifile:
-        temp = line.split(',')
-        if len(temp) > 1:
-            onedt = dt.datetime.strptime(temp[0] + ' ' + temp[1], "%Y-%m-%d %H:%M:%S")
-            myEvent = Catalog_EQ(dt=onedt, lon=float(temp[2]), lat=float(temp[3]), depth=None, Mag=None)
-            MyCat.append(myEvent)
-    ifile.close()
-    print("Successfully read %d tremor counts from %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    MyCat = Catalog.concatenate(stream_ide_tremor(filename))
+    logger.info("Successfully read %d tremor counts from %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_ide_tremor(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_ide_tremor. See stream_qtm. Tremor has no depth, so use a 4-element bbox."""
+    return _stream_events(_ide_tremor_events(filename), chunksize, **filters)
 
 
+def _ide_tremor_events(filename):
+    with open(filename, 'r') as ifile:
+        for line in ifile:
+            temp = line.split(',')
+            if len(temp) > 1:
+                onedt = dt.datetime.strptime(temp[0] + ' ' + temp[1], "%Y-%m-%d %H:%M:%S")
+                yield Catalog_EQ(dt=onedt, lon=float(temp[2]), lat=float(temp[3]), depth=None, Mag=None)
+
+
+@timed(reads_file=True)
 def read_pnsn052019_file(filename):
-    MyCat = []
-    ifile = open(filename, 'r')
-    ifile.readline()
-    for line in ifile:
-        temp = line.split(',')
-        if len(temp) <= 2:
-            continue
-        if temp[0] == 'lat':
-            continue
-        onedt = dt.datetime.strptime(temp[3], " %Y-%m-%d %H:%M:%S ")
-        myEvent = Catalog_EQ(dt=onedt, lon=float(temp[1]), lat=float(temp[0]), depth=0, Mag=None)
-        MyCat.append(myEvent)
-    ifile.close()
-    print("Successfully read %d tremor counts from %s " % (len(MyCat), filename))
-    return Catalog(MyCat)
+    MyCat = Catalog.concatenate(stream_pnsn052019_file(filename))
+    logger.info("Successfully read %d tremor counts from %s", len(MyCat), filename)
+    return MyCat
+
+
+def stream_pnsn052019_file(filename, chunksize=DEFAULT_CHUNKSIZE, **filters):
+    """Chunked version of read_pnsn052019_file. See stream_qtm."""
+    return _stream_events(_pnsn052019_events(filename), chunksize, **filters)
+
+
+def _pnsn052019_events(filename):
+    with open(filename, 'r') as ifile:
+        ifile.readline()
+        for line in ifile:
+            temp = line.split(',')
+            if len(temp) <= 2:
+                continue
+            if temp[0] == 'lat':
+                continue
+            onedt = dt.datetime.strptime(temp[3], " %Y-%m-%d %H:%M:%S ")
+            yield Catalog_EQ(dt=onedt, lon=float(temp[1]), lat=float(temp[0]), depth=0, Mag=None)
 
 
 # ---------- WRITE EARTHQUAKE CATALOGS --------------
 
-def write_simple_catalog_txt(MyCat, outfile):
+@timed()
+def write_simple_catalog_txt(MyCat, outfile, binary=False):
     """
     Write a very simple .txt format for earthquake catalogs
-    Format: date, lon, lat, depth, magnitude
-    """
-    print("Writing Catalog of length %d in %s " % (len(MyCat), outfile))
-    ofile = open(outfile, 'w')
-    # Adding header line
-    if MyCat[0].bbox is not None:
-        bbox_string = ' within ' + str(MyCat[0].bbox[0]) + '/' + str(MyCat[0].bbox[1]) + '/' + \
-                      str(MyCat[0].bbox[2]) + '/' + str(MyCat[0].bbox[3]) + '/' + str(MyCat[0].bbox[4]) + '/' + \
-                      str(MyCat[0].bbox[5]) + '/' + dt.datetime.strftime(MyCat[0].bbox[6], "%Y%m%d") + '/' + \
-                      dt.datetime.strftime(MyCat[0].bbox[7], "%Y%m%d")
-    else:
-        bbox_string = ''
-    ofile.write("# %s catalog %s\n" % (MyCat[0].catname, bbox_string))
-    ofile.write("# date, lon, lat, depth, magnitude\n")
-    for item in MyCat:
-        datestr = dt.datetime.strftime(item.dt, "%Y-%m-%d-%H-%M-%S")
-        ofile.write("%s %f %f %.3f %.2f\n" % (datestr, item.lon, item.lat, item.depth, item.Mag))
-    ofile.close()
+    Format: date, lon, lat, depth, magnitude (a missing date is written as NaT)
+    An outfile ending in .gz is gzip-compressed.  With binary=True, the same columns are written instead as a
+    structured numpy array (.npy), readable with np.load.
+    """
+    logger.info("Writing Catalog of length %d in %s", len(MyCat), outfile)
+    names = ['dt', 'lon', 'lat', 'depth', 'Mag']
+    if binary:
+        _write_binary_columns(MyCat, outfile, names)
+        return
+    with atomic_text_file(outfile) as ofile:
+        ofile.write(_catalog_header_line(MyCat))
+        ofile.write("# date, lon, lat, depth, magnitude\n")
+        write_formatted_rows(ofile, "%s %f %f %.3f %.2f\n", [getattr(MyCat, name) for name in names])
     return
 
 
-def write_location_catalog_txt(MyCat, outfile):
+@timed()
+def write_location_catalog_txt(MyCat, outfile, binary=False):
     """
     Write a minimalist .txt format for earthquake catalogs
     Format: lon, lat
+    An outfile ending in .gz is gzip-compressed.  With binary=True, the same columns are written instead as a
+    structured numpy array (.npy), readable with np.load.
     """
-    print("Writing Catalog of length %d in %s " % (len(MyCat), outfile))
-    ofile = open(outfile, 'w')
-    # Adding header line
-    if MyCat[0].bbox is not None:
-        bbox_string = ' within ' + str(MyCat[0].bbox[0]) + '/' + str(MyCat[0].bbox[1]) + '/' + \
-                      str(MyCat[0].bbox[2]) + '/' + str(MyCat[0].bbox[3]) + '/' + str(MyCat[0].bbox[4]) + '/' + \
-                      str(MyCat[0].bbox[5]) + '/' + dt.datetime.strftime(MyCat[0].bbox[6], "%Y%m%d") + '/' + \
-                      dt.datetime.strftime(MyCat[0].bbox[7], "%Y%m%d")
+    logger.info("Writing Catalog of length %d in %s", len(MyCat), outfile)
+    if binary:
+        _write_binary_columns(MyCat, outfile, ['lon', 'lat'])
+        return
+    with atomic_text_file(outfile) as ofile:
+        ofile.write(_catalog_header_line(MyCat))
+        ofile.write("# lon, lat\n")
+        write_formatted_rows(ofile, "%f %f\n", [MyCat.lon, MyCat.lat])
+    return
+
+
+def _catalog_header_line(MyCat):
+    """The '# <catname> catalog within <bbox>' line at the top of the text catalogs."""
+    catname = MyCat.catname_categories[MyCat.catname_codes[0]] if len(MyCat) > 0 else ''
+    bbox = MyCat.bbox
+    if bbox is not None:
+        bbox_string = ' within ' + '/'.join(str(x) for x in bbox[0:6])
+        if len(bbox) > 6:
+            bbox_string += '/' + dt.datetime.strftime(bbox[6], "%Y%m%d") + '/' + \
+                           dt.datetime.strftime(bbox[7], "%Y%m%d")
     else:
         bbox_string = ''
-    ofile.write("# %s catalog %s\n" % (MyCat[0].catname, bbox_string))
-    ofile.write("# lon, lat\n")
-    for item in MyCat:
-        ofile.write("%f %f\n" % (item.lon, item.lat))
-    ofile.close()
+    return "# %s catalog %s\n" % (catname, bbox_string)
+
+
+def _format_datetimes(dtarray):
+    """Format a datetime64 array as YYYY-mm-dd-HH-MM-SS strings, all at once.  Missing times are written as NaT."""
+    strings = np.datetime_as_string(dtarray, unit='s').tolist()
+    strings = '\n'.join(strings).translate({ord('T'): '-', ord(':'): '-'}).split('\n')
+    for i in np.flatnonzero(np.isnat(dtarray)):
+        strings[i] = 'NaT'
+    return strings
+
+
+def write_formatted_rows(ofile, line_format, columns, blocksize=100000):
+    """
+    Write rows of columns (numeric arrays, or datetime64 arrays) with a printf-style line format,
+    formatting a block of rows at a time and writing each block with a single call.
+    Missing times are written as NaT.  Used by the text writers here and in synthetic.
+
+    :param ofile: open text file, such as one from atomic_text_file
+    :param line_format: format of one line, with one % field per column
+    :param columns: list of equal-length arrays
+    :param blocksize: number of rows formatted at a time
+    """
+    n = len(columns[0]) if columns else 0
+    for start in range(0, n, blocksize):
+        block = [_format_datetimes(column[start:start + blocksize]) if np.issubdtype(column.dtype, np.datetime64)
+                 else column[start:start + blocksize].tolist() for column in columns]
+        ofile.write(''.join(map(line_format.__mod__, zip(*block))))
+    return
+
+
+@contextlib.contextmanager
+def atomic_text_file(filename):
+    """
+    Open a text file for writing under a temporary name, and rename it into place only once it is complete,
+    so readers never see a partial file.  A filename ending in .gz is gzip-compressed.
+    """
+    filename = os.fspath(filename)
+    tmpfile = filename + '.tmp%d' % os.getpid()
+    try:
+        if filename.endswith('.gz'):
+            ofile = gzip.open(tmpfile, 'wt')
+        else:
+            ofile = open(tmpfile, 'w', buffering=1024 * 1024)
+        with ofile:
+            yield ofile
+        os.replace(tmpfile, filename)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+
+def _write_binary_columns(MyCat, outfile, names):
+    """Write some catalog columns as one structured .npy array, atomically."""
+    outfile = os.fspath(outfile)
+    records = np.empty(len(MyCat), dtype=[(name, getattr(MyCat, name).dtype) for name in names])
+    for name in names:
+        records[name] = getattr(MyCat, name)
+    tmpfile = outfile + '.tmp%d.npy' % os.getpid()
+    np.save(tmpfile, records)
+    os.replace(tmpfile, outfile)
     return
 
 
 # ---------- READ EARTHQUAKE RATES --------------
+@timed(reads_file=True)
 def read_earthquake_rates(infile):
     # Matching the format of write_seismicity_rates().
-    print("Reading %s " % infile)
+    logger.info("Reading %s", infile)
     dtarray, rates = [], []
-    ifile = open(infile, 'r')
-    for line in ifile:
-        if line.split()[0] == "#":
-            continue
-        else:
-            dtarray.append(dt.datetime.strptime(line.split()[0], "%Y%m%d"))
-            rates.append(float(line.split()[1]))
+    with open(infile, 'r') as ifile:
+        for line in ifile:
+            if line.split()[0] == "#":
+                continue
+            else:
+                dtarray.append(dt.datetime.strptime(line.split()[0], "%Y%m%d"))
+                rates.append(float(line.split()[1]))
     return [dtarray, rates]
 
 
+@timed()
 def write_seismicity_rates(dtarray, rates, filename):
-    print("Writing %s " % filename)
-    ofile = open(filename, 'w')
+    logger.info("Writing %s", filename)
     window = dtarray[1] - dtarray[0]
     window = window.days
-    ofile.write("# Center_Date Num_EQs_per_day Window_Days\n")
-    for i in range(len(dtarray)):
-        ofile.write("%s %d %d\n" % (dt.datetime.strftime(dtarray[i], '%Y%m%d'), rates[i], window))
-    ofile.close()
+    with open(filename, 'w') as ofile:
+        ofile.write("# Center_Date Num_EQs_per_day Window_Days\n")
+        for i in range(len(dtarray)):
+            ofile.write("%s %d %d\n" % (dt.datetime.strftime(dtarray[i], '%Y%m%d'), rates[i], window))
+    return
+
+
+# ---------- BINARY CATALOGS AND CATALOG CACHE --------------
+
+BINARY_COLUMNS = ('dt', 'lon', 'lat', 'depth', 'Mag', 'strike', 'dip', 'rake', 'catname_codes')
+DEFAULT_CACHE_DIR = os.environ.get('EQ_CATALOGS_CACHE', os.path.join(os.path.expanduser('~'), '.cache',
+                                                                     'eq_catalogs'))
+DEFAULT_MAX_CACHE_BYTES = 5 * 1024**3
+
+
+@timed()
+def write_binary_catalog(MyCat, directory):
+    """
+    Write a catalog as a directory of raw .npy columns plus a small json header, so it can be memory-mapped later.
+    The directory is written under a temporary name and renamed into place at the end.
+    """
+    directory = os.fspath(directory)
+    tmpdir = directory.rstrip('/') + '.tmp%d' % os.getpid()
+    os.makedirs(tmpdir, exist_ok=True)
+    for column in BINARY_COLUMNS:
+        np.save(os.path.join(tmpdir, column + '.npy'), getattr(MyCat, column))
+    bbox = None if MyCat.bbox is None else [x.isoformat() if isinstance(x, dt.datetime) else x for x in MyCat.bbox]
+    header = {'catname_categories': list(MyCat.catname_categories), 'bbox': bbox, 'n_events': len(MyCat)}
+    with open(os.path.join(tmpdir, 'header.json'), 'w') as ofile:
+        json.dump(header, ofile)
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.replace(tmpdir, directory)
     return
+
+
+@timed()
+def read_binary_catalog(directory, mmap=True):
+    """
+    Read a catalog written by write_binary_catalog.
+
+    :param directory: string
+    :param mmap: if True, columns are memory-mapped read-only instead of loaded into memory
+    :returns: catalog
+    :rtype: Catalog
+    """
+    with open(os.path.join(directory, 'header.json')) as ifile:
+        header = json.load(ifile)
+    columns = {column: np.load(os.path.join(directory, column + '.npy'), mmap_mode='r' if mmap else None)
+               for column in BINARY_COLUMNS}
+    bbox = header['bbox']
+    if bbox is not None and len(bbox) > 6:
+        bbox = bbox[0:6] + [None if x is None else dt.datetime.fromisoformat(x) for x in bbox[6:]]
+    return Catalog.from_arrays(columns['dt'], columns['lon'], columns['lat'], columns['depth'], columns['Mag'],
+                               strike=columns['strike'], dip=columns['dip'], rake=columns['rake'],
+                               catname=tuple(header['catname_categories']), catname_codes=columns['catname_codes'],
+                               bbox=bbox)
+
+
+def _cache_key(reader, filename, kwargs=None):
+    """
+    Cache entries are keyed on the source file's path, size, and modification time, on the reader, and on the
+    reader's keyword arguments (other than n_workers, which doesn't change the result).
+    """
+    stat = os.stat(filename)
+    reader_name = reader.__module__ + '.' + reader.__qualname__
+    options = {key: value for key, value in (kwargs or {}).items() if key != 'n_workers'}
+    keystring = '%s|%d|%d|%s' % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, reader_name)
+    if options:  # keys of calls without options are unchanged
+        keystring += '|' + json.dumps(options, sort_keys=True, default=repr)
+    return hashlib.sha1(keystring.encode()).hexdigest()
+
+
+def read_cached(reader, filename, cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES, **kwargs):
+    """
+    Read a catalog through a binary cache.  The first read parses the text file with the reader and stores the
+    result; later reads of the same unchanged file memory-map the stored columns instead.
+    Example: read_cached(input_qtm, 'qtm_final_12dev.hypo')
+
+    :param reader: a reader function from this module, such as input_qtm
+    :param filename: the source catalog file
+    :param cache_dir: cache directory. Default: $EQ_CATALOGS_CACHE or ~/.cache/eq_catalogs
+    :param max_cache_bytes: after adding a new entry, least-recently used entries are evicted beyond this size
+    :param kwargs: passed to the reader, and part of the cache key
+    :returns: catalog
+    :rtype: Catalog
+    """
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    entry = os.path.join(cache_dir, _cache_key(reader, filename, kwargs))
+    header_file = os.path.join(entry, 'header.json')
+    if os.path.isfile(header_file):
+        os.utime(header_file)  # remember the access, for eviction
+        return read_binary_catalog(entry)
+    MyCat = reader(filename, **kwargs)
+    if not isinstance(MyCat, Catalog):
+        MyCat = Catalog(MyCat)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_binary_catalog(MyCat, entry)
+    with open(os.path.join(entry, 'source.txt'), 'w') as ofile:
+        ofile.write(os.path.abspath(filename) + '\n')
+    prune_cache(cache_dir, max_cache_bytes)
+    return MyCat
+
+
+def invalidate_cache(filename=None, cache_dir=None):
+    """
+    Remove cache entries made from a given source file, or every entry if filename is None.
+
+    :returns: number of entries removed
+    """
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    removed = 0
+    for entry in _cache_entries(cache_dir):
+        if filename is not None:
+            with open(os.path.join(entry, 'source.txt')) as ifile:
+                if ifile.read().strip() != os.path.abspath(filename):
+                    continue
+        shutil.rmtree(entry)
+        removed += 1
+    return removed
+
+
+def prune_cache(cache_dir=None, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """Evict the least-recently used cache entries until the cache directory is within max_cache_bytes."""
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    entries = []
+    for entry in _cache_entries(cache_dir):
+        size = sum(os.path.getsize(os.path.join(entry, x)) for x in os.listdir(entry))
+        entries.append((os.path.getmtime(os.path.join(entry, 'header.json')), size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_cache_bytes:
+            break
+        shutil.rmtree(entry)
+        total -= size
+    return
+
+
+def _cache_entries(cache_dir):
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = [os.path.join(cache_dir, x) for x in os.listdir(cache_dir)]
+    return [x for x in entries if os.path.isfile(os.path.join(x, 'header.json')) and
+            os.path.isfile(os.path.join(x, 'source.txt'))]
+
+
+# ---------- READER REGISTRY AND PARALLEL LOADING --------------
+
+CATALOG_FORMATS = {}  # format name -> (reader function, sniffing function or None), sniffed in this order
+LoadTiming = collections.namedtuple('LoadTiming', ['filename', 'format', 'seconds', 'n_events'])
+
+
+def register_format(name, reader, sniff=None):
+    """
+    Register a catalog reader under a format name.
+
+    :param name: string, such as 'qtm'
+    :param reader: module-level function taking a filename and returning a Catalog
+    :param sniff: optional function taking (filename, first lines of the file) and returning True if the file
+                  looks like this format.  Formats are sniffed in the order they were registered.
+    """
+    CATALOG_FORMATS[name] = (reader, sniff)
+    return
+
+
+def sniff_format(filename, nlines=5):
+    """
+    Guess the format of a catalog file from its first few lines.
+
+    :returns: format name, as registered with register_format
+    """
+    head = []
+    if not os.path.isdir(filename):
+        with open(filename, 'r', errors='replace') as ifile:
+            head = [line for _, line in zip(range(nlines), ifile)]
+    for name, (_, sniff) in CATALOG_FORMATS.items():
+        if sniff is not None and sniff(filename, head):
+            return name
+    raise ValueError("Could not recognize the catalog format of %s; pass the format name explicitly" % filename)
+
+
+@timed(reads_file=True)
+def read_catalog(filename, fmt=None):
+    """
+    Read a catalog file with the reader registered for its format.
+
+    :param filename: string
+    :param fmt: format name, or None to sniff it from the file
+    :returns: catalog
+    :rtype: Catalog
+    """
+    fmt = sniff_format(filename) if fmt is None else fmt
+    reader, _ = CATALOG_FORMATS[fmt]
+    MyCat = reader(filename)
+    return MyCat if isinstance(MyCat, Catalog) else Catalog(MyCat)
+
+
+@timed(reads_file=True)
+def load_many(filenames, formats=None, n_workers=None, vstack=False):
+    """
+    Read many catalog files at once, one file per worker process.
+
+    :param filenames: list of strings
+    :param formats: list of format names (or None entries) matching filenames, or None to sniff every file
+    :param n_workers: number of worker processes. Default: one per file, up to the number of CPUs.
+    :param vstack: if True, return one catalog with all the files' events, in the order of filenames
+    :returns: list of catalogs (or one catalog), and a list of LoadTiming (filename, format, seconds, n_events)
+    """
+    if formats is None:
+        formats = [None] * len(filenames)
+    formats = [sniff_format(filename) if fmt is None else fmt for filename, fmt in zip(filenames, formats)]
+    if n_workers == 1 or len(filenames) < 2:
+        results = [_timed_read(filename, fmt) for filename, fmt in zip(filenames, formats)]
+    else:
+        n_workers = min(len(filenames), n_workers or os.cpu_count() or 1)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_timed_read, filenames, formats))
+    catalogs = [MyCat for MyCat, _ in results]
+    timings = [timing for _, timing in results]
+    for timing in timings:
+        logger.info("Loaded %d events from %s (%s) in %.2f s", timing.n_events, timing.filename, timing.format,
+                    timing.seconds)
+    if vstack:
+        return Catalog.concatenate(catalogs), timings
+    return catalogs, timings
+
+
+def _timed_read(filename, fmt):
+    start = time.perf_counter()
+    MyCat = read_catalog(filename, fmt)
+    return MyCat, LoadTiming(filename, fmt, time.perf_counter() - start, len(MyCat))
+
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_numeric_table(line, min_columns=11):
+    fields = line.split()
+    return len(fields) >= min_columns and all(_is_number(x) for x in fields[0:6])
+
+
+def _sniff_binary(filename, head):
+    return os.path.isfile(os.path.join(filename, 'header.json'))
+
+
+def _sniff_quakeml(filename, head):
+    return filename.endswith('.xml') or any('quakeml' in line for line in head)
+
+
+def _sniff_usgs_csv(filename, head):
+    return len(head) > 0 and head[0].startswith('time,latitude,longitude')
+
+
+def _sniff_sil(filename, head):
+    return len(head) > 0 and 'SIL_lon' in head[0]
+
+
+def _sniff_simple_txt(filename, head):
+    return any(line.startswith('# date, lon, lat, depth, magnitude') for line in head)
+
+
+def _sniff_intxt(filename, head):
+    return any(line.startswith('Source_FM:') for line in head)
+
+
+def _sniff_wech(filename, head):
+    return any('yyyy-mm-dd' in line for line in head)
+
+
+def _sniff_pnsn052019(filename, head):
+    return any(line.split(',')[0].strip() == 'lat' for line in head)
+
+
+def _sniff_ide_tremor(filename, head):
+    return any(re.match(r'\d{4}-\d{2}-\d{2},', line) for line in head)
+
+
+def _sniff_scsn(filename, head):
+    return any(len(line.split()) == 13 and re.match(r'\d{4}/\d{2}/\d{2}', line) for line in head)
+
+
+def _sniff_qtm(filename, head):
+    header = head[0].split() if head else []
+    return len(head) > 1 and len(header) > 0 and not _is_number(header[0]) and _is_numeric_table(head[1])
+
+
+def _sniff_shearer(filename, head):
+    return len(head) > 0 and _is_numeric_table(head[0])
+
+
+register_format('binary', read_binary_catalog, _sniff_binary)
+register_format('quakeml', read_quakeml, _sniff_quakeml)
+register_format('usgs_csv', read_usgs_website_csv, _sniff_usgs_csv)
+register_format('sil', read_SIL_catalog, _sniff_sil)
+register_format('simple_txt', read_simple_catalog_txt, _sniff_simple_txt)
+register_format('intxt', read_intxt_fms, _sniff_intxt)
+register_format('wech', read_wech, _sniff_wech)
+register_format('wech_custom', read_wech_custom)  # same layout as 'wech' up to column order, so never sniffed
+register_format('pnsn052019', read_pnsn052019_file, _sniff_pnsn052019)
+register_format('ide_tremor', read_ide_tremor, _sniff_ide_tremor)
+register_format('scsn', read_scsn_txt, _sniff_scsn)
+register_format('qtm', input_qtm, _sniff_qtm)
+register_format('shearer', input_shearer_cat, _sniff_shearer)
+register_format('txyzm', read_txyzm)
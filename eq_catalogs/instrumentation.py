@@ -0,0 +1,213 @@
+"""
+Logging and timing instrumentation for eq_catalogs.
+
+Messages go to the 'eq_catalogs' logger, which only has a NullHandler: how they are shown is up to the
+application's logging configuration.  Scripts that want the old print() behavior can call log_to_stdout(), which
+writes INFO-level messages to stdout; set_log_level('WARNING') quiets them again.
+
+Readers, filters, writers, and plots are wrapped in timed(), which records a CallMetric for each call (wall time,
+rows in, rows out, bytes read) while metrics are being collected:
+
+    with instrumentation.collect_metrics() as metrics:
+        MyCat = file_io.input_qtm(filename).restrict_cat_box(bbox)
+    metrics.to_json('metrics.json')
+
+The collector and the nesting depth are context variables, so each thread (and asyncio task) collects its own
+metrics.  Outside collect_metrics(), a timed function costs one extra function call and a context variable lookup.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import functools
+import contextlib
+import contextvars
+import collections
+
+logger = logging.getLogger('eq_catalogs')
+
+CallMetric = collections.namedtuple('CallMetric', ['name', 'seconds', 'rows_in', 'rows_out', 'bytes_read', 'start',
+                                                   'depth'])
+CallMetric.__doc__ = """
+name: name of the timed function or block
+seconds: wall time of the call
+rows_in: number of events in the catalog passed in, or None
+rows_out: number of events in the catalog returned, or None
+bytes_read: size of the file(s) read, or None
+start: time.time() at the start of the call
+depth: nesting level (0 for the outermost timed call)
+"""
+
+_active = contextvars.ContextVar('eq_catalogs_metrics', default=None)  # MetricsCollector receiving records, or None
+_depth = contextvars.ContextVar('eq_catalogs_metrics_depth', default=0)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout, so messages follow redirect_stdout like print() did."""
+    def __init__(self):
+        super().__init__(sys.stdout)
+        self.setFormatter(logging.Formatter('%(message)s'))
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _value):
+        pass
+
+
+logger.addHandler(logging.NullHandler())
+_stdout_handler = _StdoutHandler()
+
+
+def set_log_level(level):
+    """
+    :param level: logging level, such as logging.WARNING or 'DEBUG'
+    """
+    logger.setLevel(level)
+    return
+
+
+def log_to_stdout(level=logging.INFO):
+    """
+    Opt in to printing the package's messages to stdout (in addition to any handlers of the application).
+
+    :param level: logging level of the eq_catalogs logger
+    """
+    if _stdout_handler not in logger.handlers:
+        logger.addHandler(_stdout_handler)
+    logger.setLevel(level)
+    return
+
+
+def log_to_root():
+    """Undo log_to_stdout: stop printing to stdout, and leave messages to the application's logging setup."""
+    logger.removeHandler(_stdout_handler)
+    logger.setLevel(logging.NOTSET)
+    return
+
+
+class MetricsCollector:
+    """The CallMetric records of one pipeline run."""
+    def __init__(self):
+        self.records = []
+
+    def summary(self):
+        """
+        :returns: dict from name to totals over its calls (calls, seconds, rows_in, rows_out, bytes_read)
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record.name, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0,
+                                                    'bytes_read': 0})
+            total['calls'] += 1
+            total['seconds'] += record.seconds
+            for field in ('rows_in', 'rows_out', 'bytes_read'):
+                total[field] += getattr(record, field) or 0
+        return totals
+
+    def to_dict(self):
+        return {'records': [record._asdict() for record in self.records], 'summary': self.summary()}
+
+    def to_json(self, filename):
+        with open(filename, 'w') as ofile:
+            json.dump(self.to_dict(), ofile, indent=1)
+        logger.info("Writing %d timing records to %s", len(self.records), filename)
+        return
+
+
+@contextlib.contextmanager
+def collect_metrics():
+    """
+    Record timed calls made inside the with-block.  Records of a nested collection also go to the outer one.
+
+    :returns: MetricsCollector
+    """
+    previous, collector = _active.get(), MetricsCollector()
+    token = _active.set(collector)
+    try:
+        yield collector
+    finally:
+        _active.reset(token)
+        if previous is not None:
+            previous.records.extend(collector.records)
+
+
+def _rows(value):
+    """Number of events, if value is a catalog (or a tuple starting with one)."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return len(value) if hasattr(value, 'dt') and hasattr(value, 'Mag') else None
+
+
+def _file_bytes(value):
+    """Size of a file, or the total size of a list of files."""
+    filenames = [value] if isinstance(value, (str, os.PathLike)) else value
+    try:
+        return sum(os.path.getsize(filename) for filename in filenames)
+    except (OSError, TypeError):
+        return None
+
+
+def _record(collector, name, seconds, rows_in, rows_out, bytes_read, start, depth):
+    record = CallMetric(name, seconds, rows_in, rows_out, bytes_read, start, depth)
+    collector.records.append(record)
+    logger.debug("%s: %.4f s, rows in %s, rows out %s, bytes read %s", name, seconds, rows_in, rows_out, bytes_read)
+    return
+
+
+def timed(name=None, reads_file=False):
+    """
+    Decorator that records the wall time of each call while metrics are being collected.
+    Rows in come from a catalog given as the first argument (or self), and rows out from a returned catalog.
+
+    :param name: name of the records (default: the function's qualified name)
+    :param reads_file: the first argument is a file name (or list of file names) whose size is bytes_read
+    """
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            collector = _active.get()
+            if collector is None:
+                return function(*args, **kwargs)
+            start, wall_start = time.perf_counter(), time.time()
+            depth = _depth.get()
+            token = _depth.set(depth + 1)
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                _depth.reset(token)
+            first = args[0] if args else None
+            _record(collector, label, time.perf_counter() - start, None if reads_file else _rows(first),
+                    _rows(result), _file_bytes(first) if reads_file else None, wall_start, depth)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def timer(name, rows_in=None, bytes_read=None):
+    """
+    Time a block of code while metrics are being collected.  The block can fill in fields['rows_out'].
+
+    :returns: dict of fields (rows_in, rows_out, bytes_read)
+    """
+    fields = {'rows_in': rows_in, 'rows_out': None, 'bytes_read': bytes_read}
+    collector = _active.get()
+    if collector is None:
+        yield fields
+        return
+    start, wall_start = time.perf_counter(), time.time()
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    try:
+        yield fields
+    finally:
+        _depth.reset(token)
+    _record(collector, name, time.perf_counter() - start, fields['rows_in'], fields['rows_out'], fields['bytes_read'],
+            wall_start, depth)
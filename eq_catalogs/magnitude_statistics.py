@@ -0,0 +1,301 @@
+"""
+Frequency-magnitude statistics: the frequency-magnitude distribution (FMD), the magnitude of completeness Mc
+(maximum curvature, goodness-of-fit, and b-value stability), and Aki/Utsu b-values with bootstrap uncertainties.
+
+Everything is computed from the binned FMD.  One pass over the magnitudes fills the bins; then the number, mean,
+and spread of the magnitudes above every trial Mc come from cumulative sums over the bins.  Bootstrap samples are
+drawn as multinomial resamples of the bin counts, which is the same as resampling the binned magnitudes.
+Mapped b-values and Mc use the catalog's spatial index to find the events near each node.
+"""
+
+import collections
+import concurrent.futures
+import numpy as np
+from .instrumentation import logger, timed
+
+FMD = collections.namedtuple('FMD', ['magnitudes', 'counts', 'cumulative', 'dM'])
+FMD.__doc__ = """
+magnitudes: centers of the magnitude bins
+counts: number of events in each bin
+cumulative: number of events in each bin and above
+dM: bin width
+"""
+GRFit = collections.namedtuple('GRFit', ['Mc', 'b', 'a', 'b_err', 'n_events', 'Mc_std', 'b_std'],
+                               defaults=[np.nan, np.nan])
+GRFit.__doc__ = """
+Gutenberg-Richter fit log10 N(M >= m) = a - b m, for the events with M >= Mc.
+b_err: Shi and Bolt (1982) uncertainty of b
+n_events: number of events with M >= Mc
+Mc_std, b_std: standard deviations of Mc and b over the bootstrap samples (nan without bootstrap)
+"""
+MC_METHODS = ('maxc', 'gft', 'mbs')
+
+_worker_state = {}  # spatial index and magnitude bins of the catalog being mapped; only set in pool workers
+
+
+# ----------- FREQUENCY-MAGNITUDE DISTRIBUTION ---------- #
+def _bin_codes(Mag, dM):
+    """Bin number of each magnitude (magnitudes are binned at multiples of dM); NaN magnitudes are dropped."""
+    Mag = np.asarray(Mag, dtype=float)
+    return np.round(Mag[~np.isnan(Mag)] / dM).astype(np.int64)
+
+
+def frequency_magnitude_distribution(Mag, dM=0.1):
+    """
+    :param Mag: array of magnitudes (NaN values are ignored)
+    :param dM: magnitude bin width
+    :returns: FMD
+    """
+    codes = _bin_codes(Mag, dM)
+    first = int(codes.min()) if len(codes) else 0
+    counts = np.bincount(codes - first)
+    return _make_fmd(first, counts, dM)
+
+
+def _make_fmd(first, counts, dM):
+    magnitudes = np.round((first + np.arange(len(counts))) * dM, 10)
+    return FMD(magnitudes, counts, np.cumsum(counts[::-1])[::-1], dM)
+
+
+def _moments_above(magnitudes, counts):
+    """Number, mean, and sum of squared deviations of the magnitudes in each bin and above."""
+    counts = counts.astype(float)
+    n = np.cumsum(counts[::-1])[::-1]
+    s1 = np.cumsum((counts * magnitudes)[::-1])[::-1]
+    s2 = np.cumsum((counts * magnitudes ** 2)[::-1])[::-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / n
+    return n, mean, np.maximum(s2 - n * mean ** 2, 0)
+
+
+def _b_values(magnitudes, counts, dM):
+    """
+    Aki (1965) maximum-likelihood b-value with Utsu's correction for binning, for each bin as the cutoff,
+    with its a-value and Shi and Bolt (1982) uncertainty.
+    """
+    n, mean, ssd = _moments_above(magnitudes, counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b = np.log10(np.e) / (mean - (magnitudes - dM / 2))
+        b_err = 2.3 * b ** 2 * np.sqrt(ssd / (n * (n - 1)))
+        a = np.log10(n) + b * magnitudes
+    return n, b, a, b_err
+
+
+# ----------- MAGNITUDE OF COMPLETENESS ---------- #
+def _mc_index(magnitudes, counts, dM, method, min_events=50, correction=0.0):
+    """Index of the Mc bin by the chosen method, or -1 if there is no bin with at least min_events above it."""
+    n, b, a, b_err = _b_values(magnitudes, counts, dM)
+    enough = n >= max(min_events, 2)
+    if not np.any(enough):
+        return -1
+    if method == 'maxc':
+        # Maximum curvature (Wiemer and Wyss, 2000): the most populated bin, plus an optional correction.
+        shift = int(round(correction / dM))
+        return int(min(max(np.argmax(counts) + shift, 0), np.flatnonzero(enough)[-1]))
+    if method == 'gft':
+        # Goodness of fit (Wiemer and Wyss, 2000): the lowest cutoff whose Gutenberg-Richter fit explains
+        # 95% of the observed counts above it (or 90%, or else maximum curvature).
+        cumulative = 10 ** (a[:, None] - b[:, None] * magnitudes[None, :])
+        synthetic = cumulative - 10 ** (a[:, None] - b[:, None] * (magnitudes[None, :] + dM))
+        above = magnitudes[None, :] >= magnitudes[:, None]
+        with np.errstate(invalid='ignore'):
+            misfit = np.sum(np.where(above, np.abs(counts[None, :] - synthetic), 0), axis=1) / n
+        residual = 100 * (1 - misfit)
+        for level in (95, 90):
+            passing = np.flatnonzero(enough & (residual >= level))
+            if len(passing):
+                return int(passing[0])
+        return _mc_index(magnitudes, counts, dM, 'maxc', min_events)
+    if method == 'mbs':
+        # b-value stability (Cao and Gao, 2002; Woessner and Wiemer, 2005): the lowest cutoff whose b-value is
+        # within its uncertainty of the mean b-value over the next 0.5 magnitude units of cutoffs.
+        width = max(int(round(0.5 / dM)), 1)
+        for i in np.flatnonzero(enough):
+            if i + width > len(b) or not np.all(enough[i:i + width]):
+                break
+            if abs(np.mean(b[i:i + width]) - b[i]) <= b_err[i]:
+                return int(i)
+        return -1
+    raise ValueError("Unknown Mc method %s; choose from %s" % (method, MC_METHODS))
+
+
+def _fit_counts(magnitudes, counts, dM, method='maxc', Mc=None, min_events=50, correction=0.0):
+    """Gutenberg-Richter fit of binned counts, above a given Mc or an Mc estimated by method."""
+    if Mc is None:
+        i = _mc_index(magnitudes, counts, dM, method, min_events, correction)
+    else:
+        i = int(np.searchsorted(magnitudes, Mc - dM / 2))
+        i = -1 if i >= len(magnitudes) else i
+    if i < 0:
+        return GRFit(np.nan if Mc is None else Mc, np.nan, np.nan, np.nan, 0)
+    n, b, a, b_err = _b_values(magnitudes[i:], counts[i:], dM)
+    if n[0] < max(min_events, 2):
+        return GRFit(magnitudes[i], np.nan, np.nan, np.nan, int(n[0]))
+    return GRFit(magnitudes[i], b[0], a[0], b_err[0], int(n[0]))
+
+
+def estimate_mc(Mag, method='maxc', dM=0.1, min_events=50, correction=0.0):
+    """
+    :param Mag: array of magnitudes
+    :param method: 'maxc' (maximum curvature), 'gft' (goodness of fit), or 'mbs' (b-value stability)
+    :param dM: magnitude bin width
+    :param min_events: fewest events above Mc
+    :param correction: added to the maximum-curvature Mc (commonly 0.2)
+    :returns: Mc, or nan if it can't be estimated
+    """
+    return fit_gutenberg_richter(Mag, method=method, dM=dM, min_events=min_events, correction=correction).Mc
+
+
+@timed()
+def fit_gutenberg_richter(Mag, method='maxc', Mc=None, dM=0.1, min_events=50, correction=0.0, n_bootstrap=0,
+                          n_workers=None, seed=0):
+    """
+    Estimate Mc and the Gutenberg-Richter a and b values.
+
+    :param Mag: array of magnitudes
+    :param method: Mc method, 'maxc', 'gft', or 'mbs'
+    :param Mc: fixed magnitude of completeness (then method is not used)
+    :param dM: magnitude bin width
+    :param min_events: fewest events above Mc for a b-value
+    :param correction: added to the maximum-curvature Mc
+    :param n_bootstrap: number of bootstrap samples for Mc_std and b_std (0: no bootstrap)
+    :param n_workers: number of worker processes for the bootstrap
+    :param seed: random seed of the bootstrap
+    :returns: GRFit
+    """
+    fmd = frequency_magnitude_distribution(Mag, dM)
+    fit = _fit_counts(fmd.magnitudes, fmd.counts, dM, method, Mc, min_events, correction)
+    if n_bootstrap > 0:
+        Mc_samples, b_samples = bootstrap_gutenberg_richter(fmd, method, Mc, min_events, correction, n_bootstrap,
+                                                            n_workers, seed)
+        fit = fit._replace(Mc_std=_nanstd(Mc_samples), b_std=_nanstd(b_samples))
+    return fit
+
+
+# ----------- BOOTSTRAP ---------- #
+def bootstrap_gutenberg_richter(fmd, method='maxc', Mc=None, min_events=50, correction=0.0, n_samples=200,
+                                n_workers=None, seed=0):
+    """
+    Bootstrap Mc and b: resample the events with replacement, and refit.  The samples are split into one chunk per
+    worker; each chunk has its own random stream, so the results only depend on seed and n_workers.
+
+    :param fmd: FMD of the catalog
+    :param n_samples: number of bootstrap samples
+    :param n_workers: number of worker processes (default: run in this process)
+    :returns: arrays of Mc and b, one value per sample
+    """
+    n_chunks = max(n_workers or 1, 1)
+    sizes = [len(chunk) for chunk in np.array_split(np.arange(n_samples), n_chunks)]
+    streams = np.random.SeedSequence(seed).spawn(n_chunks)
+    jobs = [(fmd, method, Mc, min_events, correction, size, stream) for size, stream in zip(sizes, streams)]
+    if n_workers:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_bootstrap_chunk, jobs))
+    else:
+        results = [_bootstrap_chunk(job) for job in jobs]
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def _bootstrap_chunk(job):
+    fmd, method, Mc, min_events, correction, n_samples, stream = job
+    rng = np.random.default_rng(stream)
+    total = int(np.sum(fmd.counts))
+    Mc_samples, b_samples = np.full(n_samples, np.nan), np.full(n_samples, np.nan)
+    if total == 0:
+        return Mc_samples, b_samples
+    for s, counts in enumerate(rng.multinomial(total, fmd.counts / total, size=n_samples)):
+        fit = _fit_counts(fmd.magnitudes, counts, fmd.dM, method, Mc, min_events, correction)
+        Mc_samples[s], b_samples[s] = fit.Mc, fit.b
+    return Mc_samples, b_samples
+
+
+def _nanstd(values):
+    values = values[~np.isnan(values)]
+    return float(np.std(values)) if len(values) > 1 else np.nan
+
+
+# ----------- MAPPED MODE ---------- #
+def grid_nodes(bbox, spacing):
+    """
+    :param bbox: [lon0, lon1, lat0, lat1, ...]
+    :param spacing: node spacing, degrees
+    :returns: arrays of node longitudes and latitudes
+    """
+    lons = np.arange(bbox[0], bbox[1] + spacing / 2, spacing)
+    lats = np.arange(bbox[2], bbox[3] + spacing / 2, spacing)
+    lon_grid, lat_grid = np.meshgrid(lons, lats)
+    return lon_grid.ravel(), lat_grid.ravel()
+
+
+@timed()
+def map_gutenberg_richter(MyCat, lons, lats, radius_km=None, n_nearest=None, method='maxc', Mc=None, dM=0.1,
+                          min_events=50, correction=0.0, n_bootstrap=0, n_workers=None, seed=0):
+    """
+    Mc and b-value at each node, from the events within radius_km of the node or from its n_nearest events.
+    Magnitudes are binned once for the whole catalog, and the events of each node come from the catalog's
+    spatial index.  The nodes are split among n_workers worker processes.
+
+    :param MyCat: Catalog
+    :param lons: array of node longitudes
+    :param lats: array of node latitudes
+    :param radius_km: sampling radius (give either radius_km or n_nearest)
+    :param n_nearest: number of nearest events
+    :returns: GRFit of arrays (one value per node), and the sampling radius of each node in km
+    """
+    if (radius_km is None) == (n_nearest is None):
+        raise ValueError("Give exactly one of radius_km and n_nearest")
+    lons, lats = np.atleast_1d(lons).astype(float), np.atleast_1d(lats).astype(float)
+    Mag = np.asarray(MyCat.Mag, dtype=float)
+    finite = ~np.isnan(Mag)
+    codes = np.full(len(Mag), -1, dtype=np.int64)
+    codes[finite] = _bin_codes(Mag, dM)
+    first = int(codes[finite].min()) if np.any(finite) else 0
+    codes[finite] -= first
+    nbins = int(codes.max()) + 1 if len(codes) else 1
+    settings = (radius_km, n_nearest, method, Mc, dM, min_events, correction, n_bootstrap, first, nbins)
+    node_chunks = np.array_split(np.arange(len(lons)), max(n_workers or 1, 1))
+    streams = np.random.SeedSequence(seed).spawn(len(node_chunks))
+    jobs = [(lons[chunk], lats[chunk], stream, settings) for chunk, stream in zip(node_chunks, streams)]
+    if n_workers:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                                    initargs=(MyCat.spatial_index, codes)) as executor:
+            results = list(executor.map(_map_chunk_in_worker, jobs))
+    else:
+        results = [_map_chunk(MyCat.spatial_index, codes, job) for job in jobs]
+    fits = GRFit(*[np.concatenate([fit[n] for fit, _ in results]) for n in range(len(GRFit._fields))])
+    radii = np.concatenate([radius for _, radius in results])
+    logger.info("Mapped Mc and b-value at %d nodes (%d with a b-value)", len(lons), np.sum(~np.isnan(fits.b)))
+    return fits, radii
+
+
+def _init_worker(index, codes):
+    _worker_state.clear()
+    _worker_state.update(index=index, codes=codes)
+
+
+def _map_chunk_in_worker(job):
+    return _map_chunk(_worker_state['index'], _worker_state['codes'], job)
+
+
+def _map_chunk(index, codes, job):
+    lons, lats, stream, settings = job
+    radius_km, n_nearest, method, Mc, dM, min_events, correction, n_bootstrap, first, nbins = settings
+    rng_streams = stream.spawn(len(lons))
+    fits, radii = [], np.full(len(lons), np.nan)
+    for n, (lon, lat) in enumerate(zip(lons, lats)):
+        if n_nearest is not None:
+            idx, distances = index.query_knn(lon, lat, n_nearest)
+            radii[n] = distances[-1] if len(distances) else np.nan
+        else:
+            idx, _ = index.query_radius(lon, lat, radius_km)
+            radii[n] = radius_km
+        node_codes = codes[idx]
+        counts = np.bincount(node_codes[node_codes >= 0], minlength=nbins)
+        fmd = _make_fmd(first, counts, dM)
+        fit = _fit_counts(fmd.magnitudes, counts, dM, method, Mc, min_events, correction)
+        if n_bootstrap > 0 and not np.isnan(fit.b):
+            Mc_samples, b_samples = _bootstrap_chunk((fmd, method, Mc, min_events, correction, n_bootstrap,
+                                                      rng_streams[n]))
+            fit = fit._replace(Mc_std=_nanstd(Mc_samples), b_std=_nanstd(b_samples))
+        fits.append(fit)
+    return [np.array([fit[n] for fit in fits], dtype=float) for n in range(len(GRFit._fields))], radii
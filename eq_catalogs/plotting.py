@@ -1,22 +1,55 @@
 # Functions that plot earthquake catalogs
 
-import matplotlib.pyplot as plt
+# matplotlib is imported inside each plotting function, so that importing this module stays fast.
+
+import numpy as np
 from Tectonic_Utils.seismo import moment_calculations
+from .instrumentation import logger, timed
+
+RASTERIZE_THRESHOLD = 10000  # scatter layers with more points than this are rasterized inside vector figures
+LARGE_CATALOG_THRESHOLD = 50000  # above this, plots decimate (or bin) the catalog instead of drawing every event
+
+
+def decimate_catalog(MyCat, max_points=LARGE_CATALOG_THRESHOLD, largest_fraction=0.5, seed=0):
+    """
+    Magnitude-aware decimation for plotting: always keep the largest events, and fill up to max_points
+    with a random sample of the rest.
+
+    :param MyCat: Catalog
+    :param max_points: number of events to keep
+    :param largest_fraction: fraction of max_points reserved for the largest events
+    :param seed: random seed, so repeated plots look the same
+    :returns: sorted array of the indices of the kept events
+    """
+    n = len(MyCat)
+    if n <= max_points:
+        return np.arange(n)
+    n_largest = int(max_points * largest_fraction)
+    by_magnitude = MyCat.magnitude_order()
+    rest = np.random.default_rng(seed).choice(by_magnitude[n_largest:], max_points - n_largest, replace=False)
+    return np.sort(np.concatenate([by_magnitude[:n_largest], rest]))
 
 
-def plot_lollipop(MyCat, filename, lower_mag=2.5, upper_mag=5.0):
+@timed()
+def plot_lollipop(MyCat, filename, lower_mag=2.5, upper_mag=5.0, max_points=LARGE_CATALOG_THRESHOLD):
     """
     A plot of event magnitude versus time. Looks like lollipops.
+    Stems are drawn as a single LineCollection. Above max_points events, a magnitude-aware subset is drawn.
     """
-    print("Plotting figure %s " % filename)
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection
+    logger.info("Plotting figure %s", filename)
     plt.figure(dpi=300, figsize=(10, 7))
     plt.text(0.66, 0.96, s="%s events between %.2f<M<%.2f" % (len(MyCat), lower_mag, upper_mag),
              transform=plt.gca().transAxes, bbox=dict(boxstyle="round", fc="0.8"))
-    times = [item.dt for item in MyCat]
-    Mags = [item.Mag for item in MyCat]
-    plt.plot(times, Mags, marker='o', markersize=10, linewidth=0, color='black')
-    for item in MyCat:
-        plt.plot([item.dt, item.dt], [0, item.Mag], color='black', linewidth=0.3)
+    keep = decimate_catalog(MyCat, max_points)
+    times, Mags = mdates.date2num(MyCat.dt[keep]), MyCat.Mag[keep]
+    rasterized = len(keep) > RASTERIZE_THRESHOLD
+    plt.plot(times, Mags, marker='o', markersize=10, linewidth=0, color='black', rasterized=rasterized)
+    stems = np.stack([np.column_stack([times, np.zeros(len(times))]), np.column_stack([times, Mags])], axis=1)
+    plt.gca().add_collection(LineCollection(stems, colors='black', linewidths=0.3, rasterized=rasterized))
+    plt.gca().xaxis_date()
     plt.ylabel('Magnitude', fontsize=20)
     plt.xlabel('Time', fontsize=20)
     plt.gca().tick_params(axis='both', which='major', labelsize=16)
@@ -26,8 +59,10 @@ def plot_lollipop(MyCat, filename, lower_mag=2.5, upper_mag=5.0):
     return
 
 
+@timed()
 def plot_seismicity_rate(dtarray, rates, filename, date_boundaries=None):
-    print("Plotting figure %s " % filename)
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", filename)
     plt.figure(dpi=300, figsize=(12, 7))
     plt.plot(dtarray, rates, linewidth=3)
     plt.xlabel('Time', fontsize=20)
@@ -42,15 +77,17 @@ def plot_seismicity_rate(dtarray, rates, filename, date_boundaries=None):
     return
 
 
+@timed()
 def plot_cumulative_eqs(MyCat, outfile, ax_annotations=None):
     """
     Here you can use ax_annotations to operate on the axes and give useful line annotations
     like major earthquakes, time boundaries, etc.
     """
-    print("Plotting figure %s " % outfile)
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", outfile)
     dt_total, eq_total = MyCat.make_cumulative_stack()
     _ = plt.figure(figsize=(18, 9), dpi=300)
-    plt.plot_date(dt_total, eq_total, linewidth=2, linestyle='solid', marker=None, color='blue')
+    plt.plot(dt_total, eq_total, linewidth=2, linestyle='solid', marker=None, color='blue')
     plt.gca().tick_params(axis='both', which='major', labelsize=16)
     if ax_annotations is not None:
         ax_annotations(plt.gca())
@@ -61,14 +98,20 @@ def plot_cumulative_eqs(MyCat, outfile, ax_annotations=None):
     return
 
 
-def plot_cumulative_eqs_with_depths(MyCat, outfile, ax_annotations=None):
-    """Same as previous plotting function, but with dots color coded by depth. """
-    print("Plotting figure %s " % outfile)
+@timed()
+def plot_cumulative_eqs_with_depths(MyCat, outfile, ax_annotations=None, max_points=LARGE_CATALOG_THRESHOLD):
+    """
+    Same as previous plotting function, but with dots color coded by depth.
+    Above max_points events, a magnitude-aware subset of the dots is drawn (see decimate_catalog).
+    """
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", outfile)
     _ = plt.figure(figsize=(18, 9), dpi=300)
-    y_array = range(0, len(MyCat))
-    dtarray = [item.dt for item in MyCat]
-    carray = [item.depth for item in MyCat]
-    plt.scatter(dtarray, y_array, c=carray, s=37, cmap='viridis_r')
+    keep = decimate_catalog(MyCat, max_points)
+    y_array = np.arange(len(MyCat))[keep]
+    dtarray = MyCat.dt[keep]
+    carray = MyCat.depth[keep]
+    plt.scatter(dtarray, y_array, c=carray, s=37, cmap='viridis_r', rasterized=len(keep) > RASTERIZE_THRESHOLD)
     cb = plt.colorbar()
     cb.set_label("Depth (km)", fontsize=20)
     cb.ax.tick_params(labelsize=16)
@@ -82,13 +125,15 @@ def plot_cumulative_eqs_with_depths(MyCat, outfile, ax_annotations=None):
     return
 
 
+@timed()
 def depth_magnitude_histograms(MyCat, outfile):
     """Two side-by-side histograms of depth and magnitude of the catalog."""
-    print("Plotting figure %s " % outfile)
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", outfile)
     f, axarr = plt.subplots(1, 2, figsize=(17, 8), dpi=300)
     fontsize = 30
-    depths = [i.depth for i in MyCat]
-    mags = [i.Mag for i in MyCat]
+    depths = MyCat.depth[~np.isnan(MyCat.depth)]
+    mags = MyCat.Mag[~np.isnan(MyCat.Mag)]
     axarr[0].hist(depths)
     axarr[0].set_xlabel('Depth (km)', fontsize=fontsize)
     axarr[0].set_ylabel('Number of Events', fontsize=fontsize)
@@ -103,21 +148,54 @@ def depth_magnitude_histograms(MyCat, outfile):
     return
 
 
-def map_seismicity(MyCat, outfile, ax_annotations=None):
+@timed()
+def plot_frequency_magnitude(MyCat, outfile, method='maxc', dM=0.1):
+    """
+    Frequency-magnitude distribution (per bin and cumulative) with the Gutenberg-Richter fit above Mc.
+    :param method: Mc method, 'maxc', 'gft', or 'mbs' (see magnitude_statistics)
+    """
+    from . import magnitude_statistics
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", outfile)
+    fmd = magnitude_statistics.frequency_magnitude_distribution(MyCat.Mag, dM)
+    fit = magnitude_statistics.fit_gutenberg_richter(MyCat.Mag, method=method, dM=dM)
+    plt.figure(figsize=(10, 8), dpi=300)
+    plt.semilogy(fmd.magnitudes, fmd.cumulative, marker='s', linestyle='none', color='black', label='Cumulative')
+    plt.semilogy(fmd.magnitudes, fmd.counts, marker='^', linestyle='none', color='gray', label='Per bin')
+    if not np.isnan(fit.b):
+        mags = fmd.magnitudes[fmd.magnitudes >= fit.Mc]
+        plt.semilogy(mags, 10 ** (fit.a - fit.b * mags), color='red',
+                     label='Mc=%.1f, b=%.2f$\\pm$%.2f' % (fit.Mc, fit.b, fit.b_err))
+        plt.axvline(fit.Mc, color='red', linestyle='--')
+    plt.xlabel('Magnitude', fontsize=16)
+    plt.ylabel('Number of Events', fontsize=16)
+    plt.legend(fontsize=14)
+    plt.savefig(outfile)
+    return
+
+
+@timed()
+def map_seismicity(MyCat, outfile, ax_annotations=None, max_points=LARGE_CATALOG_THRESHOLD, large_mode='decimate'):
     """
     A general function for mapping a seismicity catalog in lat/lon space
     Additional information can be passed in with the ax_annotations function
+    Above max_points events, large_mode chooses between 'decimate' (magnitude-aware subset, see decimate_catalog)
+    and 'hexbin' (a map of event density).
     """
-    print("Plotting figure %s " % outfile)
+    import matplotlib.pyplot as plt
+    logger.info("Plotting figure %s", outfile)
     plt.figure(figsize=(14, 12), dpi=300)
-    lons = [i.lon for i in MyCat]
-    lats = [i.lat for i in MyCat]
-    Mags = [i.Mag for i in MyCat]
-    depths = [i.depth for i in MyCat]
-    plt.scatter(lons, lats, s=Mags, c=depths, cmap='viridis_r')
-    cb = plt.colorbar()
+    if len(MyCat) > max_points and large_mode == 'hexbin':
+        plt.hexbin(MyCat.lon, MyCat.lat, gridsize=300, bins='log', mincnt=1, cmap='viridis', rasterized=True)
+        cb = plt.colorbar()
+        cb.set_label("Number of events", fontsize=16)
+    else:
+        keep = decimate_catalog(MyCat, max_points)
+        plt.scatter(MyCat.lon[keep], MyCat.lat[keep], s=MyCat.Mag[keep], c=MyCat.depth[keep], cmap='viridis_r',
+                    rasterized=len(keep) > RASTERIZE_THRESHOLD)
+        cb = plt.colorbar()
+        cb.set_label("Depth (km)", fontsize=16)
     cb.ax.tick_params(labelsize=14)
-    cb.set_label("Depth (km)", fontsize=16)
     if ax_annotations is not None:
         ax_annotations(plt.gca())
     plt.title(MyCat[0].catname + " Catalog: %d events " % len(MyCat), fontsize=20)
@@ -128,16 +206,16 @@ def map_seismicity(MyCat, outfile, ax_annotations=None):
     return
 
 
+@timed()
 def write_catalog_total_moments(MyCat, outputfile):
     """
     Write a few summary metrics of the catalog into a text file. Includes total moment and equivalent magnitude.
     """
     Moment = MyCat.compute_total_moment()
     Mw_total = moment_calculations.mw_from_moment(Moment)
-    print("Total Moment Equivalent (Mw) from %d events: %f" % (len(MyCat), Mw_total))
-    ofile = open(outputfile, 'w')
+    logger.info("Total Moment Equivalent (Mw) from %d events: %f", len(MyCat), Mw_total)
     M_total_str = "{:.2e}".format(Moment)
-    ofile.write("Total Moment from %d events: %s N-m\n" % (len(MyCat), M_total_str))
-    ofile.write("Total Moment Equivalent (Mw) from %d events: %f\n" % (len(MyCat), Mw_total))
-    ofile.close()
+    with open(outputfile, 'w') as ofile:
+        ofile.write("Total Moment from %d events: %s N-m\n" % (len(MyCat), M_total_str))
+        ofile.write("Total Moment Equivalent (Mw) from %d events: %f\n" % (len(MyCat), Mw_total))
     return
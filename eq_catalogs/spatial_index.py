@@ -0,0 +1,140 @@
+"""
+A uniform-grid spatial index on event longitudes/latitudes, for box, radius, and nearest-neighbor queries.
+Events are sorted by grid cell, so each cell (and each row of cells) is a contiguous run of the sorted order.
+Queries only touch the events in cells that overlap the search region.  Radius and nearest-neighbor searches wrap
+around in longitude, so a region crossing +-180 also searches the cells on the other side.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+
+
+def haversine_km(lon0, lat0, lons, lats):
+    """
+    Great-circle distance from one point to many points.
+
+    :param lon0: longitude of the origin, degrees
+    :param lat0: latitude of the origin, degrees
+    :param lons: array of longitudes, degrees
+    :param lats: array of latitudes, degrees
+    :returns: array of distances, in km
+    """
+    lat0, lats = np.radians(lat0), np.radians(lats)
+    dlat = lats - lat0
+    dlon = np.radians(np.subtract(lons, lon0))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat0) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex:
+    def __init__(self, lon, lat, events_per_cell=16):
+        """
+        :param lon: array of longitudes
+        :param lat: array of latitudes
+        :param events_per_cell: average number of events per grid cell, used to pick the cell size
+        """
+        self.lon, self.lat = lon, lat
+        self.n = len(lon)
+        valid = np.flatnonzero(~np.isnan(lon) & ~np.isnan(lat))
+        if len(valid) == 0:
+            self.lon0, self.lat0, self.dx, self.dy, self.nx, self.ny = 0.0, 0.0, 1.0, 1.0, 1, 1
+            self.order, self.cell_starts = valid, np.zeros(2, dtype=np.int64)
+            return
+        self.lon0, lon1 = float(lon[valid].min()), float(lon[valid].max())
+        self.lat0, lat1 = float(lat[valid].min()), float(lat[valid].max())
+        width, height = max(lon1 - self.lon0, 1e-6), max(lat1 - self.lat0, 1e-6)
+        ncells = max(1, len(valid) // events_per_cell)
+        self.nx = int(np.clip(np.ceil(np.sqrt(ncells * width / height)), 1, 4096))
+        self.ny = int(np.clip(np.ceil(ncells / self.nx), 1, 4096))
+        self.dx, self.dy = width / self.nx, height / self.ny
+        cells = self._cell_y(lat[valid]) * self.nx + self._cell_x(lon[valid])
+        sort_order = np.argsort(cells, kind='stable')
+        self.order = valid[sort_order]
+        self.cell_starts = np.searchsorted(cells[sort_order], np.arange(self.nx * self.ny + 1))
+
+    def is_current(self, lon, lat):
+        """True if the index was built on exactly these coordinate arrays."""
+        return lon is self.lon and lat is self.lat and len(lon) == self.n
+
+    def _cell_x(self, lons):
+        return np.clip(np.floor((lons - self.lon0) / self.dx), 0, self.nx - 1).astype(np.int64)
+
+    def _cell_y(self, lats):
+        return np.clip(np.floor((lats - self.lat0) / self.dy), 0, self.ny - 1).astype(np.int64)
+
+    def _candidates(self, lonW, lonE, latS, latN):
+        """Indices of all events in grid cells overlapping the box."""
+        ix0, ix1 = self._cell_x(np.array([lonW, lonE]))
+        iy0, iy1 = self._cell_y(np.array([latS, latN]))
+        runs = [self.order[self.cell_starts[iy * self.nx + ix0]:self.cell_starts[iy * self.nx + ix1 + 1]]
+                for iy in range(iy0, iy1 + 1)]
+        return np.concatenate(runs)
+
+    def _wrapped_candidates(self, lonW, lonE, latS, latN):
+        """Like _candidates, but a longitude range reaching past +-180 also covers its copies shifted by 360."""
+        if lonE - lonW >= 360.0:
+            return self._candidates(self.lon0, self.lon0 + self.nx * self.dx, latS, latN)
+        runs = [self._candidates(lonW + shift, lonE + shift, latS, latN) for shift in (-360.0, 0.0, 360.0)
+                if lonE + shift >= self.lon0 and lonW + shift <= self.lon0 + self.nx * self.dx]
+        return np.concatenate(runs) if runs else np.zeros(0, dtype=np.int64)
+
+    def query_box(self, lonW, lonE, latS, latN):
+        """
+        :returns: sorted indices of the events with lonW <= lon <= lonE and latS <= lat <= latN
+        """
+        if lonW > lonE or latS > latN or self.n == 0:
+            return np.zeros(0, dtype=np.int64)
+        idx = self._candidates(lonW, lonE, latS, latN)
+        lons, lats = self.lon[idx], self.lat[idx]
+        idx = idx[(lons >= lonW) & (lons <= lonE) & (lats >= latS) & (lats <= latN)]
+        return np.sort(idx)
+
+    def query_radius(self, lon, lat, radius_km):
+        """
+        :param lon: longitude of the center, degrees
+        :param lat: latitude of the center, degrees
+        :param radius_km: search radius, km (great-circle)
+        :returns: sorted indices of the events within radius_km of the center, and their distances in km
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        coslat = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+        dlon = 360.0 if coslat < 1e-6 else dlat / coslat
+        if self.n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        idx = self._wrapped_candidates(lon - dlon, lon + dlon, lat - dlat, lat + dlat)
+        distances = haversine_km(lon, lat, self.lon[idx], self.lat[idx])
+        keep = np.flatnonzero(distances <= radius_km)
+        keep = keep[np.argsort(idx[keep])]
+        return idx[keep], distances[keep]
+
+    def query_knn(self, lon, lat, k):
+        """
+        Find the k nearest events to a point, expanding the searched block of cells until the k-th neighbor is
+        guaranteed to be inside it.
+
+        :param lon: longitude of the point, degrees
+        :param lat: latitude of the point, degrees
+        :param k: number of neighbors
+        :returns: indices of the k nearest events (closest first), and their distances in km
+        """
+        k = min(k, len(self.order))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        nrings = 1
+        while True:
+            lonW, lonE = lon - nrings * self.dx, lon + nrings * self.dx
+            latS, latN = lat - nrings * self.dy, lat + nrings * self.dy
+            idx = self._wrapped_candidates(lonW, lonE, latS, latN)
+            covers_all = (lonE - lonW >= 360.0 or (lonW <= self.lon0 and lonE >= self.lon0 + self.nx * self.dx)) \
+                and latS <= self.lat0 and latN >= self.lat0 + self.ny * self.dy
+            if len(idx) >= k:
+                distances = haversine_km(lon, lat, self.lon[idx], self.lat[idx])
+                nearest = np.argpartition(distances, k - 1)[:k]
+                nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+                coslat = np.cos(np.radians(min(abs(lat) + nrings * self.dy, 90.0)))
+                searched_km = nrings * min(self.dy, self.dx * coslat) * KM_PER_DEGREE
+                if covers_all or distances[nearest[-1]] <= searched_km:
+                    return idx[nearest], distances[nearest]
+            nrings *= 2
@@ -0,0 +1,160 @@
+"""
+Seeded synthetic earthquake catalogs, for benchmarks and tests: Gutenberg-Richter magnitudes, background events,
+and clustered aftershock sequences, with writers for the QTM, Shearer, and USGS-CSV text formats that file_io reads.
+"""
+
+import datetime as dt
+import numpy as np
+from .eqcat_object import Catalog
+from .spatial_index import KM_PER_DEGREE
+from .file_io import atomic_text_file, write_formatted_rows
+from .instrumentation import logger, timed
+
+DEFAULT_BBOX = [-121.0, -114.0, 32.0, 37.0, 0.0, 25.0]
+US_PER_DAY = 86400e6
+
+
+def gutenberg_richter_magnitudes(rng, n, b=1.0, Mmin=0.0, Mmax=7.5, upper=None):
+    """
+    Draw magnitudes from a truncated Gutenberg-Richter distribution.
+
+    :param rng: numpy random Generator
+    :param n: number of magnitudes
+    :param b: b-value
+    :param Mmin: smallest magnitude
+    :param Mmax: largest magnitude
+    :param upper: optional array of per-event upper limits (each below or equal to Mmax)
+    :returns: array of magnitudes
+    """
+    upper = np.full(n, Mmax) if upper is None else np.maximum(np.minimum(upper, Mmax), Mmin)
+    u = rng.random(n)
+    return Mmin - np.log10(1 - u * (1 - 10 ** (-b * (upper - Mmin)))) / b
+
+
+@timed()
+def make_synthetic_catalog(n_events, seed=0, b=1.0, Mmin=0.0, Mmax=7.5, clustered_fraction=0.4, bbox=None,
+                           starttime=dt.datetime(2000, 1, 1), endtime=dt.datetime(2020, 1, 1), productivity=0.8,
+                           p=1.1, c_days=0.01, max_sequence_days=365.0, catname='Synthetic'):
+    """
+    Make a time-sorted synthetic catalog.  Background events are uniform in time and spread over a few dozen
+    Gaussian clusters of seismicity in the box.  Aftershocks are given to background events in proportion to
+    10^(productivity * M), at Omori-Utsu delays, within about a rupture length of their mainshock, and
+    smaller than it.  Aftershock times past the end of the catalog wrap around to the start.
+
+    :param n_events: number of events
+    :param seed: random seed; the same seed gives the same catalog
+    :param b: Gutenberg-Richter b-value
+    :param Mmin: smallest magnitude
+    :param Mmax: largest magnitude
+    :param clustered_fraction: fraction of events that are aftershocks
+    :param bbox: [W, E, S, N, top, bottom]; default DEFAULT_BBOX
+    :param starttime: dt object
+    :param endtime: dt object
+    :param productivity: alpha of the aftershock productivity 10^(alpha M), relative to b
+    :param p: Omori-Utsu p (greater than 1)
+    :param c_days: Omori-Utsu c, days
+    :param max_sequence_days: longest aftershock delay, days
+    :param catname: string
+    :returns: Catalog
+    """
+    rng = np.random.default_rng(seed)
+    bbox = DEFAULT_BBOX if bbox is None else bbox
+    t0 = np.datetime64(starttime, 'us')
+    span = float((np.datetime64(endtime, 'us') - t0) / np.timedelta64(1, 'us'))
+    n_clustered = int(n_events * clustered_fraction) if n_events > 1 else 0
+    n_background = n_events - n_clustered
+
+    # Background: clumps of seismicity of different sizes and rates, plus a uniform part.
+    n_clumps = 40
+    centers_lon = rng.uniform(bbox[0], bbox[1], n_clumps)
+    centers_lat = rng.uniform(bbox[2], bbox[3], n_clumps)
+    widths = rng.uniform(0.02, 0.3, n_clumps)
+    clump = rng.choice(n_clumps + 1, n_background, p=rng.dirichlet(np.ones(n_clumps + 1)))
+    uniform = clump == n_clumps
+    clump = np.minimum(clump, n_clumps - 1)
+    lon = np.where(uniform, rng.uniform(bbox[0], bbox[1], n_background),
+                   centers_lon[clump] + rng.normal(0, 1, n_background) * widths[clump])
+    lat = np.where(uniform, rng.uniform(bbox[2], bbox[3], n_background),
+                   centers_lat[clump] + rng.normal(0, 1, n_background) * widths[clump])
+    times = rng.uniform(0, span, n_background)
+    mags = gutenberg_richter_magnitudes(rng, n_background, b, Mmin, Mmax)
+    depth = np.clip(rng.gamma(4.0, (bbox[5] - bbox[4]) / 12.0, n_background) + bbox[4], bbox[4], bbox[5])
+
+    # Aftershocks.
+    if n_clustered > 0 and n_background > 0:
+        weights = 10 ** (productivity * b * (mags - mags.max()))
+        parent = np.repeat(np.arange(n_background), rng.multinomial(n_clustered, weights / weights.sum()))
+        delay = _omori_delays(rng, n_clustered, p, c_days, max_sequence_days) * US_PER_DAY
+        rupture_km = 10 ** (0.5 * mags[parent] - 1.8) + 0.5
+        offset_lat = rng.normal(0, 1, n_clustered) * rupture_km / KM_PER_DEGREE
+        offset_lon = rng.normal(0, 1, n_clustered) * rupture_km / KM_PER_DEGREE / np.cos(np.radians(lat[parent]))
+        lon = np.concatenate([lon, lon[parent] + offset_lon])
+        lat = np.concatenate([lat, lat[parent] + offset_lat])
+        times = np.concatenate([times, np.mod(times[parent] + delay, span)])
+        mags = np.concatenate([mags, gutenberg_richter_magnitudes(rng, n_clustered, b, Mmin, Mmax,
+                                                                  upper=mags[parent] - 0.1)])
+        depth = np.concatenate([depth, np.clip(depth[parent] + rng.normal(0, 1.5, n_clustered), bbox[4], bbox[5])])
+
+    order = np.argsort(times, kind='stable')
+    dtarray = t0 + times[order].astype(np.int64).astype('timedelta64[us]')
+    MyCat = Catalog.from_arrays(dtarray, lon[order], lat[order], np.round(depth[order], 3), np.round(mags[order], 2),
+                                catname=catname)
+    logger.info("Made synthetic catalog of %d events (%d aftershocks)", len(MyCat), n_clustered)
+    return MyCat
+
+
+def _omori_delays(rng, n, p, c_days, max_days):
+    """Delays (days) from the Omori-Utsu rate (c + t)^-p, truncated at max_days, by inverting the CDF."""
+    u = rng.random(n)
+    top = 1 - (c_days / (c_days + max_days)) ** (p - 1)
+    return c_days * ((1 - u * top) ** (-1 / (p - 1)) - 1)
+
+
+# ---------- TEXT RENDERINGS ---------- #
+def _time_columns(dtarray):
+    """Year, month, day, hour, minute, and decimal seconds of a datetime64 array."""
+    dtarray = dtarray.astype('datetime64[us]')
+    years = dtarray.astype('datetime64[Y]')
+    months = dtarray.astype('datetime64[M]')
+    days = dtarray.astype('datetime64[D]')
+    seconds = (dtarray - days) / np.timedelta64(1, 's')
+    return [years.astype(np.int64) + 1970, (months - years.astype('datetime64[M]')).astype(np.int64) + 1,
+            (days - months.astype('datetime64[D]')).astype(np.int64) + 1, (seconds // 3600).astype(np.int64),
+            (seconds % 3600 // 60).astype(np.int64), np.floor(seconds % 60 * 1000) / 1000]
+
+
+@timed()
+def write_qtm_format(MyCat, filename):
+    """Write a catalog in the text format of the QTM catalog (read back with file_io.input_qtm)."""
+    logger.info("Writing QTM-format catalog of length %d in %s", len(MyCat), filename)
+    ids = np.arange(len(MyCat))
+    with atomic_text_file(filename) as ofile:
+        ofile.write("YEAR MONTH DAY HOUR MINUTE SECOND EVENTID LATITUDE LONGITUDE DEPTH MAGNITUDE "
+                    "NEIGHBOR_ID NEIGHBOR_NUM\n")
+        write_formatted_rows(ofile, "%d %02d %02d %02d %02d %06.3f %d %.5f %.5f %.3f %.2f 0 0\n",
+                              _time_columns(MyCat.dt) + [ids, MyCat.lat, MyCat.lon, MyCat.depth, MyCat.Mag])
+    return
+
+
+@timed()
+def write_shearer_format(MyCat, filename):
+    """Write a catalog in the text format of the Hauksson/Shearer catalogs (read with file_io.input_shearer_cat)."""
+    logger.info("Writing Shearer-format catalog of length %d in %s", len(MyCat), filename)
+    ids = np.arange(len(MyCat))
+    line_format = "%d %02d %02d %02d %02d %06.3f %d %.5f %.5f %.3f %.2f 12 34 0.010 0.100 0.200 l ct Poly5\n"
+    with atomic_text_file(filename) as ofile:
+        write_formatted_rows(ofile, line_format,
+                              _time_columns(MyCat.dt) + [ids, MyCat.lat, MyCat.lon, MyCat.depth, MyCat.Mag])
+    return
+
+
+@timed()
+def write_usgs_csv_format(MyCat, filename):
+    """Write a catalog like a USGS website download (read with file_io.read_usgs_website_csv)."""
+    logger.info("Writing USGS-format catalog of length %d in %s", len(MyCat), filename)
+    times = np.char.add(np.datetime_as_string(MyCat.dt, unit='ms'), 'Z')
+    with atomic_text_file(filename) as ofile:
+        ofile.write("time,latitude,longitude,depth,mag,magType\n")
+        write_formatted_rows(ofile, "%s,%.4f,%.4f,%.2f,%.2f,ml\n", [times, MyCat.lat, MyCat.lon, MyCat.depth,
+                                                                     MyCat.Mag])
+    return
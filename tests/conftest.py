@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from eq_catalogs.eqcat_object import Catalog
+
+
+@pytest.fixture
+def make_catalog():
+    """
+    Factory of small random catalogs: events uniform in a region [W, E, S, N, top, bottom], with time-sorted
+    times over 300 days of 2010 and magnitudes between 1 and 4.
+    """
+    def _make(n=200, seed=0, catname='test', bbox=None, region=(-117, -116, 33, 34, 0, 20)):
+        rng = np.random.default_rng(seed)
+        times = np.datetime64('2010-01-01', 'us') + np.sort(rng.integers(0, 300 * 86400, n)).astype('timedelta64[s]')
+        return Catalog.from_arrays(times, rng.uniform(region[0], region[1], n), rng.uniform(region[2], region[3], n),
+                                   rng.uniform(region[4], region[5], n), rng.uniform(1, 4, n), catname=catname,
+                                   bbox=bbox)
+    return _make
@@ -0,0 +1,28 @@
+import logging
+import datetime as dt
+from eq_catalogs import batch_plotting, plotting
+
+
+def _failing_plot(MyCat, outfile):
+    raise ValueError("cannot plot %d events" % len(MyCat))
+
+
+def test_failing_job_is_reported_without_stopping_the_others(tmp_path, make_catalog, caplog):
+    MyCat = make_catalog(n=300, seed=3)
+    subset = dict(starttime=dt.datetime(2010, 3, 1), Mc=2.0)
+    expected = int(MyCat.make_mask(**subset).sum())
+    jobs = [batch_plotting.PlotJob(subset, plotting.write_catalog_total_moments, str(tmp_path / 'subset.txt')),
+            batch_plotting.PlotJob(None, _failing_plot, str(tmp_path / 'failing.png')),
+            batch_plotting.PlotJob(None, plotting.write_catalog_total_moments, str(tmp_path / 'all.txt'))]
+    with caplog.at_level(logging.ERROR, logger='eq_catalogs'):
+        results = batch_plotting.run_plot_jobs(MyCat, jobs, n_workers=2, mp_context='fork')
+
+    assert [result.outfile for result in results] == [job.outfile for job in jobs]
+    assert [result.n_events for result in results] == [expected, 300, 300]
+    assert results[0].error is None and results[2].error is None
+    with open(results[0].outfile) as ifile:
+        assert ifile.readline().startswith("Total Moment from %d events" % expected)
+    assert 'ValueError: cannot plot 300 events' in results[1].error
+    assert not (tmp_path / 'failing.png').exists()
+    failures = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(failures) == 1 and failures[0].startswith('Failed: ' + jobs[1].outfile)
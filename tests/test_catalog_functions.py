@@ -0,0 +1,78 @@
+import datetime as dt
+import numpy as np
+import pytest
+from eq_catalogs import catalog_functions, file_io
+
+BBOX = [-117.0, -116.0, 33.0, 34.0, 0, 20, dt.datetime(2010, 1, 1), dt.datetime(2011, 1, 1)]
+
+
+def _keep_second(_event1, event2):
+    return event2
+
+
+def test_hstack_keeps_first_catalog_bbox(tmp_path, make_catalog):
+    Cat1 = make_catalog(50, catname='local', bbox=BBOX)
+    Cat2 = Cat1[::5]
+    combined = catalog_functions.combine_two_catalogs_hstack(Cat1, Cat2, _keep_second)
+    assert len(combined) == len(Cat1)
+    assert combined.bbox == BBOX
+    outfile = str(tmp_path / 'combined.txt')
+    file_io.write_simple_catalog_txt(combined, outfile)
+    with open(outfile) as ifile:
+        assert 'within -117.0/-116.0/33.0/34.0/0/20/20100101/20110101' in ifile.readline()
+
+
+def test_vstack_keeps_first_catalog_bbox(make_catalog):
+    Cat1, Cat2 = make_catalog(30, seed=1, catname='a', bbox=BBOX), make_catalog(20, seed=2, catname='b')
+    combined = catalog_functions.combine_two_catalogs_vstack(Cat1, Cat2)
+    assert len(combined) == 50
+    assert combined.bbox == BBOX
+    stacked = catalog_functions.combine_catalogs_vstack([Cat1, Cat2, Cat1], sort_by_time=True, time_tolerance=0)
+    assert len(stacked) == 50
+    assert stacked.bbox == BBOX
+    assert np.all(np.diff(stacked.dt.astype(np.int64)) >= 0)
+
+
+def _greedy_one_to_one(pair_i, pair_j, score, n1, n2):
+    used1, used2 = np.zeros(n1, dtype=bool), np.zeros(n2, dtype=bool)
+    idx1, idx2 = [], []
+    for k in np.argsort(score, kind='stable'):
+        i, j = pair_i[k], pair_j[k]
+        if not used1[i] and not used2[j]:
+            used1[i], used2[j] = True, True
+            idx1.append(i)
+            idx2.append(j)
+    order = np.argsort(idx1)
+    return np.array(idx1, dtype=np.int64)[order], np.array(idx2, dtype=np.int64)[order]
+
+
+def test_one_to_one_matches_greedy_loop():
+    rng = np.random.default_rng(4)
+    for n_pairs, n1, n2 in [(0, 5, 5), (200, 50, 40), (5000, 1000, 1200), (5000, 30, 30)]:
+        pair_i, pair_j = rng.integers(0, n1, n_pairs), rng.integers(0, n2, n_pairs)
+        score = rng.integers(0, 20, n_pairs) / 10.0  # with ties
+        for expected, result in zip(_greedy_one_to_one(pair_i, pair_j, score, n1, n2),
+                                    catalog_functions._one_to_one(pair_i, pair_j, score, n1, n2)):
+            np.testing.assert_array_equal(result, expected)
+    chain = np.arange(3000)  # pairs (k, k) and (k, k+1), best at the end of the chain: one pair per round
+    pair_i, pair_j = np.repeat(chain, 2), np.repeat(chain, 2) + np.tile([0, 1], len(chain))
+    score = -np.arange(len(pair_i), dtype=float)
+    for expected, result in zip(_greedy_one_to_one(pair_i, pair_j, score, 3000, 3001),
+                                catalog_functions._one_to_one(pair_i, pair_j, score, 3000, 3001)):
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_spatial_density_edge_cases(make_catalog):
+    bounds = [-117.0, -116.0, 33.0, 34.0, 0, 20]
+    MyCat = make_catalog(100)
+    empty = MyCat[np.zeros(len(MyCat), dtype=bool)]
+    _, _, density = catalog_functions.compute_spatial_density(empty, bounds, 0.5, 0.5, normalize='time')
+    np.testing.assert_array_equal(density, np.zeros((2, 2)))
+    with pytest.raises(ValueError, match='Cannot normalize by time'):
+        catalog_functions.compute_spatial_density(MyCat[0:1], bounds, 0.5, 0.5, normalize='area_time')
+    counts = catalog_functions.compute_spatial_density(MyCat, bounds, 0.5, 0.5)[2]
+    moments = catalog_functions.compute_spatial_density(MyCat, bounds, 0.5, 0.5, weighting='moment')[2]
+    MyCat.Mag = np.where(np.arange(len(MyCat)) == 0, np.nan, MyCat.Mag)
+    with_nan = catalog_functions.compute_spatial_density(MyCat, bounds, 0.5, 0.5, weighting='moment')[2]
+    assert np.all(np.isfinite(with_nan)) and np.all(with_nan <= moments) and np.sum(with_nan < moments) >= 1
+    np.testing.assert_array_equal(catalog_functions.compute_spatial_density(MyCat, bounds, 0.5, 0.5)[2], counts)
@@ -0,0 +1,20 @@
+import numpy as np
+
+REGION = (-118, -115, 32, 35, 0, 40)
+
+
+def test_box_without_depths(make_catalog):
+    MyCat = make_catalog(500, region=REGION)
+    result = MyCat.query().box([-117, -116, 33, 34]).collect()
+    expected = (MyCat.lon >= -117) & (MyCat.lon <= -116) & (MyCat.lat >= 33) & (MyCat.lat <= 34)
+    assert len(result) == np.count_nonzero(expected) > 0
+    np.testing.assert_array_equal(result.depth, MyCat.depth[expected])
+    assert result.bbox == [-117, -116, 33, 34]
+
+
+def test_box_with_depths(make_catalog):
+    MyCat = make_catalog(500, region=REGION)
+    result = MyCat.query().box([-117, -116, 33, 34, 0, 20]).collect()
+    expected = (MyCat.lon >= -117) & (MyCat.lon <= -116) & (MyCat.lat >= 33) & (MyCat.lat <= 34) & \
+        (MyCat.depth <= 20)
+    assert len(result) == np.count_nonzero(expected) > 0
@@ -0,0 +1,64 @@
+import logging
+import concurrent.futures
+import numpy as np
+from eq_catalogs import declustering
+from eq_catalogs.instrumentation import logger
+from eq_catalogs.synthetic import make_synthetic_catalog
+
+
+def _assert_same(result1, result2):
+    for field1, field2 in zip(result1, result2):
+        if field1 is not None or field2 is not None:
+            np.testing.assert_array_equal(field1, field2)
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_concurrent_runs_do_not_share_state():
+    catalogs = [make_synthetic_catalog(3000, seed=seed) for seed in range(4)]
+    methods = ['gardner_knopoff', 'reasenberg', 'nearest_neighbor', 'gardner_knopoff']
+    expected = [declustering.decluster(MyCat, method) for MyCat, method in zip(catalogs, methods)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(declustering.decluster, catalogs, methods))
+    for result, expected_result in zip(results, expected):
+        _assert_same(result, expected_result)
+    assert declustering._worker_state == {}
+
+
+def test_worker_processes_match_serial_run():
+    MyCat = make_synthetic_catalog(5000, seed=3)
+    for method in ('gardner_knopoff', 'reasenberg', 'nearest_neighbor'):
+        _assert_same(declustering.decluster(MyCat, method, n_workers=2, tilesize=1000),
+                     declustering.decluster(MyCat, method, tilesize=1000))
+
+
+def test_nearest_neighbor_candidate_cap():
+    MyCat = make_synthetic_catalog(4000, seed=5)
+    exact = declustering.nearest_neighbor(MyCat)
+    warnings = _Records()
+    logger.addHandler(warnings)
+    try:
+        _assert_same(declustering.nearest_neighbor(MyCat, max_candidates=1000), exact)
+        assert warnings.messages == []
+        capped = declustering.nearest_neighbor(MyCat, max_candidates=2)
+    finally:
+        logger.removeHandler(warnings)
+    assert len(warnings.messages) == 1 and 'max_candidates=2' in warnings.messages[0]
+    assert np.all(capped.eta >= exact.eta)
+    assert np.mean(capped.parent == exact.parent) > 0.9
+
+
+def test_nearest_neighbor_skips_events_without_magnitude():
+    MyCat = make_synthetic_catalog(2000, seed=6)
+    MyCat.Mag = np.where(np.arange(len(MyCat)) % 10 == 0, np.nan, MyCat.Mag)
+    for max_candidates in (16, None):
+        result = declustering.nearest_neighbor(MyCat, max_candidates=max_candidates)
+        parents = result.parent[result.parent >= 0]
+        assert not np.any(np.isnan(MyCat.Mag[parents]))
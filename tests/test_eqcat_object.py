@@ -0,0 +1,41 @@
+import datetime as dt
+import numpy as np
+import pytest
+from eq_catalogs.eqcat_object import Catalog_EQ
+
+
+def test_assigning_a_column_drops_cached_structures(make_catalog):
+    MyCat = make_catalog()
+    assert MyCat.is_time_sorted
+    _ = MyCat.spatial_index, MyCat.magnitude_order()
+    MyCat.dt = MyCat.dt[::-1].copy()
+    assert not MyCat.is_time_sorted
+    MyCat.Mag = np.arange(len(MyCat), dtype=float)
+    assert MyCat.magnitude_order()[0] == len(MyCat) - 1
+    MyCat.lon = MyCat.lon + 10.0
+    idx, _ = MyCat.spatial_index.query_knn(-106.5, 33.5, 3)
+    assert np.all(MyCat.lon[idx] > -108)
+
+
+def test_catalog_property_is_read_only(make_catalog):
+    MyCat = make_catalog(5)
+    events = MyCat.catalog
+    assert isinstance(events, tuple) and len(events) == 5
+    with pytest.raises(AttributeError):
+        MyCat.catalog.append(Catalog_EQ(dt=dt.datetime(2020, 1, 1), lon=0, lat=0, depth=0, Mag=1))
+
+
+def test_restrict_above_Mc_with_unestimable_Mc(make_catalog):
+    MyCat = make_catalog(3)
+    with pytest.raises(ValueError, match='Could not estimate Mc'):
+        MyCat.restrict_above_Mc('maxc')
+    assert len(MyCat.restrict_above_Mc(0.0)) == 3
+
+
+def test_negative_index_arrays(make_catalog):
+    MyCat = make_catalog(10)
+    for idx in (np.array([-2, -1]), [-2, -1], np.array([-3, -2])):
+        subset = MyCat[idx]
+        assert len(subset) == 2
+        np.testing.assert_array_equal(subset.Mag, MyCat.Mag[np.asarray(idx)])
+    assert np.shares_memory(MyCat[np.array([2, 3, 4])].Mag, MyCat.Mag)
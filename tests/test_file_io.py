@@ -0,0 +1,206 @@
+import datetime as dt
+import os
+import shutil
+import collections
+import numpy as np
+import pytest
+from eq_catalogs import file_io
+from eq_catalogs.eqcat_object import Catalog, Catalog_EQ
+
+
+QUAKEML = """<?xml version="1.0" encoding="UTF-8"?>
+<q:quakeml xmlns:q="http://quakeml.org/xmlns/quakeml/1.2" xmlns="http://quakeml.org/xmlns/bed/1.2">
+  <eventParameters>
+    <event publicID="event1">
+      <preferredOriginID>origin2</preferredOriginID>
+      <origin publicID="origin1">
+        <time><value>2019-07-06T03:19:53.040Z</value></time>
+        <latitude><value>0.0</value></latitude><longitude><value>0.0</value></longitude>
+        <depth><value>0</value></depth>
+      </origin>
+      <origin publicID="origin2">
+        <time><value>2019-07-06T03:19:53.040Z</value></time>
+        <latitude><value>35.77</value></latitude><longitude><value>-117.60</value></longitude>
+        <depth><value>8000</value></depth>
+      </origin>
+      <magnitude publicID="mag1"><mag><value>%s</value></mag></magnitude>
+      <focalMechanism publicID="fm1">
+        <nodalPlanes>
+          <nodalPlane1><strike><value>321</value></strike><dip><value>81</value></dip><rake><value>-173</value></rake>
+          </nodalPlane1>
+          <nodalPlane2><strike><value>230</value></strike><dip><value>83</value></dip><rake><value>-9</value></rake>
+          </nodalPlane2>
+        </nodalPlanes>
+        <momentTensor><tensor><Mrr><value>1.0e19</value></Mrr><Mtt><value>-2.0e19</value></Mtt></tensor>
+        </momentTensor>
+      </focalMechanism>
+    </event>
+  </eventParameters>
+</q:quakeml>
+"""
+
+
+def _write_quakeml(filename, magnitude=7.1):
+    with open(filename, 'w') as ofile:
+        ofile.write(QUAKEML % magnitude)
+    return str(filename)
+
+
+def _catalog():
+    return Catalog([Catalog_EQ(dt=dt.datetime(2020, 1, 1, 12, 30, 5), lon=-116.5, lat=33.5, depth=5.0, Mag=2.5),
+                    Catalog_EQ(dt=None, lon=-116.4, lat=33.6, depth=6.0, Mag=3.0)])
+
+
+def test_writers_accept_pathlib_paths(tmp_path):
+    MyCat = _catalog()
+    file_io.write_simple_catalog_txt(MyCat, tmp_path / 'cat.txt')
+    file_io.write_simple_catalog_txt(MyCat, tmp_path / 'cat.txt.gz')
+    file_io.write_simple_catalog_txt(MyCat, tmp_path / 'cat.npy', binary=True)
+    file_io.write_binary_catalog(MyCat, tmp_path / 'cat_binary')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['cat.npy', 'cat.txt', 'cat.txt.gz', 'cat_binary']
+    assert len(file_io.read_binary_catalog(tmp_path / 'cat_binary')) == 2
+
+
+def test_missing_times_are_written_as_nat(tmp_path):
+    outfile = str(tmp_path / 'cat.txt')
+    file_io.write_simple_catalog_txt(_catalog(), outfile)
+    with open(outfile) as ifile:
+        lines = ifile.readlines()
+    assert lines[2].split()[0] == '2020-01-01-12-30-05'
+    assert lines[3].split()[0] == 'NaT'
+    MyCat = file_io.read_simple_catalog_txt(outfile)
+    assert MyCat[0].dt == dt.datetime(2020, 1, 1, 12, 30, 5)
+    assert MyCat[1].dt is None and np.isnat(MyCat.dt[1])
+
+
+def test_sniff_format_with_blank_first_line(tmp_path):
+    infile = tmp_path / 'blank_first_line.txt'
+    infile.write_text('\n' + ' '.join(['1'] * 12) + '\n')
+    with pytest.raises(ValueError, match='Could not recognize'):
+        file_io.sniff_format(str(infile))
+
+
+def test_read_cached_keys_on_reader_options(tmp_path):
+    infile = str(tmp_path / 'fms.intxt')
+    file_io.write_intxt_fms(Catalog([Catalog_EQ(dt=None, lon=-116.5, lat=33.5, depth=5.0, Mag=2.5, strike=10,
+                                                dip=80, rake=0)]), infile)
+    cache_dir = str(tmp_path / 'cache')
+    first = file_io.read_cached(file_io.read_intxt_fms, infile, cache_dir=cache_dir, catname='first')
+    second = file_io.read_cached(file_io.read_intxt_fms, infile, cache_dir=cache_dir, catname='second')
+    assert first.catname_categories == ('first',)
+    assert second.catname_categories == ('second',)
+    assert file_io.read_cached(file_io.read_intxt_fms, infile, cache_dir=cache_dir,
+                               catname='first').catname_categories == ('first',)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_quakeml_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_io, 'QUAKEML_CACHE_SIZE', 2)
+    monkeypatch.setattr(file_io, '_quakeml_cache', collections.OrderedDict())
+    filenames = [_write_quakeml(tmp_path / ('event%d.xml' % i), 5.0 + i) for i in range(3)]
+    file_io.parse_quakeml_files(filenames[0:2])
+    file_io.parse_quakeml_files(filenames[0:1])  # event0 is now more recent than event1
+    file_io.parse_quakeml_files(filenames[2:3])
+    assert list(file_io._quakeml_cache) == [os.path.abspath(filenames[0]), os.path.abspath(filenames[2])]
+    assert file_io.read_quakeml(filenames).Mag.tolist() == [5.0, 6.0, 7.0]
+    assert len(file_io._quakeml_cache) == 2
+
+
+def test_streams_closed_early_close_their_file(tmp_path, monkeypatch):
+    infile = tmp_path / 'scsn.txt'
+    infile.write_text(''.join('2019/07/%02d 03:19:53.04 eq l 2.%d w 35.770 -117.599 8.0 A 38457511 47 1234\n' % (d, d)
+                              for d in range(1, 6)))
+    opened = []
+
+    def _open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(file_io, 'open', _open, raising=False)
+    chunks = file_io.stream_scsn_txt(str(infile), chunksize=2)
+    assert len(next(chunks)) == 2
+    assert not opened[0].closed
+    chunks.close()
+    assert opened[0].closed
+
+
+_reads = []
+
+
+def _counting_qtm_reader(filename):
+    _reads.append(filename)
+    return file_io.input_qtm(filename)
+
+
+def test_read_cached_hit_invalidate_and_prune(tmp_path):
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'qtm_sample.txt')
+    infile1, infile2 = str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')
+    shutil.copy(sample, infile1)
+    shutil.copy(sample, infile2)
+    cache_dir = str(tmp_path / 'cache')
+    del _reads[:]
+    parsed = file_io.read_cached(_counting_qtm_reader, infile1, cache_dir=cache_dir)
+    cached = file_io.read_cached(_counting_qtm_reader, infile1, cache_dir=cache_dir)
+    assert _reads == [infile1]
+    assert isinstance(cached.Mag.base, np.memmap) and not cached.Mag.flags.writeable  # memory-mapped, read-only
+    np.testing.assert_array_equal(cached.dt, parsed.dt)
+    np.testing.assert_array_equal(cached.Mag, parsed.Mag)
+
+    with open(infile1, 'a') as ofile:  # a changed file is parsed again, under a new key
+        ofile.write('2016 01 01 00 00 00.000 60 33.5 -116.5 5.0 1.00 0 0\n')
+    assert len(file_io.read_cached(_counting_qtm_reader, infile1, cache_dir=cache_dir)) == len(parsed) + 1
+    assert _reads == [infile1, infile1]
+    assert file_io.invalidate_cache(infile1, cache_dir=cache_dir) == 2
+    assert os.listdir(cache_dir) == []
+
+    file_io.read_cached(_counting_qtm_reader, infile1, cache_dir=cache_dir)
+    file_io.read_cached(_counting_qtm_reader, infile2, cache_dir=cache_dir)
+    entries = {}
+    for name in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, name, 'source.txt')) as ifile:
+            entries[os.path.join(cache_dir, name)] = ifile.read().strip()
+    for entry, source in entries.items():  # entry 1 was used long ago
+        if source == infile1:
+            os.utime(os.path.join(entry, 'header.json'), (1e9, 1e9))
+    entry_size = max(sum(os.path.getsize(os.path.join(entry, x)) for x in os.listdir(entry)) for entry in entries)
+    file_io.prune_cache(cache_dir, max_cache_bytes=entry_size)
+    assert [entries[os.path.join(cache_dir, x)] for x in os.listdir(cache_dir)] == [infile2]
+
+
+def test_streams_apply_pushdown_filters_per_chunk():
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'qtm_sample.txt')
+    filters = dict(bbox=[-117.0, -116.0, 33.0, 34.0, 0.0, 20.0], starttime=dt.datetime(2015, 1, 7), Mc=0.5)
+    full = file_io.input_qtm(sample)
+    expected = full[full.make_mask(**filters)]
+    assert 0 < len(expected) < len(full)
+    chunks = list(file_io.stream_qtm(sample, chunksize=7, **filters))
+    assert len(chunks) == -(-len(full) // 7)
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    for column in ('dt', 'lon', 'lat', 'depth', 'Mag'):
+        streamed = np.concatenate([getattr(chunk, column) for chunk in chunks])
+        np.testing.assert_array_equal(streamed, getattr(expected, column))
+    unfiltered = list(file_io.stream_qtm(sample, chunksize=7))
+    assert sum(len(chunk) for chunk in unfiltered) == len(full)
+
+
+def test_quakeml_parsing_and_mtime_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_io, '_quakeml_cache', collections.OrderedDict())
+    filename = _write_quakeml(tmp_path / 'event.xml', 7.1)
+    MyCat = file_io.read_quakeml(filename)
+    assert len(MyCat) == 1
+    assert MyCat[0].dt == dt.datetime(2019, 7, 6, 3, 19, 53, 40000)
+    assert (MyCat[0].lon, MyCat[0].lat, MyCat[0].depth, MyCat[0].Mag) == (-117.60, 35.77, 8.0, 7.1)
+    assert (MyCat[0].strike, MyCat[0].dip, MyCat[0].rake) == (321, 81, -173)
+    second_plane = file_io.read_quakeml(filename, nodal_plane=2)[0]
+    assert (second_plane.strike, second_plane.dip, second_plane.rake) == (230, 83, -9)
+    assert file_io.read_usgs_query_xml_into_MT(filename) == [1.0e19, -2.0e19, 0, 0, 0, 0,
+                                                             321, 81, -173, 230, 83, -9]
+
+    first = file_io.parse_quakeml_files([filename])[filename]
+    assert file_io.parse_quakeml_files([filename])[filename] is first  # unchanged file: served from the cache
+    stat = os.stat(filename)
+    _write_quakeml(filename, 6.45)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reparsed = file_io.parse_quakeml_files([filename])[filename]
+    assert reparsed is not first
+    assert reparsed[0]['Mag'] == 6.45
+    assert file_io.read_quakeml(filename).Mag.tolist() == [6.45]
@@ -0,0 +1,44 @@
+import logging
+import threading
+from eq_catalogs import instrumentation
+from eq_catalogs.instrumentation import logger, timed
+
+
+@timed()
+def _outer(n):
+    return _inner(n) + 1
+
+
+@timed()
+def _inner(n):
+    return n
+
+
+def test_messages_reach_the_application_handlers(caplog):
+    assert logger.propagate
+    assert all(isinstance(handler, logging.NullHandler) for handler in logger.handlers)
+    with caplog.at_level(logging.INFO, logger='eq_catalogs'):
+        logger.info("hello from eq_catalogs")
+    assert caplog.messages == ["hello from eq_catalogs"]
+
+
+def test_threads_collect_their_own_metrics():
+    barrier = threading.Barrier(4)
+    results = {}
+
+    def _run(n):
+        with instrumentation.collect_metrics() as metrics:
+            barrier.wait()
+            for _ in range(n):
+                _outer(n)
+            barrier.wait()
+        results[n] = metrics.records
+
+    threads = [threading.Thread(target=_run, args=(n,)) for n in (1, 2, 3, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for n, records in results.items():
+        assert [(record.name, record.depth) for record in records] == [('_inner', 1), ('_outer', 0)] * n
+    assert instrumentation._active.get() is None and instrumentation._depth.get() == 0
@@ -0,0 +1,17 @@
+import numpy as np
+from eq_catalogs import magnitude_statistics
+from eq_catalogs.synthetic import make_synthetic_catalog
+
+
+def test_map_gutenberg_richter_workers_match_serial_run():
+    MyCat = make_synthetic_catalog(5000, seed=2)
+    lons, lats = np.meshgrid(np.linspace(-120, -115, 4), np.linspace(33, 36, 3))
+    serial, serial_radii = magnitude_statistics.map_gutenberg_richter(MyCat, lons.ravel(), lats.ravel(), n_nearest=300,
+                                                                      n_bootstrap=5, n_workers=None)
+    pooled, pooled_radii = magnitude_statistics.map_gutenberg_richter(MyCat, lons.ravel(), lats.ravel(), n_nearest=300,
+                                                                      n_bootstrap=5, n_workers=1)
+    np.testing.assert_array_equal(serial_radii, pooled_radii)
+    for field1, field2 in zip(serial, pooled):
+        np.testing.assert_array_equal(field1, field2)
+    assert np.count_nonzero(~np.isnan(serial.b)) > 0
+    assert magnitude_statistics._worker_state == {}
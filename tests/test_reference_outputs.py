@@ -0,0 +1,81 @@
+"""
+Regression tests against small stored reference outputs.  The inputs in tests/data (qtm_sample.txt and
+shearer_sample.txt: synthetic catalogs with events on grid edges, a leap minute, a leap second, and an hour of -1)
+were run through the original per-event implementations, whose outputs are stored next to them.
+"""
+
+import os
+import gzip
+import json
+import datetime as dt
+import numpy as np
+from eq_catalogs import file_io, catalog_functions
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BOUNDS = [-117.0, -116.0, 33.0, 34.0, 0, 20]
+
+
+def _data(name):
+    return os.path.join(DATA, name)
+
+
+def _read_bytes(filename):
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as ifile:
+        return ifile.read()
+
+
+def test_spatial_density_matches_reference():
+    MyCat = file_io.input_qtm(_data('qtm_sample.txt'))
+    expected = np.loadtxt(_data('qtm_sample.density.txt'))
+    _, _, density = catalog_functions.compute_spatial_density(MyCat, BOUNDS, 0.25, 0.25)
+    np.testing.assert_array_equal(density, expected)
+    chunks = [MyCat[start:start + 7] for start in range(0, len(MyCat), 7)]
+    _, _, density = catalog_functions.compute_spatial_density(chunks, BOUNDS, 0.25, 0.25, chunksize=5)
+    np.testing.assert_array_equal(density, expected)
+
+
+def _events(MyCat):
+    return [[t.isoformat(), mag] for t, mag in zip(MyCat.dt.astype(object), MyCat.Mag.tolist())]
+
+
+def _isoformat(times):
+    return [t.isoformat() for t in np.asarray(times, dtype='datetime64[us]').astype(object)]
+
+
+def test_time_functions_match_reference():
+    with open(_data('qtm_sample.reference.json')) as ifile:
+        reference = json.load(ifile)
+    MyCat = file_io.input_qtm(_data('qtm_sample.txt'))
+    assert _events(MyCat.restrict_cat_times(dt.datetime(2015, 3, 1), dt.datetime(2015, 9, 1))) == \
+        reference['restrict_cat_times']
+    assert _events(MyCat.restrict_cat_box([-117.0, -116.5, 33.0, 33.5, 0, 20])) == reference['restrict_cat_box']
+    assert _events(MyCat.restrict_above_Mc(1.0)) == reference['restrict_above_Mc']
+    for name, (times, values) in [('rates', MyCat.make_simple_seismicity_rates(window=5)),
+                                  ('cumulative_stack', MyCat.make_cumulative_stack()),
+                                  ('cumulative_moment', MyCat.make_cumulative_moment())]:
+        assert _isoformat(times) == reference[name][0], name
+        np.testing.assert_allclose(values, reference[name][1], rtol=1e-12, err_msg=name)
+    np.testing.assert_allclose(MyCat.compute_total_moment(), reference['total_moment'], rtol=1e-12)
+
+
+def test_readers_match_reference(tmp_path):
+    for MyCat, expected in [(file_io.input_qtm(_data('qtm_sample.txt')), 'qtm_sample.simple.txt'),
+                            (file_io.input_qtm(_data('qtm_sample.txt'), n_workers=2), 'qtm_sample.simple.txt'),
+                            (file_io.input_shearer_cat(_data('shearer_sample.txt')), 'shearer_sample.simple.txt')]:
+        outfile = str(tmp_path / expected)
+        file_io.write_simple_catalog_txt(MyCat, outfile)
+        assert _read_bytes(outfile) == _read_bytes(_data(expected))
+
+
+def test_writers_match_reference(tmp_path):
+    MyCat = file_io.input_qtm(_data('qtm_sample.txt')).restrict_cat_box([-117.0, -116.5, 33.0, 33.5, 0, 20])
+    i = np.arange(len(MyCat))
+    MyCat.strike, MyCat.dip, MyCat.rake = (i * 37 % 360).astype(float), (30 + i % 60).astype(float), \
+        (-90 + i * 13 % 180).astype(float)
+    for writer, expected in [(file_io.write_simple_catalog_txt, 'box_sample.simple.txt'),
+                             (file_io.write_location_catalog_txt, 'box_sample.location.txt'),
+                             (file_io.write_intxt_fms, 'box_sample.intxt')]:
+        for outfile in (str(tmp_path / expected), str(tmp_path / expected) + '.gz'):
+            writer(MyCat, outfile)
+            assert _read_bytes(outfile) == _read_bytes(_data(expected)), outfile
@@ -0,0 +1,29 @@
+import numpy as np
+from eq_catalogs.spatial_index import GridIndex, haversine_km
+
+
+def _dateline_index():
+    rng = np.random.default_rng(0)
+    lon = np.concatenate([[179.9, -179.9], rng.uniform(-180, 180, 2000)])
+    lat = np.concatenate([[10.0, 10.0], rng.uniform(-60, 60, 2000)])
+    return GridIndex(lon, lat), lon, lat
+
+
+def test_query_radius_wraps_at_dateline():
+    index, lon, lat = _dateline_index()
+    for lon0 in (179.9, -179.9):
+        idx, distances = index.query_radius(lon0, 10.0, 50.0)
+        expected = np.flatnonzero(haversine_km(lon0, 10.0, lon, lat) <= 50.0)
+        assert {0, 1} <= set(idx.tolist())
+        np.testing.assert_array_equal(idx, expected)
+        np.testing.assert_allclose(distances, haversine_km(lon0, 10.0, lon[idx], lat[idx]))
+
+
+def test_query_knn_wraps_at_dateline():
+    index, lon, lat = _dateline_index()
+    idx, distances = index.query_knn(179.9, 10.0, 2)
+    assert idx.tolist() == [0, 1]
+    assert distances[1] < 25.0
+    for lon0, lat0 in [(-179.95, 11.0), (179.5, -40.0), (0.0, 0.0)]:
+        idx, _ = index.query_knn(lon0, lat0, 5)
+        np.testing.assert_array_equal(idx, np.argsort(haversine_km(lon0, lat0, lon, lat), kind='stable')[:5])